@@ -1,6 +1,10 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from models import Evaluation, Question, Attempt, AttemptAnswer
-from sqlalchemy import func
+from models import Evaluation, Attempt, AttemptAnswer, AttemptAnswerMask
+from answer_keys import get_answer_key
+from answer_storage import MAX_BIT, compact_storage
+from stats import histogram_distribution, summary_stats
+import numpy as np
 import pandas as pd
 
 
@@ -9,97 +13,104 @@ def generar_analitica(evaluation_id: int, db: Session):
     if not ev:
         return {"error": "Evaluación no encontrada"}
 
-    # === obtener preguntas ===
-    qs = db.query(Question).filter(Question.evaluation_id == evaluation_id).all()
-    if not qs:
+    # === obtener preguntas (clave precompilada en caché) ===
+    key = get_answer_key(db, evaluation_id)
+    if not key.question_ids:
         return {"error": "No hay preguntas registradas"}
 
-    # === obtener intentos y respuestas ===
-    attempts = db.query(Attempt).filter(Attempt.evaluation_id == evaluation_id).all()
-    answers = db.query(AttemptAnswer).join(Attempt).filter(Attempt.evaluation_id == evaluation_id).all()
+    # === Ruta rápida: resúmenes plegados más los envíos aún sin plegar ===
+    resumen = summary_stats(db, evaluation_id, key)
+    if resumen is not None:
+        return {"evaluation_title": ev.title, "teacher_name": ev.teacher_name, **resumen}
 
-    if not attempts or not answers:
-        return {"error": "No hay datos suficientes para análisis"}
+    return calcular_analitica(ev, key, db)
 
-    # Convertir a DataFrames para pandas
-    df_attempts = pd.DataFrame([{
-        "attempt_id": a.id,
-        "student_name": a.student_name,
-        "score": a.score
-    } for a in attempts])
-
-    df_answers = pd.DataFrame([{
-        "attempt_id": ans.attempt_id,
-        "question_id": ans.question_id,
-        "selected_index": ans.selected_index
-    } for ans in answers])
-
-    df_questions = pd.DataFrame([{
-        "question_id": q.id,
-        "text": q.text,
-        "options": q.options_joined.split("||"),
-        "correct_index": q.correct_index
-    } for q in qs])
-
-    # === Normalizar correct_index ===
-    def normalize_correct(x):
-        if isinstance(x, str):
-            return [int(i) for i in x.split(",") if i.strip().isdigit()]
-        elif isinstance(x, list):
-            # Aplana si es [[1,2]]
-            flat = []
-            for e in x:
-                if isinstance(e, list):
-                    flat.extend(e)
-                else:
-                    flat.append(int(e))
-            return flat
-        elif x is None:
-            return []
-        else:
-            return [int(x)]
 
-    df_questions["correct_index"] = df_questions["correct_index"].apply(normalize_correct)
+# DataFrame a partir de las tuplas de un select Core (por la conexión, sin
+# pasar por la capa de carga del ORM)
+def _frame(db: Session, stmt):
+    result = db.connection().execute(stmt)
+    return pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
 
-    # === Calcular precisión por pregunta ===
-    per_question_stats = []
-    for _, qrow in df_questions.iterrows():
-        qid = qrow["question_id"]
-        correct_indices = set(qrow["correct_index"])
 
-        # Respuestas asociadas a esa pregunta
-        df_q = df_answers[df_answers["question_id"] == qid]
+# === Pipeline vectorizado sobre los datos crudos ===
+def calcular_analitica(ev, key, db: Session):
+    # Columnas cargadas directamente desde un select Core, sin objetos ORM
+    df_attempts = _frame(db, select(Attempt.id.label("attempt_id"), Attempt.score).where(Attempt.evaluation_id == ev.id))
+    if df_attempts.empty:
+        return {"error": "No hay datos suficientes para análisis"}
+    # None si ningún intento marcó opciones: todas las preguntas quedan en 0
+    por_pregunta = _correct_by_question(db, ev, key)
 
-        total_respuestas = len(df_q["attempt_id"].unique())
-        if total_respuestas == 0:
-            accuracy = 0.0
-        else:
-            # Agrupar las respuestas por intento (para comparar conjunto completo)
-            correctas = 0
-            for attempt_id, group in df_q.groupby("attempt_id"):
-                seleccionadas = set(group["selected_index"].tolist())
-                if seleccionadas == correct_indices:
-                    correctas += 1
+    per_question_stats = []
+    for qid, text in zip(key.question_ids, key.texts):
+        if por_pregunta is not None and qid in por_pregunta.index:
+            total_respuestas = int(por_pregunta.at[qid, "size"])
+            correctas = int(por_pregunta.at[qid, "sum"])
             accuracy = round((correctas / total_respuestas) * 100, 2)
-
+        else:
+            accuracy = 0.0
         per_question_stats.append({
             "question_id": qid,
-            "text": qrow["text"],
+            "text": text,
             "accuracy_pct": accuracy
         })
 
-    # === estadísticas generales ===
+    # === estadísticas generales (mismas claves que la ruta de resúmenes) ===
+    scores = df_attempts["score"]
     total_attempts = len(df_attempts)
-    avg_score = float(df_attempts["score"].mean()) if total_attempts > 0 else 0.0
-    max_score = int(df_attempts["score"].max()) if total_attempts > 0 else 0
-    min_score = int(df_attempts["score"].min()) if total_attempts > 0 else 0
+    histogram = sorted((int(score), int(n)) for score, n in scores.value_counts().items())
 
     return {
         "evaluation_title": ev.title,
         "teacher_name": ev.teacher_name,
         "total_attempts": total_attempts,
-        "avg_score": round(avg_score, 2),
-        "max_score": max_score,
-        "min_score": min_score,
+        "avg_score": round(float(scores.mean()), 2),
+        "max_score": int(scores.max()),
+        "min_score": int(scores.min()),
+        **histogram_distribution(histogram, len(key)),
         "per_question_accuracy": per_question_stats
     }
+
+
+# Respondidas ("size") y correctas ("sum") por pregunta; None si no hay
+# respuestas
+def _correct_by_question(db: Session, ev, key):
+    if compact_storage():
+        df_masks = _frame(
+            db,
+            select(AttemptAnswerMask.question_id, AttemptAnswerMask.is_correct.label("correct"))
+            .join(Attempt, Attempt.id == AttemptAnswerMask.attempt_id)
+            .where(Attempt.evaluation_id == ev.id),
+        )
+        if df_masks.empty:
+            return None
+        return df_masks.groupby("question_id")["correct"].agg(["size", "sum"])
+
+    df_answers = _frame(
+        db,
+        select(AttemptAnswer.attempt_id, AttemptAnswer.question_id, AttemptAnswer.selected_index)
+        .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+        .where(Attempt.evaluation_id == ev.id),
+    )
+    if df_answers.empty:
+        return None
+
+    # === Bitmask de la selección de cada intento en cada pregunta ===
+    df_answers = df_answers.drop_duplicates()
+    sel = df_answers["selected_index"].to_numpy(dtype=np.int64)
+    # Índices fuera de [0, MAX_BIT) no caben en el bitmask: la respuesta es
+    # inválida y cuenta como incorrecta
+    invalid = (sel < 0) | (sel >= MAX_BIT)
+    df_answers["bit"] = np.where(invalid, 0, np.left_shift(1, np.clip(sel, 0, MAX_BIT - 1)))
+    df_answers["invalid"] = invalid
+
+    masks = df_answers.groupby(["question_id", "attempt_id"], sort=False).agg(
+        mask=("bit", "sum"), invalid=("invalid", "any")
+    )
+
+    # === Precisión por pregunta: una sola comparación contra la clave ===
+    key_masks = pd.Series(key.masks, index=pd.Index(key.question_ids, name="question_id"), dtype=np.int64)
+    expected = key_masks.reindex(masks.index.get_level_values("question_id")).to_numpy()
+    masks["correct"] = (masks["mask"].to_numpy() == expected) & ~masks["invalid"].to_numpy()
+    return masks.groupby(level="question_id")["correct"].agg(["size", "sum"])
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import Session
+
+from answer_storage import MAX_BIT, selection_mask
+from models import ExamSnapshot, Question
+
+# Número máximo de evaluaciones con clave en memoria (LRU) y vida máxima de
+# cada entrada: la invalidación es local al proceso, el TTL acota cuánto puede
+# tardar otro worker en ver una pregunta nueva.
+ANSWER_KEY_CACHE_SIZE = int(os.getenv("ANSWER_KEY_CACHE_SIZE", "512"))
+ANSWER_KEY_TTL_SECONDS = float(os.getenv("ANSWER_KEY_TTL_SECONDS", "300"))
+
+
+# === Normalizar correct_index ===
+# Acepta string tipo "1,2", lista de ints, lista anidada [[1, 2]] o número.
+def normalize_correct(correct_raw) -> frozenset:
+    if isinstance(correct_raw, str):
+        return frozenset(int(x) for x in correct_raw.split(",") if x.strip().isdigit())
+    if isinstance(correct_raw, list):
+        flat = set()
+        for c in correct_raw:
+            if isinstance(c, list):
+                flat.update(int(x) for x in c)
+            else:
+                flat.add(int(c))
+        return frozenset(flat)
+    if correct_raw is None:
+        return frozenset()
+    return frozenset([int(correct_raw)])
+
+
+# Bitmask de un conjunto de índices de opción (bit i = opción i marcada), con
+# el mismo rango que las selecciones (answer_storage.selection_mask). Una
+# clave con un índice fuera de [0, MAX_BIT) no es representable: -1 no
+# coincide con ningún bitmask de selección, igual que una selección con un
+# índice fuera de rango nunca se califica como correcta.
+def to_mask(indices) -> int:
+    if any(not 0 <= int(i) < MAX_BIT for i in indices):
+        return -1
+    return selection_mask(indices)
+
+
+# Clave precompilada de una evaluación: preguntas en orden de id con sus
+# respuestas correctas como frozenset y como bitmask. `version` es la del
+# snapshot de examen leída junto con las preguntas (None si aún no existe).
+class AnswerKey:
+    __slots__ = ("evaluation_id", "question_ids", "texts", "option_counts", "correct", "masks", "positions", "version")
+
+    def __init__(self, evaluation_id, question_ids, texts, option_counts, correct, version=None):
+        self.evaluation_id = evaluation_id
+        self.question_ids = tuple(question_ids)
+        self.texts = tuple(texts)
+        self.option_counts = tuple(option_counts)
+        self.correct = tuple(correct)
+        self.masks = tuple(to_mask(c) for c in self.correct)
+        self.positions = {qid: i for i, qid in enumerate(self.question_ids)}
+        self.version = version
+
+    def __len__(self):
+        return len(self.question_ids)
+
+    def correct_for(self, question_id):
+        pos = self.positions.get(question_id)
+        return None if pos is None else self.correct[pos]
+
+    # Califica una lista de selecciones (una por pregunta, en orden de id) y
+    # devuelve, por pregunta, si la selección coincide exactamente con la clave
+    def grade_detail(self, answers) -> tuple:
+        flags = []
+        for correct, selected in zip(self.correct, answers):
+            if not isinstance(selected, list):
+                selected = [selected]
+            flags.append(set(map(int, selected)) == correct)
+        return tuple(flags)
+
+    def grade(self, answers) -> int:
+        return sum(self.grade_detail(answers))
+
+
+def load_answer_key(db: Session, evaluation_id: int) -> AnswerKey:
+    rows = (
+        db.query(Question.id, Question.text, Question.options_joined, Question.correct_index)
+        .filter(Question.evaluation_id == evaluation_id)
+        .order_by(Question.id)
+        .all()
+    )
+    return AnswerKey(
+        evaluation_id,
+        [r.id for r in rows],
+        [r.text for r in rows],
+        [len(r.options_joined.split("||")) for r in rows],
+        [normalize_correct(r.correct_index) for r in rows],
+        db.query(ExamSnapshot.version).filter(ExamSnapshot.evaluation_id == evaluation_id).scalar(),
+    )
+
+
+class AnswerKeyCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, evaluation_id: int) -> AnswerKey:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(evaluation_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(evaluation_id)
+                return entry[1]
+            generation = self._generations.get(evaluation_id, 0)
+
+        # La carga se hace fuera del lock; si hubo una invalidación mientras
+        # tanto, la clave cargada se devuelve pero no se guarda.
+        key = load_answer_key(db, evaluation_id)
+        with self._lock:
+            if self._generations.get(evaluation_id, 0) == generation:
+                self._entries[evaluation_id] = (now + self.ttl, key)
+                self._entries.move_to_end(evaluation_id)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return key
+
+    def invalidate(self, evaluation_id: int):
+        with self._lock:
+            self._entries.pop(evaluation_id, None)
+            self._generations[evaluation_id] = self._generations.get(evaluation_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            for evaluation_id in self._entries:
+                self._generations[evaluation_id] = self._generations.get(evaluation_id, 0) + 1
+            self._entries.clear()
+
+
+answer_key_cache = AnswerKeyCache(ANSWER_KEY_CACHE_SIZE, ANSWER_KEY_TTL_SECONDS)
+
+
+def get_answer_key(db: Session, evaluation_id: int) -> AnswerKey:
+    return answer_key_cache.get(db, evaluation_id)
+
+
+def invalidate_answer_key(evaluation_id: int):
+    answer_key_cache.invalidate(evaluation_id)
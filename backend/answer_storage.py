@@ -0,0 +1,107 @@
+import os
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from models import Attempt, AttemptAnswer, AttemptAnswerMask
+
+# "rows" (por defecto): una fila de attempt_answers por opción marcada.
+# "compact": una fila de attempt_answer_masks por pregunta respondida, con la
+# selección como bitmask y la corrección calculada al calificar.
+ANSWER_STORAGE = os.getenv("ANSWER_STORAGE", "rows").lower()
+# Intentos por lote al migrar respuestas al formato compacto
+COMPACT_BATCH_SIZE = 1000
+
+# Bits utilizables del bitmask BIGINT (opciones 0..61); un índice fuera de ese
+# rango no se puede representar y solo queda reflejado en is_correct. Es el
+# límite de todos los bitmasks de selección (claves, analítica, ítems).
+MAX_BIT = 62
+
+
+def compact_storage() -> bool:
+    return ANSWER_STORAGE == "compact"
+
+
+def selection_mask(selected) -> int:
+    mask = 0
+    for i in selected:
+        i = int(i)
+        if 0 <= i < MAX_BIT:
+            mask |= 1 << i
+    return mask
+
+
+def mask_indices(mask: int) -> list:
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+# === Escritura de las respuestas de intentos ya calificados ===
+# Solo se guardan preguntas con al menos una opción marcada, igual en ambos
+# formatos: que exista la fila significa "respondida".
+def write_answers(db: Session, attempt_ids, graded):
+    if compact_storage():
+        rows = [
+            {"attempt_id": attempt_id, "question_id": qid, "selected_mask": selection_mask(selected), "is_correct": bool(ok)}
+            for attempt_id, g in zip(attempt_ids, graded)
+            for qid, selected, ok in zip(g.question_ids, g.answers, g.correct)
+            if selected
+        ]
+        table = AttemptAnswerMask
+    else:
+        rows = [
+            {"attempt_id": attempt_id, "question_id": qid, "selected_index": int(sel)}
+            for attempt_id, g in zip(attempt_ids, graded)
+            for qid, selected_list in zip(g.question_ids, g.answers)
+            for sel in selected_list
+        ]
+        table = AttemptAnswer
+    if rows:
+        db.execute(insert(table), rows)
+
+
+# === Migración attempt_answers -> attempt_answer_masks ===
+# Recalcula bitmask y corrección contra la clave actual, por lotes de
+# intentos. Es idempotente: reemplaza las filas compactas de la evaluación.
+# Con drop_rows borra después las filas originales. No hace commit.
+def compact_evaluation(db: Session, evaluation_id: int, drop_rows: bool = False) -> int:
+    from answer_keys import load_answer_key  # answer_keys importa este módulo
+
+    key = load_answer_key(db, evaluation_id)
+    attempt_ids = db.scalars(
+        select(Attempt.id).where(Attempt.evaluation_id == evaluation_id).order_by(Attempt.id)
+    ).all()
+
+    for start in range(0, len(attempt_ids), COMPACT_BATCH_SIZE):
+        first, last = attempt_ids[start], attempt_ids[min(start + COMPACT_BATCH_SIZE, len(attempt_ids)) - 1]
+        # Los ids de otras evaluaciones pueden intercalarse en el rango
+        batch_ids = select(Attempt.id).where(Attempt.evaluation_id == evaluation_id, Attempt.id.between(first, last))
+        db.execute(delete(AttemptAnswerMask).where(AttemptAnswerMask.attempt_id.in_(batch_ids)))
+
+        selections = {}
+        for attempt_id, question_id, selected_index in db.execute(
+            select(AttemptAnswer.attempt_id, AttemptAnswer.question_id, AttemptAnswer.selected_index)
+            .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+            .where(Attempt.evaluation_id == evaluation_id, Attempt.id.between(first, last))
+        ):
+            selections.setdefault((attempt_id, question_id), set()).add(selected_index)
+
+        rows = [
+            {
+                "attempt_id": attempt_id,
+                "question_id": question_id,
+                "selected_mask": selection_mask(selected),
+                "is_correct": selected == key.correct_for(question_id),
+            }
+            for (attempt_id, question_id), selected in selections.items()
+        ]
+        if rows:
+            db.execute(insert(AttemptAnswerMask), rows)
+        if drop_rows:
+            db.execute(delete(AttemptAnswer).where(AttemptAnswer.attempt_id.in_(batch_ids)))
+
+    return len(attempt_ids)
@@ -2,16 +2,25 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
-from database import get_db
+from database import SessionLocal, get_session, run_db
 from models import User
 from schemas import UserCreate, Token
-from utils import hash_password, verify_password
+from utils import HashingOverloaded, hash_password_async, verify_and_update_password
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
+import os
+import threading
+import time
+from collections import OrderedDict
 
 SECRET_KEY = "super_secret_jwt_key_123"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Cuánto tiempo se confía en el estado is_active cacheado de un usuario
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+# Usuarios con estado cacheado por proceso (LRU)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
@@ -27,23 +36,50 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# Login y registro son async: las consultas van por run_db (AsyncSession o
+# threadpool según DB_MODE) y bcrypt al pool dedicado de utils, así un pico de
+# logins no ocupa los hilos de las rutas.
+def _find_user(db: Session, email: str):
+    return db.query(User).filter(User.email == email).first()
+
+
+def _save_user(db: Session, user: User):
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+
+def _update_hash(db: Session, user: User, new_hash: str):
+    user.hashed_password = new_hash
+    db.commit()
+
+
+def _overloaded():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Demasiados inicios de sesión en curso, intenta de nuevo",
+        headers={"Retry-After": "1"},
+    )
+
+
 # 🔹 Registro
 @router.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == user.email).first()
+async def register(user: UserCreate, db: Session = Depends(get_session)):
+    existing = await run_db(db, _find_user, user.email)
     if existing:
         raise HTTPException(status_code=400, detail="El usuario ya existe")
 
-    hashed_pw = hash_password(user.password)
+    try:
+        hashed_pw = await hash_password_async(user.password)
+    except HashingOverloaded:
+        raise _overloaded()
     new_user = User(
         name=user.name,
         email=user.email,
         hashed_password=hashed_pw,
         role="teacher"  # 👈 todos los nuevos usuarios serán docentes
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await run_db(db, _save_user, new_user)
     return {
         "message": "Usuario docente registrado correctamente",
         "name": new_user.name,
@@ -56,20 +92,96 @@ class UserLogin(BaseModel):
     password: str
 # 🔹 Login
 @router.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def login(user: UserLogin, db: Session = Depends(get_session)):
+    db_user = await run_db(db, _find_user, user.email)
     if not db_user:
         raise HTTPException(status_code=400, detail="Usuario no encontrado")
 
     # 👇 usar el nombre correcto de la columna del modelo
-    if not verify_password(user.password, db_user.hashed_password):
+    try:
+        valid, new_hash = await verify_and_update_password(user.password, db_user.hashed_password)
+    except HashingOverloaded:
+        raise _overloaded()
+    if not valid:
         raise HTTPException(status_code=400, detail="Contraseña incorrecta")
 
-    token = create_access_token({"sub": db_user.email})
+    # Rehash transparente si el costo configurado cambió
+    if new_hash:
+        await run_db(db, _update_hash, db_user, new_hash)
+
+    # Claims de identidad en el token: las rutas autenticadas no consultan users
+    token = create_access_token({
+        "sub": db_user.email,
+        "uid": db_user.id,
+        "name": db_user.name,
+        "role": db_user.role,
+    })
     return {"access_token": token, "token_type": "bearer", "role": db_user.role}
 
+# Usuario autenticado construido desde los claims del token
+class CurrentUser:
+    __slots__ = ("id", "email", "name", "role")
+
+    def __init__(self, id, email, name, role):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.role = role
+
+
+# === Caché de usuarios activos (por id, TTL corto, LRU acotado) ===
+# Guarda solo si el usuario sigue activo. La caché es por proceso: un usuario
+# desactivado en la base deja de autenticarse en a lo sumo
+# USER_CACHE_TTL_SECONDS.
+_active_cache = OrderedDict()
+_active_lock = threading.Lock()
+
+
+def _cached_active(user_id: int):
+    with _active_lock:
+        entry = _active_cache.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del _active_cache[user_id]
+            return None
+        _active_cache.move_to_end(user_id)
+        return entry[1]
+
+
+def _load_active(user_id: int) -> bool:
+    now = time.monotonic()
+    db = SessionLocal()
+    try:
+        row = db.query(User.is_active).filter(User.id == user_id).first()
+    finally:
+        db.close()
+    active = row is not None and row.is_active is not False
+    with _active_lock:
+        _active_cache[user_id] = (now + USER_CACHE_TTL_SECONDS, active)
+        _active_cache.move_to_end(user_id)
+        while len(_active_cache) > USER_CACHE_SIZE:
+            _active_cache.popitem(last=False)
+    return active
+
+
+# Tokens emitidos antes de incluir claims: se resuelven por email
+def _legacy_user(email: str):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+    finally:
+        db.close()
+    if user is None or user.is_active is False:
+        return None
+    return CurrentUser(user.id, user.email, user.name, user.role)
+
+
 # 🔹 Obtener usuario actual
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Ruta rápida: decodifica el token y valida is_active contra la caché, sin
+# abrir sesión de base de datos ni ocupar el threadpool salvo en un fallo de
+# caché.
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token inválido",
@@ -83,7 +195,16 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
+    user_id = payload.get("uid")
+    if user_id is None:
+        user = await run_in_threadpool(_legacy_user, email)
+        if user is None:
+            raise credentials_exception
+        return user
+
+    active = _cached_active(user_id)
+    if active is None:
+        active = await run_in_threadpool(_load_active, user_id)
+    if not active:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return CurrentUser(user_id, email, payload.get("name"), payload.get("role"))
@@ -0,0 +1,161 @@
+# Benchmark y verificación "golden" de analytics.calcular_analitica.
+#
+# Genera una evaluación sintética (selecciones múltiples, preguntas sin
+# responder, índices fuera de rango y claves en formatos heredados), calcula la
+# analítica con la implementación anterior basada en iterrows/groupby por
+# intento y con el pipeline vectorizado, y exige que ambas salidas sean
+# idénticas antes de reportar tiempos.
+#
+#   python benchmarks/bench_analytics.py --attempts 5000 --questions 60
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from analytics import calcular_analitica  # noqa: E402
+from answer_keys import load_answer_key  # noqa: E402
+from models import Attempt, AttemptAnswer, Evaluation, Question  # noqa: E402
+
+
+def seed(n_attempts, n_questions, seed_value=7):
+    rnd = random.Random(seed_value)
+    db = SessionLocal()
+    ev = Evaluation(title="bench-analytics", teacher_name="bench")
+    db.add(ev)
+    db.flush()
+
+    # Claves en los formatos que puede tener correct_index
+    formats = [lambda c: c, lambda c: ",".join(map(str, c)), lambda c: [c], lambda c: c[0] if len(c) == 1 else c]
+    keys = []
+    for i in range(n_questions):
+        correct = sorted(rnd.sample(range(4), rnd.choice([1, 1, 2])))
+        keys.append(correct)
+        db.add(Question(
+            evaluation_id=ev.id, text=f"Q{i}", options_joined="a||b||c||d",
+            correct_index=formats[i % len(formats)](correct), multiple=len(correct) > 1,
+        ))
+    db.flush()
+    qids = [q.id for q in db.query(Question.id).filter(Question.evaluation_id == ev.id).order_by(Question.id)]
+
+    attempt_ids = db.scalars(
+        insert(Attempt).returning(Attempt.id, sort_by_parameter_order=True),
+        [{"evaluation_id": ev.id, "student_name": f"s{i}", "score": rnd.randrange(n_questions + 1)}
+         for i in range(n_attempts)],
+    ).all()
+
+    rows = []
+    for attempt_id in attempt_ids:
+        for qid, correct in zip(qids, keys):
+            r = rnd.random()
+            if r < 0.05:
+                continue  # sin responder
+            if r < 0.55:
+                selected = list(correct)
+            elif r < 0.58:
+                selected = [rnd.choice([-1, 70])]
+            else:
+                selected = rnd.sample(range(4), rnd.choice([1, 1, 2]))
+            if rnd.random() < 0.02:
+                selected = selected + selected[:1]  # fila duplicada
+            rows.extend({"attempt_id": attempt_id, "question_id": qid, "selected_index": s} for s in selected)
+    db.execute(insert(AttemptAnswer), rows)
+    db.commit()
+    evaluation_id = ev.id
+    db.close()
+    return evaluation_id, len(rows)
+
+
+# Implementación anterior (iterrows + groupby por intento), como referencia
+def analitica_referencia(ev, key, db):
+    attempts = db.query(Attempt).filter(Attempt.evaluation_id == ev.id).all()
+    answers = db.query(AttemptAnswer).join(Attempt).filter(Attempt.evaluation_id == ev.id).all()
+    df_attempts = pd.DataFrame([{"attempt_id": a.id, "student_name": a.student_name, "score": a.score} for a in attempts])
+    df_answers = pd.DataFrame([
+        {"attempt_id": a.attempt_id, "question_id": a.question_id, "selected_index": a.selected_index} for a in answers
+    ])
+    df_questions = pd.DataFrame({"question_id": key.question_ids, "text": key.texts, "correct_index": key.correct})
+
+    per_question_stats = []
+    for _, qrow in df_questions.iterrows():
+        qid = qrow["question_id"]
+        df_q = df_answers[df_answers["question_id"] == qid]
+        total_respuestas = len(df_q["attempt_id"].unique())
+        if total_respuestas == 0:
+            accuracy = 0.0
+        else:
+            correctas = 0
+            for _, group in df_q.groupby("attempt_id"):
+                if set(group["selected_index"].tolist()) == qrow["correct_index"]:
+                    correctas += 1
+            accuracy = round((correctas / total_respuestas) * 100, 2)
+        per_question_stats.append({"question_id": int(qid), "text": qrow["text"], "accuracy_pct": accuracy})
+
+    # Distribución calculada directamente sobre los puntajes con numpy, sin
+    # pasar por el histograma de stats: desviación poblacional y percentiles
+    # con interpolación lineal
+    scores = df_attempts["score"].to_numpy()
+    q1, q2, q3 = (round(float(np.percentile(scores, p)), 2) for p in (25, 50, 75))
+    counts = np.bincount(scores, minlength=len(key) + 1)
+
+    return {
+        "evaluation_title": ev.title,
+        "teacher_name": ev.teacher_name,
+        "total_attempts": len(df_attempts),
+        "avg_score": round(float(df_attempts["score"].mean()), 2),
+        "max_score": int(df_attempts["score"].max()),
+        "min_score": int(df_attempts["score"].min()),
+        "std_score": round(float(scores.std()), 2),
+        "median_score": q2,
+        "quartiles": {"q1": q1, "q2": q2, "q3": q3},
+        "percentiles": {},
+        "score_histogram": [{"score": score, "count": int(n)} for score, n in enumerate(counts)],
+        "per_question_accuracy": per_question_stats,
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=40)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    evaluation_id, n_rows = seed(args.attempts, args.questions)
+    print(f"{args.attempts} intentos x {args.questions} preguntas ({n_rows} filas de respuestas)")
+
+    db = SessionLocal()
+    ev = db.get(Evaluation, evaluation_id)
+    key = load_answer_key(db, evaluation_id)
+    reference, t_ref = timed(analitica_referencia, ev, key, db)
+    result, t_vec = timed(calcular_analitica, ev, key, db)
+    db.close()
+
+    if result != reference:
+        raise SystemExit("ERROR: la salida vectorizada difiere de la referencia")
+    print("Salida idéntica a la referencia ✅")
+    print(f"referencia   {t_ref:.3f}s")
+    print(f"vectorizada  {t_vec:.3f}s  (x{t_ref / t_vec:.1f})")
+
+
+if __name__ == "__main__":
+    main()
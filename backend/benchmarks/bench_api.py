@@ -0,0 +1,345 @@
+# Suite de benchmarks de la API: latencia, throughput y conteo de consultas.
+#
+# 1. Genera datos con datagen.generate (o reutiliza la base con --reuse).
+# 2. Mide latencia (p50/p95/p99) y peticiones/s de cada escenario a través de
+#    la app ASGI en el mismo proceso (httpx.ASGITransport), con --concurrency
+#    clientes concurrentes.
+# 3. Cuenta las consultas SQL de una petición por escenario con la caché de
+#    respuestas desactivada y las compara con QUERY_BUDGETS. Además repite
+#    /attempts con páginas de distinto tamaño, /stats sobre evaluaciones de
+#    distinto tamaño y /cohort/analytics con envíos sin plegar en una y en
+#    todas las evaluaciones: si el número de consultas cambia, hay un N+1.
+# 4. Escribe los resultados en JSON (--output) y, con --compare, muestra la
+#    variación respecto de una corrida anterior.
+#
+# Sale con código 1 si algún escenario supera su presupuesto de consultas.
+#
+#   python benchmarks/bench_api.py --evaluations 5 --questions 40 --attempts 2000 --output resultados.json
+#   python benchmarks/bench_api.py ... --compare resultados.json
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+import httpx  # noqa: E402
+from sqlalchemy import event, func, select  # noqa: E402
+
+import main  # noqa: E402
+import response_cache  # noqa: E402
+from answer_keys import load_answer_key  # noqa: E402
+from answer_storage import ANSWER_STORAGE  # noqa: E402
+from database import DB_MODE, SessionLocal, async_engine, engine  # noqa: E402
+from datagen import generate  # noqa: E402
+from models import Attempt, Evaluation  # noqa: E402
+from submissions import grade_submission, write_attempts  # noqa: E402
+from summaries import fold_pending  # noqa: E402
+
+TEACHER = "bench"
+
+# Consultas por petición con las cachés por evaluación calientes y sin caché
+# de respuestas (incluida la carga del usuario en las rutas autenticadas).
+# Superarlas es una regresión; si un cambio las sube a propósito, se actualizan
+# aquí en el mismo commit. Con envíos aún no plegados en los resúmenes (la
+# cola que deja el escenario submit) /stats hace una consulta más y
+# /cohort/analytics dos, sin importar cuántas evaluaciones tengan cola.
+QUERY_BUDGETS = {
+    "submit": 5,
+    "stats": 5,
+    "attempts": 2,
+    "questions": 2,
+    "exam": 1,
+    "evaluations": 1,
+    "cohort": 7,
+}
+
+
+# === Conteo de consultas ===
+# Solo cuenta las consultas emitidas dentro del contexto de la petición medida:
+# el contextvar se propaga al threadpool y a run_sync, pero no al hilo del
+# escritor de SUBMIT_MODE=queued ni a otras tareas.
+_active_counter = contextvars.ContextVar("bench_query_counter", default=None)
+
+
+def _on_execute(*_):
+    counter = _active_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+
+# El motor que realmente usan las rutas (el síncrono subyacente del motor async
+# cuando DB_MODE=async)
+event.listen(async_engine.sync_engine if async_engine is not None else engine, "before_cursor_execute", _on_execute)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._token = None
+
+    def __enter__(self):
+        self.count = 0
+        self._token = _active_counter.set(self)
+        return self
+
+    def __exit__(self, *_):
+        _active_counter.reset(self._token)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Context:
+    def __init__(self, evaluation_ids, headers, n_questions, rnd):
+        self.evaluation_ids = evaluation_ids
+        self.headers = headers
+        self.n_questions = n_questions
+        self.rnd = rnd
+        self.next_student = 0
+
+    def evaluation(self):
+        return self.rnd.choice(self.evaluation_ids)
+
+
+# === Escenarios: (método, ruta, kwargs) para cada petición ===
+def submit_request(ctx):
+    ctx.next_student += 1
+    answers = [[ctx.rnd.randrange(4)] for _ in range(ctx.n_questions)]
+    return "POST", f"/evaluations/{ctx.evaluation()}/submit", {"json": {"student_name": f"bench-{ctx.next_student}", "answers": answers}}
+
+
+SCENARIOS = {
+    "submit": submit_request,
+    "stats": lambda ctx: ("GET", f"/evaluations/{ctx.evaluation()}/stats", {}),
+    "attempts": lambda ctx: ("GET", f"/evaluations/{ctx.evaluation()}/attempts", {"params": {"limit": 100}}),
+    "questions": lambda ctx: ("GET", f"/evaluations/{ctx.evaluation()}/questions", {}),
+    "exam": lambda ctx: ("GET", f"/evaluations/{ctx.evaluation()}/exam", {}),
+    "evaluations": lambda ctx: ("GET", "/evaluations/", {"headers": ctx.headers}),
+    "cohort": lambda ctx: ("GET", "/cohort/analytics", {"headers": ctx.headers}),
+}
+
+
+async def send(client, request):
+    method, url, kwargs = request
+    r = await client.request(method, url, **kwargs)
+    if r.status_code >= 400:
+        raise RuntimeError(f"{method} {url}: {r.status_code} {r.text[:200]}")
+    return r
+
+
+async def measure(client, ctx, name, n_requests, concurrency):
+    make = SCENARIOS[name]
+    latencies = []
+    remaining = [n_requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            request = make(ctx)
+            start = time.perf_counter()
+            await send(client, request)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+# La primera petición calienta las cachés por evaluación (clave de respuestas,
+# snapshot); se cuenta la segunda
+async def count_queries(client, request):
+    await send(client, request)
+    with QueryCounter() as counter:
+        await send(client, request)
+    return counter.count
+
+
+# Pliega en los resúmenes todos los envíos hasta ahora, como SummaryFolder
+def fold_summaries():
+    db = SessionLocal()
+    try:
+        fold_pending(db, 0, db.scalar(select(func.max(Attempt.id))) or 0)
+    finally:
+        db.close()
+
+
+# Un envío sin plegar en cada evaluación indicada, escrito directo en la base
+# (con SUBMIT_MODE=queued la API lo confirmaría más tarde)
+def add_tails(evaluation_ids, rnd):
+    db = SessionLocal()
+    try:
+        graded = []
+        for eid in evaluation_ids:
+            key = load_answer_key(db, eid)
+            graded.append(grade_submission(key, "bench-tail", [[rnd.randrange(4)] for _ in range(len(key))]))
+        write_attempts(db, graded)
+        db.commit()
+    finally:
+        db.close()
+
+
+# === Arnés de consultas (sin caché de respuestas) ===
+async def query_checks(client, ctx, small_eval, large_eval):
+    backend = response_cache.get_backend()
+    response_cache.set_backend(None)
+    try:
+        fold_summaries()
+        counts = {name: await count_queries(client, make(ctx)) for name, make in SCENARIOS.items()}
+        # La comparación chica vs grande, ambas plegadas
+        fold_summaries()
+        cohort = ("GET", "/cohort/analytics", {"headers": ctx.headers})
+        scaling = {
+            "attempts limit=10 vs limit=500": (
+                await count_queries(client, ("GET", f"/evaluations/{large_eval}/attempts", {"params": {"limit": 10}})),
+                await count_queries(client, ("GET", f"/evaluations/{large_eval}/attempts", {"params": {"limit": 500}})),
+            ),
+            "stats evaluación chica vs grande": (
+                await count_queries(client, ("GET", f"/evaluations/{small_eval}/stats", {})),
+                await count_queries(client, ("GET", f"/evaluations/{large_eval}/stats", {})),
+            ),
+        }
+        # El plegador en segundo plano no debe absorber las colas entre las
+        # dos mediciones (el shutdown de la app lo detiene igual)
+        main.summary_folder.stop()
+        add_tails([large_eval], ctx.rnd)
+        with_one_tail = await count_queries(client, cohort)
+        add_tails(ctx.evaluation_ids + [small_eval], ctx.rnd)
+        scaling["cohort cola en una evaluación vs en todas"] = (with_one_tail, await count_queries(client, cohort))
+    finally:
+        response_cache.set_backend(backend)
+
+    checks = {
+        name: {"queries": n, "budget": QUERY_BUDGETS[name], "ok": n <= QUERY_BUDGETS[name]}
+        for name, n in counts.items()
+    }
+    for name, (a, b) in scaling.items():
+        checks[name] = {"queries": [a, b], "ok": a == b}
+    return checks
+
+
+async def setup(client, args):
+    r = await client.post("/auth/register", json={"name": TEACHER, "email": "bench@x.com", "password": "pw"})
+    if r.status_code not in (200, 400):  # 400: ya registrado (--reuse)
+        r.raise_for_status()
+    token = (await client.post("/auth/login", json={"email": "bench@x.com", "password": "pw"})).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def prepare_data(args):
+    if args.reuse:
+        db = SessionLocal()
+        ids = [eid for (eid,) in db.query(Evaluation.id).filter(Evaluation.teacher_name == TEACHER).order_by(Evaluation.id)]
+        db.close()
+        if ids:
+            return ids, None
+    start = time.perf_counter()
+    ids = generate(args.evaluations, args.questions, args.attempts, TEACHER, args.seed)
+    # Evaluación chica para comparar el número de consultas con las grandes
+    ids += generate(1, args.questions, max(args.attempts // 100, 1), TEACHER, args.seed + 1)
+    return ids, round(time.perf_counter() - start, 2)
+
+
+async def run(args):
+    evaluation_ids, datagen_seconds = prepare_data(args)
+    large_eval, small_eval = evaluation_ids[0], evaluation_ids[-1]
+    # ASGITransport no emite eventos lifespan: el escritor de SUBMIT_MODE=queued
+    # y el cierre del motor async dependen de los hooks de la app
+    await main.app.router.startup()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        headers = await setup(client, args)
+        ctx = Context(evaluation_ids[:-1] or evaluation_ids, headers, args.questions, random.Random(args.seed))
+
+        # Calentamiento: cachés de claves, snapshots y conexiones
+        for make in SCENARIOS.values():
+            await send(client, make(ctx))
+
+        results = {}
+        for name in args.scenarios:
+            results[name] = await measure(client, ctx, name, args.requests, args.concurrency)
+        checks = await query_checks(client, ctx, small_eval, large_eval)
+    await main.app.router.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "dialect": engine.dialect.name,
+            "db_mode": DB_MODE,
+            "answer_storage": ANSWER_STORAGE,
+            "response_cache": response_cache.RESPONSE_CACHE_BACKEND,
+            "evaluations": args.evaluations,
+            "questions": args.questions,
+            "attempts": args.attempts,
+            "datagen_seconds": datagen_seconds,
+        },
+        "results": results,
+        "queries": checks,
+    }
+
+
+def print_report(report, previous=None):
+    print(f"{'escenario':<12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in report["results"].items():
+        line = f"{name:<12} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        old = (previous or {}).get("results", {}).get(name)
+        if old:
+            line += f"   req/s {(r['rps'] / old['rps'] - 1) * 100:+6.1f}%  p99 {(r['p99_ms'] / old['p99_ms'] - 1) * 100:+6.1f}%"
+        print(line)
+    print()
+    for name, c in report["queries"].items():
+        budget = f" (máx. {c['budget']})" if "budget" in c else ""
+        print(f"{'ok ' if c['ok'] else 'FALLA'} {name}: {c['queries']} consultas{budget}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluations", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=300, help="peticiones por escenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=20)
+    parser.add_argument("--reuse", action="store_true", help="usar los datos ya generados en DATABASE_URL")
+    parser.add_argument("--output", help="archivo JSON de resultados")
+    parser.add_argument("--compare", help="JSON de una corrida anterior")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(report, previous)
+    sys.exit(0 if all(c["ok"] for c in report["queries"].values()) else 1)
+
+
+if __name__ == "__main__":
+    main_cli()
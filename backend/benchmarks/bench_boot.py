@@ -0,0 +1,102 @@
+# Arranque en frío: tiempo hasta la primera respuesta de un worker nuevo.
+#
+# Cada corrida es un proceso nuevo que importa main, ejecuta los hooks de
+# startup y responde una petición liviana (/questions) y luego una pesada
+# (/item-analysis, que carga numpy en el primer uso). Compara
+# DB_CREATE_ALL=true (create_all en cada arranque) con DB_CREATE_ALL=false
+# (esquema creado antes con manage.py migrate) y muestra la mediana de cada
+# fase y si pandas/numpy ya estaban cargados al terminar el arranque.
+#
+#   python benchmarks/bench_boot.py --runs 7
+#   DATABASE_URL=postgresql://... python benchmarks/bench_boot.py   # create_all contra un servidor real
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+PHASES = ("import_ms", "startup_ms", "first_request_ms", "first_heavy_ms", "process_ms")
+
+
+# === Proceso hijo: un arranque medido ===
+def child(evaluation_id: int, spawned_at: float):
+    start = time.perf_counter()
+    import httpx
+    import main
+
+    imported = time.perf_counter()
+
+    async def boot():
+        await main.app.router.startup()
+        started = time.perf_counter()
+        heavy_at_boot = sorted(m for m in ("pandas", "numpy") if m in sys.modules)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://boot") as client:
+            (await client.get(f"/evaluations/{evaluation_id}/questions")).raise_for_status()
+            first = time.perf_counter()
+            first_wall = time.time()
+            (await client.get(f"/evaluations/{evaluation_id}/item-analysis")).raise_for_status()
+            heavy = time.perf_counter()
+        await main.app.router.shutdown()
+        return started, first, first_wall, heavy, heavy_at_boot
+
+    started, first, first_wall, heavy, heavy_at_boot = asyncio.run(boot())
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "startup_ms": (started - imported) * 1000,
+        "first_request_ms": (first - started) * 1000,
+        "first_heavy_ms": (heavy - first) * 1000,
+        # desde que el padre lanzó el proceso hasta la primera respuesta
+        # (incluye arrancar el intérprete)
+        "process_ms": (first_wall - spawned_at) * 1000,
+        "heavy_at_boot": heavy_at_boot,
+    }))
+
+
+def run_once(evaluation_id: int, create_all: bool) -> dict:
+    env = {**os.environ, "DB_CREATE_ALL": "true" if create_all else "false", "REPORT_AUTO": "false"}
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", str(evaluation_id), str(time.time())],
+        env=env, cwd=BACKEND, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(int(args.child[0]), float(args.child[1]))
+        return
+
+    from datagen import generate
+
+    # El esquema y los datos se crean una vez, como haría manage.py migrate
+    evaluation_id = generate(1, 40, 500, teacher_name="boot")[0]
+
+    print(f"{'modo':<22}" + "".join(f"{p:>18}" for p in PHASES) + "   pandas/numpy al arrancar")
+    for create_all in (True, False):
+        runs = [run_once(evaluation_id, create_all) for _ in range(args.runs)]
+        medians = {p: statistics.median(r[p] for r in runs) for p in PHASES}
+        label = f"DB_CREATE_ALL={'true' if create_all else 'false'}"
+        heavy = ",".join(runs[-1]["heavy_at_boot"]) or "no"
+        print(f"{label:<22}" + "".join(f"{medians[p]:>18.1f}" for p in PHASES) + f"   {heavy}")
+
+
+if __name__ == "__main__":
+    main_cli()
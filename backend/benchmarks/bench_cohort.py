@@ -0,0 +1,121 @@
+# Benchmark de la analítica de cohorte (cohort.cohort_analytics).
+#
+# Genera --evaluations evaluaciones de un mismo docente con --attempts intentos
+# x --questions preguntas (respuestas en attempt_answers) y una población de
+# --students estudiantes que se repite entre evaluaciones. Compara la ruta de
+# cohorte (consultas agregadas + resúmenes) con recorrer las evaluaciones
+# llamando a generar_analitica una por una, y cuenta las consultas SQL de cada
+# variante.
+#
+#   python benchmarks/bench_cohort.py --evaluations 200 --attempts 500 --questions 30
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+from sqlalchemy import event, insert  # noqa: E402
+
+import summaries  # noqa: E402
+from analytics import generar_analitica  # noqa: E402
+from cohort import cohort_analytics  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import Attempt, AttemptAnswer, Evaluation, Question  # noqa: E402
+
+TEACHER = "bench-cohort"
+
+
+def seed(n_evaluations, n_attempts, n_questions, n_students):
+    rnd = random.Random(18)
+    skill = [rnd.random() for _ in range(n_students)]
+    drift = [rnd.uniform(-0.3, 0.3) / max(n_evaluations, 1) for _ in range(n_students)]
+    db = SessionLocal()
+    for e in range(n_evaluations):
+        ev = Evaluation(title=f"bench-cohort-{e}", teacher_name=TEACHER)
+        db.add(ev)
+        db.flush()
+        qids = db.scalars(
+            insert(Question).returning(Question.id, sort_by_parameter_order=True),
+            [{"evaluation_id": ev.id, "text": f"Q{i}", "options_joined": "a||b||c||d", "correct_index": [0]}
+             for i in range(n_questions)],
+        ).all()
+        students = rnd.sample(range(n_students), min(n_attempts, n_students))
+        answers = []
+        for s in students:
+            p = min(max(skill[s] + drift[s] * e, 0.0), 1.0)
+            answers.append([0 if rnd.random() < p else rnd.randrange(1, 4) for _ in qids])
+        attempt_ids = db.scalars(
+            insert(Attempt).returning(Attempt.id, sort_by_parameter_order=True),
+            [{"evaluation_id": ev.id, "student_name": f"s{s}", "score": sum(a == 0 for a in sel)}
+             for s, sel in zip(students, answers)],
+        ).all()
+        db.execute(insert(AttemptAnswer), [
+            {"attempt_id": aid, "question_id": qid, "selected_index": a}
+            for aid, sel in zip(attempt_ids, answers)
+            for qid, a in zip(qids, sel)
+        ])
+        db.commit()
+    summaries.rebuild(db)
+    db.commit()
+    ids = [eid for (eid,) in db.query(Evaluation.id).filter(Evaluation.teacher_name == TEACHER)]
+    db.close()
+    return ids
+
+
+def measure(fn, repeat):
+    queries = [0]
+
+    def count(*_):
+        queries[0] += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    best = float("inf")
+    try:
+        for _ in range(repeat):
+            queries[0] = 0
+            db = SessionLocal()
+            start = time.perf_counter()
+            fn(db)
+            best = min(best, time.perf_counter() - start)
+            db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return best, queries[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluations", type=int, default=100)
+    parser.add_argument("--attempts", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--students", type=int, default=400)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    ids = seed(args.evaluations, args.attempts, args.questions, args.students)
+    print(f"{args.evaluations} evaluaciones x {min(args.attempts, args.students)} intentos x "
+          f"{args.questions} preguntas, {args.students} estudiantes")
+
+    def per_evaluation(db):
+        for eid in ids:
+            generar_analitica(eid, db)
+
+    for label, fn in (
+        ("generar_analitica x evaluación", per_evaluation),
+        ("cohort_analytics", lambda db: cohort_analytics(db, TEACHER)),
+    ):
+        elapsed, queries = measure(fn, args.repeat)
+        print(f"{label:<32} {elapsed * 1000:10.1f} ms   {queries:6d} consultas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Benchmark de memoria de la exportación en streaming.
+#
+# Inserta una evaluación con ~1M filas en attempt_answers (por defecto 20.000
+# intentos x 50 preguntas) y consume export.stream_export midiendo el RSS del
+# proceso cada 10% de los intentos. Con streaming el RSS debe quedar plano sin
+# importar cuántos intentos existan.
+#
+#   python benchmarks/bench_export.py --attempts 20000 --questions 50 --format csv
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+from sqlalchemy import insert  # noqa: E402
+
+import export  # noqa: E402
+from answer_keys import load_answer_key  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import Attempt, AttemptAnswer, Evaluation, Question  # noqa: E402
+
+
+def rss_mb():
+    # RSS actual desde /proc (Linux); si no existe, el pico de getrusage
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(n_attempts, n_questions, chunk=2000):
+    rnd = random.Random(11)
+    db = SessionLocal()
+    ev = Evaluation(title="bench-export", teacher_name="bench")
+    db.add(ev)
+    db.flush()
+    qs = [Question(evaluation_id=ev.id, text=f"Q{i}", options_joined="a||b||c||d", correct_index=[i % 4])
+          for i in range(n_questions)]
+    db.add_all(qs)
+    db.flush()
+    qids = [q.id for q in qs]
+    for start in range(0, n_attempts, chunk):
+        size = min(chunk, n_attempts - start)
+        attempt_ids = db.scalars(
+            insert(Attempt).returning(Attempt.id, sort_by_parameter_order=True),
+            [{"evaluation_id": ev.id, "student_name": f"s{start + i}", "score": 0} for i in range(size)],
+        ).all()
+        db.execute(insert(AttemptAnswer), [
+            {"attempt_id": aid, "question_id": qid, "selected_index": rnd.randrange(4)}
+            for aid in attempt_ids for qid in qids
+        ])
+        db.commit()
+    evaluation_id = ev.id
+    db.close()
+    return evaluation_id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=20_000)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--format", choices=sorted(export.EXPORT_FORMATS), default="csv")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    evaluation_id = seed(args.attempts, args.questions)
+    print(f"{args.attempts} intentos x {args.questions} preguntas = {args.attempts * args.questions:,} respuestas")
+
+    db = SessionLocal()
+    key = load_answer_key(db, evaluation_id)
+    db.close()
+
+    # Cuenta intentos emitidos envolviendo el iterador de lectura
+    emitted = [0]
+    original = export.iter_attempts
+
+    def counting(evaluation_id, key, session_factory=SessionLocal):
+        for row in original(evaluation_id, key, session_factory):
+            emitted[0] += 1
+            yield row
+
+    export.iter_attempts = counting
+
+    checkpoints = {max(1, args.attempts * p // 10) for p in range(1, 11)}
+    samples = []
+    total_bytes = 0
+    baseline = rss_mb()
+    start = time.perf_counter()
+    for chunk in export.stream_export(evaluation_id, key, args.format):
+        total_bytes += len(chunk)
+        if emitted[0] in checkpoints:
+            checkpoints.discard(emitted[0])
+            samples.append((emitted[0], rss_mb()))
+    elapsed = time.perf_counter() - start
+
+    print(f"RSS inicial: {baseline:.1f} MB")
+    for n, rss in samples:
+        print(f"  {n:>8} intentos -> RSS {rss:.1f} MB")
+    print(f"{total_bytes / 2**20:.1f} MB de {args.format} en {elapsed:.2f}s; "
+          f"variación de RSS durante el streaming: {max(r for _, r in samples) - min(r for _, r in samples):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
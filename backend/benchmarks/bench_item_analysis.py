@@ -0,0 +1,125 @@
+# Benchmark del análisis de ítems sobre una matriz intentos × preguntas.
+#
+# Genera respuestas con un modelo logístico de un parámetro (habilidad del
+# estudiante vs dificultad del ítem), mide analyze_matrix y verifica la
+# punto-biserial contra np.corrcoef. Con --db-attempts también mide la
+# construcción de la matriz desde attempt_answers en SQLite temporal.
+#
+#   python benchmarks/bench_item_analysis.py --attempts 100000 --questions 60
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+import numpy as np  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from answer_keys import AnswerKey, load_answer_key  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from item_analysis import analyze_matrix, build_response_matrix  # noqa: E402
+from models import Attempt, AttemptAnswer, Evaluation, Question  # noqa: E402
+
+N_OPTIONS = 4
+
+
+def synthetic(n_attempts, n_questions, seed=3):
+    rng = np.random.default_rng(seed)
+    ability = rng.normal(size=(n_attempts, 1))
+    item_difficulty = rng.normal(size=(1, n_questions))
+    correct_option = rng.integers(0, N_OPTIONS, size=n_questions)
+    p_correct = 1 / (1 + np.exp(item_difficulty - ability))
+    is_correct = rng.random((n_attempts, n_questions)) < p_correct
+    wrong = (correct_option + rng.integers(1, N_OPTIONS, size=(n_attempts, n_questions))) % N_OPTIONS
+    selected = np.where(is_correct, correct_option, wrong)
+    selected[rng.random((n_attempts, n_questions)) < 0.02] = -1  # sin responder
+    key = AnswerKey(
+        0,
+        list(range(1, n_questions + 1)),
+        [f"Q{j}" for j in range(n_questions)],
+        [N_OPTIONS] * n_questions,
+        [frozenset([int(c)]) for c in correct_option],
+    )
+    return selected, key
+
+
+def to_masks(selected):
+    return np.where(selected >= 0, np.left_shift(1, np.maximum(selected, 0)), 0).astype(np.int64)
+
+
+def check_point_biserial(result, masks, key):
+    X = (masks == np.asarray(key.masks)).astype(float)
+    total = X.sum(axis=1)
+    for j in range(min(5, X.shape[1])):
+        expected = np.corrcoef(X[:, j], total - X[:, j])[0, 1]
+        got = result["items"][j]["point_biserial"]
+        assert abs(expected - got) < 1e-3, (j, expected, got)
+
+
+def seed_db(selected, key):
+    db = SessionLocal()
+    ev = Evaluation(title="bench-items", teacher_name="bench")
+    db.add(ev)
+    db.flush()
+    qs = [
+        Question(evaluation_id=ev.id, text=t, options_joined="||".join("abcd"), correct_index=sorted(c))
+        for t, c in zip(key.texts, key.correct)
+    ]
+    db.add_all(qs)
+    db.flush()
+    attempt_ids = db.scalars(
+        insert(Attempt).returning(Attempt.id, sort_by_parameter_order=True),
+        [{"evaluation_id": ev.id, "student_name": f"s{i}", "score": 0} for i in range(len(selected))],
+    ).all()
+    db.execute(insert(AttemptAnswer), [
+        {"attempt_id": aid, "question_id": q.id, "selected_index": int(sel)}
+        for aid, row in zip(attempt_ids, selected)
+        for q, sel in zip(qs, row)
+        if sel >= 0
+    ])
+    db.commit()
+    evaluation_id = ev.id
+    db.close()
+    return evaluation_id
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=100_000)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--db-attempts", type=int, default=0, help="intentos a insertar para medir la carga desde la BD")
+    args = parser.parse_args()
+
+    selected, key = synthetic(args.attempts, args.questions)
+    masks = to_masks(selected)
+    invalid = np.zeros_like(masks, dtype=bool)
+
+    start = time.perf_counter()
+    result = analyze_matrix(masks, invalid, key)
+    elapsed = time.perf_counter() - start
+    check_point_biserial(result, masks, key)
+    print(f"analyze_matrix {args.attempts} x {args.questions}: {elapsed:.3f}s "
+          f"(KR-20 {result['reliability']['kr20']}, punto-biserial verificada)")
+
+    if args.db_attempts:
+        Base.metadata.create_all(bind=engine)
+        evaluation_id = seed_db(selected[: args.db_attempts], key)
+        db = SessionLocal()
+        db_key = load_answer_key(db, evaluation_id)
+        start = time.perf_counter()
+        _, db_masks, db_invalid = build_response_matrix(db, evaluation_id, db_key)
+        load = time.perf_counter() - start
+        db.close()
+        assert (db_masks == masks[: args.db_attempts]).all()
+        print(f"build_response_matrix {args.db_attempts} x {args.questions} desde la BD: {load:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
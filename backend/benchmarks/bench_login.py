@@ -0,0 +1,106 @@
+# Benchmark de logins concurrentes vs latencia del resto de la API.
+#
+# Lanza --concurrency clientes que inician sesión en bucle durante --seconds
+# mientras otro cliente consulta GET /evaluations/{id}/questions sin pausa, todo
+# en el mismo proceso vía ASGI. Reporta logins/s, logins rechazados con 503 y
+# el p50/p99 de /questions en reposo y bajo carga. Con bcrypt en el pool
+# dedicado, el p99 de /questions bajo carga debe quedar cerca del de reposo.
+#
+#   BCRYPT_ROUNDS=12 HASH_WORKERS=4 python benchmarks/bench_login.py --concurrency 200 --seconds 10
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def setup(client, n_users):
+    r = await client.post("/auth/register", json={"name": "Profe", "email": "bench@x.com", "password": "pw"})
+    r.raise_for_status()
+    token = (await client.post("/auth/login", json={"email": "bench@x.com", "password": "pw"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    evaluation_id = (await client.post("/evaluations/", json={"title": "bench-login"}, headers=headers)).json()["id"]
+    for i in range(20):
+        await client.post(
+            f"/evaluations/{evaluation_id}/questions",
+            json={"text": f"Q{i}", "options": ["a", "b", "c", "d"], "correct_index": [i % 4]},
+            headers=headers,
+        )
+    for i in range(n_users):
+        r = await client.post("/auth/register", json={"name": f"s{i}", "email": f"s{i}@x.com", "password": "pw"})
+        r.raise_for_status()
+    return evaluation_id
+
+
+async def probe(client, evaluation_id, until, latencies):
+    while time.perf_counter() < until:
+        start = time.perf_counter()
+        r = await client.get(f"/evaluations/{evaluation_id}/questions")
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def login_loop(client, email, until, counts):
+    while time.perf_counter() < until:
+        r = await client.post("/auth/login", json={"email": email, "password": "pw"})
+        counts[r.status_code] = counts.get(r.status_code, 0) + 1
+        if r.status_code == 503:
+            await asyncio.sleep(float(r.headers.get("retry-after", "1")))
+
+
+async def run(args):
+    # ASGITransport no emite eventos lifespan: las tablas se crean en el startup
+    await main.app.router.startup()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        evaluation_id = await setup(client, args.concurrency)
+
+        idle = []
+        await probe(client, evaluation_id, time.perf_counter() + min(args.seconds, 3), idle)
+
+        loaded, counts = [], {}
+        until = time.perf_counter() + args.seconds
+        start = time.perf_counter()
+        await asyncio.gather(
+            probe(client, evaluation_id, until, loaded),
+            *(login_loop(client, f"s{i}@x.com", until, counts) for i in range(args.concurrency)),
+        )
+        elapsed = time.perf_counter() - start
+    await main.app.router.shutdown()
+
+    ok = counts.get(200, 0)
+    print(f"logins: {ok} ok en {elapsed:.1f}s = {ok / elapsed:.1f}/s; 503: {counts.get(503, 0)}; otros: "
+          f"{sum(v for k, v in counts.items() if k not in (200, 503))}")
+    print(f"/questions en reposo:   p50 {percentile(idle, 50):.1f} ms, p99 {percentile(idle, 99):.1f} ms ({len(idle)} req)")
+    print(f"/questions bajo carga:  p50 {percentile(loaded, 50):.1f} ms, p99 {percentile(loaded, 99):.1f} ms ({len(loaded)} req)")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
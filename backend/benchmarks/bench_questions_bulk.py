@@ -0,0 +1,95 @@
+# Benchmark de carga de preguntas: una petición por pregunta vs importación
+# masiva (JSON y CSV) en una sola petición, vía ASGI en el mismo proceso.
+#
+#   python benchmarks/bench_questions_bulk.py --questions 100 --rounds 5
+
+import argparse
+import asyncio
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+
+
+def make_questions(n):
+    return [
+        {"text": f"Pregunta {i}", "options": ["a", "b", "c", "d"], "correct_index": [i % 4], "multiple": False}
+        for i in range(n)
+    ]
+
+
+def to_csv(questions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["text", "options", "correct_index", "multiple"])
+    for q in questions:
+        writer.writerow([q["text"], "||".join(q["options"]), ",".join(map(str, q["correct_index"])), q["multiple"]])
+    return buffer.getvalue().encode("utf-8")
+
+
+async def run(args):
+    # ASGITransport no emite eventos lifespan: las tablas se crean en el startup
+    await main.app.router.startup()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.post("/auth/register", json={"name": "Profe", "email": "bulk@x.com", "password": "pw"})
+        token = (await client.post("/auth/login", json={"email": "bulk@x.com", "password": "pw"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        questions = make_questions(args.questions)
+        csv_body = to_csv(questions)
+
+        async def new_evaluation():
+            r = await client.post("/evaluations/", json={"title": "bench-bulk"}, headers=headers)
+            return r.json()["id"]
+
+        async def one_by_one(evaluation_id):
+            for q in questions:
+                r = await client.post(f"/evaluations/{evaluation_id}/questions", json=q, headers=headers)
+                r.raise_for_status()
+
+        async def bulk_json(evaluation_id):
+            r = await client.post(f"/evaluations/{evaluation_id}/questions:bulk", json=questions, headers=headers)
+            r.raise_for_status()
+            assert r.json()["created"] == len(questions)
+
+        async def bulk_csv(evaluation_id):
+            r = await client.post(
+                f"/evaluations/{evaluation_id}/questions:bulk",
+                content=csv_body,
+                headers={**headers, "Content-Type": "text/csv"},
+            )
+            r.raise_for_status()
+            assert r.json()["created"] == len(questions)
+
+        for label, load in (("una por petición", one_by_one), ("bulk JSON", bulk_json), ("bulk CSV", bulk_csv)):
+            best = float("inf")
+            for _ in range(args.rounds):
+                evaluation_id = await new_evaluation()
+                start = time.perf_counter()
+                await load(evaluation_id)
+                best = min(best, time.perf_counter() - start)
+            print(f"{label:<18} {args.questions} preguntas en {best * 1000:8.1f} ms = {args.questions / best:9.0f} preguntas/s")
+    await main.app.router.shutdown()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,145 @@
+# Benchmark de la detección de similitud entre intentos.
+#
+# Genera respuestas con un modelo logístico (habilidad vs dificultad) y planta
+# --rings grupos de 2 a 4 intentos que copian las respuestas de un líder en
+# una fracción --copy de las preguntas. Mide la construcción de los vectores
+# de respuestas incorrectas y el recorrido por bloques de todos los pares,
+# exige detectar al menos --min-recall de las copias directas (líder,
+# copista) con a lo sumo --max-false pares marcados no plantados, informa
+# además los pares entre dos copistas del mismo líder (que solo comparten lo
+# que ambos copiaron) y, sobre una muestra, verifica los pares marcados y su
+# p-valor contra el cálculo directo par a par.
+#
+#   python benchmarks/bench_similarity.py --attempts 20000 --questions 100
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from answer_keys import AnswerKey  # noqa: E402
+from similarity import binomial_log_tail, suspicious_pairs, wrong_answer_vectors  # noqa: E402
+
+N_OPTIONS = 4
+
+
+def synthetic(n_attempts, n_questions, n_rings, copy_fraction, seed=25):
+    rng = np.random.default_rng(seed)
+    ability = rng.normal(size=(n_attempts, 1))
+    item_difficulty = rng.normal(size=(1, n_questions))
+    correct_option = rng.integers(0, N_OPTIONS, size=n_questions)
+    # Distractores con popularidad desigual, como en un examen real
+    distractor_p = rng.dirichlet(np.ones(N_OPTIONS - 1), size=n_questions)
+    p_correct = 1 / (1 + np.exp(item_difficulty - ability))
+    is_correct = rng.random((n_attempts, n_questions)) < p_correct
+    pick = (rng.random((n_attempts, n_questions, 1)) > np.cumsum(distractor_p, axis=1)[None]).sum(axis=2)
+    wrong = (correct_option + 1 + np.minimum(pick, N_OPTIONS - 2)) % N_OPTIONS
+    selected = np.where(is_correct, correct_option, wrong)
+    selected[rng.random((n_attempts, n_questions)) < 0.02] = -1  # sin responder
+
+    planted, direct = set(), set()
+    members = rng.permutation(n_attempts)
+    pos = 0
+    for _ in range(n_rings):
+        size = int(rng.integers(2, 5))
+        ring = sorted(int(m) for m in members[pos:pos + size])
+        pos += size
+        leader = ring[0]
+        for follower in ring[1:]:
+            copied = rng.random(n_questions) < copy_fraction
+            selected[follower, copied] = selected[leader, copied]
+            direct.add((leader, follower))
+        planted.update((a, b) for x, a in enumerate(ring) for b in ring[x + 1:])
+
+    masks = np.where(selected >= 0, np.left_shift(1, np.maximum(selected, 0)), 0).astype(np.int64)
+    key = AnswerKey(
+        0,
+        list(range(1, n_questions + 1)),
+        [f"Q{j}" for j in range(n_questions)],
+        [N_OPTIONS] * n_questions,
+        [frozenset([int(c)]) for c in correct_option],
+    )
+    return masks, key, planted, direct
+
+
+# p-valor exacto de todos los pares de la muestra, fila por fila y sin
+# filtro previo: los pares marcados deben ser los mismos que en el recorrido
+# por bloques, con el mismo p-valor. El umbral por prueba (test_p) es mucho
+# más laxo que el real para que haya pares marcados y el filtro normal del
+# recorrido se ejerza cerca de su margen.
+def check_against_direct(answers, sample, test_p=1e-3):
+    codes, wrong = answers.codes[:sample], answers.wrong[:sample]
+    probability, share = answers.probability[:sample], answers.share[:sample]
+    pairs = sample * (sample - 1) // 2
+    alpha = test_p * 2 * pairs
+    log_threshold = np.log(alpha) - np.log(2 * pairs)
+    direct = {}
+    for a in range(sample - 1):
+        score = np.count_nonzero((codes[a] == codes[a + 1:]) & (codes[a] >= 0), axis=1)
+        log_p = np.minimum(binomial_log_tail(share[a] * probability[a + 1:], score),
+                           binomial_log_tail(share[a + 1:] * probability[a], score))
+        for b in np.flatnonzero(log_p <= log_threshold):
+            direct[(a, a + 1 + int(b))] = log_p[b]
+
+    sub = type(answers)(answers.vectors[:sample], codes, wrong, probability, share)
+    i, j, _, _, log_p, compared = suspicious_pairs(sub, alpha, 0, block=256)
+    blocked = dict(zip(zip(i.tolist(), j.tolist()), log_p.tolist()))
+    assert compared == pairs and set(blocked) == set(direct), (len(blocked), len(direct))
+    keys = list(direct)
+    assert np.allclose([blocked[k] for k in keys], [direct[k] for k in keys], rtol=1e-6)
+    print(f"verificado contra el cálculo directo: {len(direct)} de {pairs} pares con p <= {test_p:g}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attempts", type=int, default=20000)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--rings", type=int, default=20)
+    parser.add_argument("--copy", type=float, default=0.75, help="fracción de preguntas copiadas")
+    parser.add_argument("--alpha", type=float, default=0.01)
+    parser.add_argument("--min-identical", type=int, default=3)
+    parser.add_argument("--min-recall", type=float, default=0.8, help="fracción mínima de copias directas detectadas")
+    parser.add_argument("--max-false", type=int, default=1, help="máximo de pares marcados no plantados")
+    parser.add_argument("--sample", type=int, default=600, help="intentos de la verificación directa")
+    args = parser.parse_args()
+
+    masks, key, planted, direct = synthetic(args.attempts, args.questions, args.rings, args.copy)
+    invalid = np.zeros_like(masks, dtype=bool)
+
+    start = time.perf_counter()
+    answers = wrong_answer_vectors(masks, invalid, key)
+    built = time.perf_counter()
+    i, j, _, _, log_p, compared = suspicious_pairs(answers, args.alpha, args.min_identical)
+    done = time.perf_counter()
+
+    n = args.attempts
+    found = {(int(a), int(b)) for a, b in zip(i, j)}
+    print(f"{n} intentos × {args.questions} preguntas: {compared} pares, {answers.vectors.shape[1]} columnas")
+    print(f"vectores: {(built - start) * 1000:8.1f} ms   pares: {(done - built) * 1000:8.1f} ms   "
+          f"total: {(done - start):.2f} s")
+    largest = np.exp(log_p.max()) * 2 * compared if len(log_p) else float("nan")
+    print(f"marcados con alpha = {args.alpha:g}: {len(found)} (mayor p ajustado {largest:.2g})")
+    detected, false = len(direct & found), len(found - planted)
+    indirect = planted - direct
+    print(f"copias directas detectadas: {detected}/{len(direct)}; entre copistas: "
+          f"{len(indirect & found)}/{len(indirect)}; marcados no plantados: {false}")
+
+    if args.sample >= 2:
+        check_against_direct(answers, min(args.sample, n))
+
+    failed = []
+    if detected < args.min_recall * len(direct):
+        failed.append(f"copias directas detectadas {detected}/{len(direct)} < {args.min_recall:g}")
+    if false > args.max_false:
+        failed.append(f"{false} marcados no plantados > {args.max_false}")
+    if failed:
+        sys.exit("FALLA: " + "; ".join(failed))
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
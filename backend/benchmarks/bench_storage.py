@@ -0,0 +1,154 @@
+# Benchmark de almacenamiento de respuestas: tamaño en disco y tiempo de la
+# consulta de estadísticas crudas (stats.question_accuracy).
+#
+# Inserta --evaluations evaluaciones con --attempts intentos x --questions
+# preguntas (con selección múltiple) y mide tres escenarios sobre una de ellas:
+#   1. attempt_answers sin los índices compuestos (esquema anterior)
+#   2. attempt_answers con los índices
+#   3. attempt_answer_masks (ANSWER_STORAGE=compact)
+# El tamaño incluye los índices de cada tabla (dbstat en SQLite,
+# pg_total_relation_size en Postgres).
+#
+#   python benchmarks/bench_storage.py --evaluations 10 --attempts 2000 --questions 40
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+from sqlalchemy import insert, text  # noqa: E402
+
+import answer_storage  # noqa: E402
+from answer_keys import load_answer_key  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import Attempt, AttemptAnswer, AttemptAnswerMask, Evaluation, Question  # noqa: E402
+from stats import question_accuracy  # noqa: E402
+
+NEW_INDEXES = [
+    ("attempts", "ix_attempts_evaluation_id_id"),
+    ("questions", "ix_questions_evaluation_id_id"),
+    ("attempt_answers", "ix_attempt_answers_attempt_id_question_id"),
+    ("attempt_answers", "ix_attempt_answers_question_id"),
+]
+
+
+def seed(n_evaluations, n_attempts, n_questions, chunk=2000):
+    rnd = random.Random(15)
+    db = SessionLocal()
+    evaluation_ids = []
+    for e in range(n_evaluations):
+        ev = Evaluation(title=f"bench-storage-{e}", teacher_name="bench")
+        db.add(ev)
+        db.flush()
+        keys = [sorted(rnd.sample(range(4), 2 if i % 5 == 0 else 1)) for i in range(n_questions)]
+        qs = [Question(evaluation_id=ev.id, text=f"Q{i}", options_joined="a||b||c||d", correct_index=k)
+              for i, k in enumerate(keys)]
+        db.add_all(qs)
+        db.flush()
+        for start in range(0, n_attempts, chunk):
+            size = min(chunk, n_attempts - start)
+            attempt_ids = db.scalars(
+                insert(Attempt).returning(Attempt.id, sort_by_parameter_order=True),
+                [{"evaluation_id": ev.id, "student_name": f"s{start + i}", "score": 0} for i in range(size)],
+            ).all()
+            rows = []
+            for aid in attempt_ids:
+                for q, k in zip(qs, keys):
+                    selected = k if rnd.random() < 0.6 else rnd.sample(range(4), len(k))
+                    rows += [{"attempt_id": aid, "question_id": q.id, "selected_index": s} for s in selected]
+            db.execute(insert(AttemptAnswer), rows)
+        db.commit()
+        evaluation_ids.append(ev.id)
+    db.close()
+    return evaluation_ids
+
+
+def table_bytes(conn, table):
+    if conn.dialect.name == "sqlite":
+        return conn.execute(text(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = :t "
+            "OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t)"
+        ), {"t": table}).scalar() or 0
+    return conn.execute(text("SELECT pg_total_relation_size(:t)"), {"t": table}).scalar()
+
+
+def analyze(conn):
+    conn.execute(text("ANALYZE"))
+
+
+def time_stats(evaluation_id, repeat):
+    db = SessionLocal()
+    key = load_answer_key(db, evaluation_id)
+    keys = list(zip(key.question_ids, key.correct))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = question_accuracy(db, evaluation_id, keys)
+        best = min(best, time.perf_counter() - start)
+    db.close()
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluations", type=int, default=10)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for _, index in NEW_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    evaluation_ids = seed(args.evaluations, args.attempts, args.questions)
+    target = evaluation_ids[len(evaluation_ids) // 2]
+    with engine.begin() as conn:
+        n_rows = conn.execute(text("SELECT COUNT(*) FROM attempt_answers")).scalar()
+    print(f"{args.evaluations} evaluaciones x {args.attempts} intentos x {args.questions} preguntas: "
+          f"{n_rows:,} filas en attempt_answers")
+
+    results = []
+    answer_storage.ANSWER_STORAGE = "rows"
+    with engine.begin() as conn:
+        analyze(conn)
+        size = table_bytes(conn, "attempt_answers")
+    elapsed, reference = time_stats(target, args.repeat)
+    results.append(("filas, sin índices", size, elapsed))
+
+    with engine.begin() as conn:
+        for table, index in NEW_INDEXES:
+            next(ix for ix in Base.metadata.tables[table].indexes if ix.name == index).create(bind=conn)
+        analyze(conn)
+        size = table_bytes(conn, "attempt_answers")
+    elapsed, _ = time_stats(target, args.repeat)
+    results.append(("filas, con índices", size, elapsed))
+
+    db = SessionLocal()
+    for eid in evaluation_ids:
+        answer_storage.compact_evaluation(db, eid)
+        db.commit()
+    db.close()
+    answer_storage.ANSWER_STORAGE = "compact"
+    with engine.begin() as conn:
+        analyze(conn)
+        size = table_bytes(conn, AttemptAnswerMask.__tablename__)
+    elapsed, compact = time_stats(target, args.repeat)
+    assert compact == reference, "el formato compacto no reproduce las estadísticas"
+    results.append(("compacto (bitmask)", size, elapsed))
+
+    for label, size, elapsed in results:
+        print(f"{label:<22} tamaño {size / 2**20:8.1f} MB   stats {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# Micro-benchmark de la ruta de escritura de submit_attempt.
+#
+# Compara la ruta anterior (un objeto AttemptAnswer por selección + flush +
+# commit por unidad de trabajo) con la ruta de escritura masiva de
+# submissions.write_attempts. Ninguna de las dos toca los resúmenes de
+# estadísticas al enviar: en ambas se mide además el plegado de los resúmenes
+# (summaries.fold_pending, lo que hace SummaryFolder en segundo plano) sobre
+# los intentos escritos, así las dos hacen el mismo trabajo en total. Usa
+# SQLite en un archivo temporal salvo que se defina DATABASE_URL (por ejemplo
+# un Postgres local).
+#
+#   python benchmarks/bench_submit.py --submissions 2000 --questions 40
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL"):
+    _tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+    os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+
+from sqlalchemy import func, select  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from answer_keys import get_answer_key  # noqa: E402
+from models import Attempt, AttemptAnswer, Evaluation, Question  # noqa: E402
+from submissions import grade_submission, write_attempts  # noqa: E402
+from summaries import fold_pending  # noqa: E402
+
+
+def seed(n_questions):
+    db = SessionLocal()
+    ev = Evaluation(title="bench-submit", teacher_name="bench")
+    db.add(ev)
+    db.flush()
+    db.add_all([
+        Question(evaluation_id=ev.id, text=f"Q{i}", options_joined="a||b||c||d", correct_index=[i % 4])
+        for i in range(n_questions)
+    ])
+    db.commit()
+    evaluation_id = ev.id
+    db.close()
+    return evaluation_id
+
+
+def random_answers(rnd, n_questions):
+    return [[rnd.randrange(4)] for _ in range(n_questions)]
+
+
+# Ruta anterior: ORM + flush para obtener el id + commit
+def submit_orm(db, key, student_name, answers):
+    attempt = Attempt(evaluation_id=key.evaluation_id, student_name=student_name, score=0)
+    db.add(attempt)
+    db.flush()
+    for qid, selected_list in zip(key.question_ids, answers):
+        for sel in selected_list:
+            db.add(AttemptAnswer(attempt_id=attempt.id, question_id=qid, selected_index=int(sel)))
+    attempt.score = key.grade(answers)
+    db.commit()
+
+
+# Ruta nueva: INSERT ... RETURNING + INSERT multi-fila + commit
+def submit_bulk(db, key, student_name, answers):
+    write_attempts(db, [grade_submission(key, student_name, answers)])
+    db.commit()
+
+
+def run(label, fn, evaluation_id, n_submissions, n_questions):
+    rnd = random.Random(42)
+    payloads = [random_answers(rnd, n_questions) for _ in range(n_submissions)]
+    db = SessionLocal()
+    key = get_answer_key(db, evaluation_id)
+    start = time.perf_counter()
+    for i, answers in enumerate(payloads):
+        fn(db, key, f"student-{i}", answers)
+    submitted = time.perf_counter()
+    fold_pending(db, 0, db.scalar(select(func.max(Attempt.id))))
+    folded = time.perf_counter()
+    elapsed = folded - start
+    db.close()
+    print(f"{label:<6} {n_submissions} envíos en {submitted - start:.3f}s + plegado {folded - submitted:.3f}s "
+          f"-> {n_submissions / elapsed:,.0f} envíos/s")
+    return n_submissions / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--submissions", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=40)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    print(f"Base de datos: {engine.url.render_as_string(hide_password=True)}")
+    before = run("orm", submit_orm, seed(args.questions), args.submissions, args.questions)
+    after = run("bulk", submit_bulk, seed(args.questions), args.submissions, args.questions)
+    print(f"Mejora: x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
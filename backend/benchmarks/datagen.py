@@ -0,0 +1,100 @@
+# Generador de datos sintéticos para los benchmarks.
+#
+# Crea --evaluations evaluaciones de --questions preguntas (una de cada cinco
+# con selección múltiple) y --attempts intentos por evaluación, calificados y
+# escritos con el mismo camino que POST /submit (submissions.write_attempts):
+# respuestas en el formato de ANSWER_STORAGE y snapshot del examen incluidos;
+# al final se pliegan los resúmenes de estadísticas como haría SummaryFolder. Funciona sobre SQLite o Postgres según
+# DATABASE_URL.
+#
+#   DATABASE_URL=sqlite:///bench.db python benchmarks/datagen.py --evaluations 10 --questions 40 --attempts 2000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select  # noqa: E402
+
+from answer_keys import load_answer_key  # noqa: E402
+from database import Base, SessionLocal, engine  # noqa: E402
+from exam_snapshots import rebuild_snapshot  # noqa: E402
+from models import Attempt, Evaluation, Question  # noqa: E402
+from submissions import grade_submission, write_attempts  # noqa: E402
+from summaries import fold_pending  # noqa: E402
+
+OPTIONS = 4
+
+
+def random_answers(rnd, key, skill):
+    answers = []
+    for correct in key.correct:
+        roll = rnd.random()
+        if roll < skill:
+            answers.append(sorted(correct))
+        elif roll < skill + 0.05:
+            answers.append([])  # sin responder
+        else:
+            answers.append(sorted(rnd.sample(range(OPTIONS), max(len(correct), 1))))
+    return answers
+
+
+def generate(n_evaluations, n_questions, n_attempts, teacher_name="bench", seed=20, chunk=1000) -> list:
+    rnd = random.Random(seed)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    evaluation_ids = []
+    try:
+        for e in range(n_evaluations):
+            ev = Evaluation(title=f"bench-{e}", teacher_name=teacher_name)
+            db.add(ev)
+            db.flush()
+            keys = [sorted(rnd.sample(range(OPTIONS), 2 if i % 5 == 0 else 1)) for i in range(n_questions)]
+            db.execute(insert(Question), [
+                {
+                    "evaluation_id": ev.id,
+                    "text": f"Pregunta {i}",
+                    "options_joined": "||".join("abcd"[:OPTIONS]),
+                    "correct_index": k,
+                    "multiple": len(k) > 1,
+                }
+                for i, k in enumerate(keys)
+            ])
+            rebuild_snapshot(db, ev.id)
+            db.commit()
+
+            key = load_answer_key(db, ev.id)
+            for start in range(0, n_attempts, chunk):
+                graded = [
+                    grade_submission(key, f"estudiante-{i}", random_answers(rnd, key, rnd.random()))
+                    for i in range(start, min(start + chunk, n_attempts))
+                ]
+                write_attempts(db, graded)
+                db.commit()
+            evaluation_ids.append(ev.id)
+        fold_pending(db, 0, db.scalar(select(func.max(Attempt.id))) or 0)
+    finally:
+        db.close()
+    return evaluation_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--evaluations", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--teacher", default="bench")
+    parser.add_argument("--seed", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ids = generate(args.evaluations, args.questions, args.attempts, args.teacher, args.seed)
+    print(f"{len(ids)} evaluaciones x {args.questions} preguntas x {args.attempts} intentos "
+          f"en {time.perf_counter() - start:.1f}s (ids {ids[0]}..{ids[-1]})" if ids else "sin evaluaciones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from answer_keys import normalize_correct
+from models import Attempt, Evaluation, EvaluationSummary, Question, QuestionSummary
+from stats import tail_question_accuracy
+
+# Respuestas mínimas para que una pregunta entre en el ranking de dificultad
+HARDEST_MIN_ANSWERED = 5
+DISTRIBUTION_BUCKETS = 10
+
+
+# DataFrame por columnas a partir de un select Core: con decenas de miles de
+# filas es bastante más rápido que from_records sobre objetos Row
+def _frame(db: Session, stmt, columns):
+    rows = db.connection().execute(stmt).fetchall()
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    return pd.DataFrame(dict(zip(columns, zip(*rows))))
+
+
+def _pct(value):
+    return None if value is None or not np.isfinite(value) else round(float(value), 2)
+
+
+# === Analítica de cohorte: todas las evaluaciones de un docente ===
+# Un número fijo de consultas agregadas (no depende de cuántas evaluaciones
+# haya): resúmenes por evaluación, distribución de puntajes, tendencia por
+# estudiante y preguntas más difíciles. Los puntajes se normalizan a
+# porcentaje con el número de preguntas de cada evaluación.
+def cohort_analytics(db: Session, teacher_name: str, top: int = 10) -> dict:
+    evaluations = _frame(
+        db,
+        select(
+            Evaluation.id,
+            Evaluation.title,
+            func.count(Question.id),
+            EvaluationSummary.folded_attempt_id,
+            select(func.max(Attempt.id)).where(Attempt.evaluation_id == Evaluation.id).scalar_subquery(),
+        )
+        .outerjoin(Question, Question.evaluation_id == Evaluation.id)
+        .outerjoin(EvaluationSummary, EvaluationSummary.evaluation_id == Evaluation.id)
+        .where(Evaluation.teacher_name == teacher_name)
+        .group_by(Evaluation.id, Evaluation.title, EvaluationSummary.folded_attempt_id)
+        .order_by(Evaluation.id),
+        ["evaluation_id", "title", "questions", "folded_attempt_id", "last_attempt_id"],
+    )
+    if evaluations.empty:
+        return {
+            "teacher_name": teacher_name,
+            "total_evaluations": 0,
+            "total_attempts": 0,
+            "avg_score_pct": None,
+            "evaluations": [],
+            "score_distribution": _distribution(pd.DataFrame(columns=["pct", "n"])),
+            "students": {"total": 0, "improving": [], "declining": []},
+            "hardest_questions": [],
+        }
+
+    teacher_evaluations = select(Evaluation.id).where(Evaluation.teacher_name == teacher_name)
+
+    # Puntaje por (evaluación, puntaje): alimenta la distribución y los totales
+    # por evaluación (exactos aunque los resúmenes aún no hayan plegado los
+    # últimos envíos)
+    scores = _frame(
+        db,
+        select(Attempt.evaluation_id, Attempt.score, func.count())
+        .where(Attempt.evaluation_id.in_(teacher_evaluations))
+        .group_by(Attempt.evaluation_id, Attempt.score),
+        ["evaluation_id", "score", "n"],
+    )
+    evaluations = _score_totals(evaluations, scores)
+
+    questions = evaluations.set_index("evaluation_id")["questions"]
+    scores["pct"] = scores["score"] / scores["evaluation_id"].map(questions).replace(0, np.nan) * 100
+
+    evaluations["avg_score"] = evaluations["score_sum"] / evaluations["attempts"].replace(0, np.nan)
+    evaluations["avg_score_pct"] = evaluations["avg_score"] / evaluations["questions"].replace(0, np.nan) * 100
+    total_attempts = int(evaluations["attempts"].sum())
+    weighted = (scores["pct"] * scores["n"]).sum() / scores.loc[scores["pct"].notna(), "n"].sum() if total_attempts else None
+
+    return {
+        "teacher_name": teacher_name,
+        "total_evaluations": len(evaluations),
+        "total_attempts": total_attempts,
+        "avg_score_pct": _pct(weighted),
+        "evaluations": [
+            {
+                "evaluation_id": int(row.evaluation_id),
+                "title": row.title,
+                "questions": int(row.questions),
+                "attempts": int(row.attempts),
+                "avg_score": _pct(row.avg_score),
+                "min_score": None if pd.isna(row.min_score) else int(row.min_score),
+                "max_score": None if pd.isna(row.max_score) else int(row.max_score),
+                "avg_score_pct": _pct(row.avg_score_pct),
+            }
+            for row in evaluations.itertuples(index=False)
+        ],
+        "score_distribution": _distribution(scores),
+        "students": _student_trends(db, teacher_name, evaluations, top),
+        "hardest_questions": _hardest_questions(db, teacher_evaluations, evaluations, top),
+    }
+
+
+def _score_totals(evaluations, scores):
+    evaluations = evaluations.copy()
+    raw = scores.assign(total=scores["score"] * scores["n"]).groupby("evaluation_id").agg(
+        attempts=("n", "sum"), score_sum=("total", "sum"), min_score=("score", "min"), max_score=("score", "max")
+    )
+    for column in raw.columns:
+        values = evaluations["evaluation_id"].map(raw[column])
+        if column in ("attempts", "score_sum"):
+            values = values.fillna(0).astype(np.int64)
+        evaluations[column] = values.to_numpy()
+    return evaluations
+
+
+# Histograma de puntajes en porcentaje, en tramos de 10 puntos
+def _distribution(scores):
+    width = 100 // DISTRIBUTION_BUCKETS
+    counts = np.zeros(DISTRIBUTION_BUCKETS, dtype=np.int64)
+    valid = scores[scores["pct"].notna()] if len(scores) else scores
+    if len(valid):
+        buckets = np.minimum((valid["pct"].to_numpy(dtype=float) // width).astype(np.int64), DISTRIBUTION_BUCKETS - 1)
+        np.add.at(counts, buckets, valid["n"].to_numpy(dtype=np.int64))
+    return [
+        {"range": f"{i * width}-{(i + 1) * width}", "count": int(counts[i])}
+        for i in range(DISTRIBUTION_BUCKETS)
+    ]
+
+
+# === Tendencia por estudiante (agrupado por student_name) ===
+# Pendiente de mínimos cuadrados del porcentaje del estudiante contra el orden
+# de las evaluaciones. Las sumas por estudiante se calculan en la base, así
+# que se transfiere una fila por estudiante y no una por (estudiante,
+# evaluación); la serie completa solo se lee para los que se devuelven.
+def _student_trends(db: Session, teacher_name, evaluations, top):
+    questions = (
+        select(Question.evaluation_id, func.count().label("nq"))
+        .group_by(Question.evaluation_id)
+        .subquery()
+    )
+    ordered = (
+        select(
+            Evaluation.id,
+            (func.row_number().over(order_by=Evaluation.id) - 1).label("x"),
+            questions.c.nq,
+        )
+        .join(questions, questions.c.evaluation_id == Evaluation.id)
+        .where(Evaluation.teacher_name == teacher_name)
+        .subquery()
+    )
+    per_eval = (
+        select(
+            Attempt.student_name,
+            ordered.c.x,
+            (func.avg(Attempt.score) * 100.0 / ordered.c.nq).label("y"),
+        )
+        .join(ordered, ordered.c.id == Attempt.evaluation_id)
+        .group_by(Attempt.student_name, ordered.c.x, ordered.c.nq)
+        .subquery()
+    )
+    sums = _frame(
+        db,
+        select(
+            per_eval.c.student_name,
+            func.count(),
+            func.sum(per_eval.c.x),
+            func.sum(per_eval.c.y),
+            func.sum(per_eval.c.x * per_eval.c.x),
+            func.sum(per_eval.c.x * per_eval.c.y),
+        ).group_by(per_eval.c.student_name),
+        ["student_name", "n", "sx", "sy", "sxx", "sxy"],
+    )
+    if sums.empty:
+        return {"total": 0, "improving": [], "declining": []}
+
+    n, sx, sy, sxx, sxy = (sums[c].astype(float) for c in ("n", "sx", "sy", "sxx", "sxy"))
+    denominator = n * sxx - sx**2
+    sums["slope_pct"] = (n * sxy - sx * sy) / denominator.where(denominator != 0)
+    trending = sums[sums["n"] >= 2].dropna(subset=["slope_pct"])
+    improving = trending[trending["slope_pct"] > 0].nlargest(top, "slope_pct")
+    declining = trending[trending["slope_pct"] < 0].nsmallest(top, "slope_pct")
+
+    series = _student_series(db, teacher_name, evaluations, list(improving["student_name"]) + list(declining["student_name"]))
+
+    def rows(frame):
+        result = []
+        for r in frame.itertuples(index=False):
+            points = series.get(r.student_name, [])
+            result.append({
+                "student_name": r.student_name,
+                "evaluations": int(r.n),
+                "first_pct": points[0]["score_pct"] if points else None,
+                "last_pct": points[-1]["score_pct"] if points else None,
+                "slope_pct": _pct(r.slope_pct),
+                "series": points,
+            })
+        return result
+
+    return {"total": len(sums), "improving": rows(improving), "declining": rows(declining)}
+
+
+# {student_name: [{"evaluation_id", "score_pct"}, ...]} en orden de evaluación
+def _student_series(db: Session, teacher_name, evaluations, names):
+    if not names:
+        return {}
+    questions = dict(zip(evaluations["evaluation_id"], evaluations["questions"]))
+    series = {}
+    for student_name, evaluation_id, avg_score in db.execute(
+        select(Attempt.student_name, Attempt.evaluation_id, func.avg(Attempt.score))
+        .join(Evaluation, Evaluation.id == Attempt.evaluation_id)
+        .where(Evaluation.teacher_name == teacher_name, Attempt.student_name.in_(names))
+        .group_by(Attempt.student_name, Attempt.evaluation_id)
+        .order_by(Attempt.student_name, Attempt.evaluation_id)
+    ):
+        nq = questions.get(evaluation_id, 0)
+        if nq:
+            series.setdefault(student_name, []).append(
+                {"evaluation_id": evaluation_id, "score_pct": _pct(float(avg_score) * 100 / nq)}
+            )
+    return series
+
+
+# Preguntas con menor porcentaje de acierto. Los contadores plegados salen
+# de los resúmenes por pregunta en una consulta; igual que /stats, las
+# evaluaciones sin resumen utilizable (p. ej. antes del backfill) se cuentan
+# desde los intentos y las que tienen envíos aún sin plegar suman esa cola.
+# Las claves y las colas de todas esas evaluaciones se leen juntas: dos
+# consultas más, no dos por evaluación.
+def _hardest_questions(db: Session, teacher_evaluations, evaluations, top):
+    counts = {}  # question_id -> [evaluation_id, texto, respondidas, correctas]
+    for r in db.execute(
+        select(
+            QuestionSummary.question_id,
+            QuestionSummary.evaluation_id,
+            Question.text,
+            QuestionSummary.answered_count,
+            QuestionSummary.correct_count,
+        )
+        .join(Question, Question.id == QuestionSummary.question_id)
+        .where(QuestionSummary.evaluation_id.in_(teacher_evaluations))
+    ):
+        counts[r.question_id] = [r.evaluation_id, r.text, r.answered_count, r.correct_count]
+
+    pending = []
+    for row in evaluations.itertuples(index=False):
+        folded = None if pd.isna(row.folded_attempt_id) else int(row.folded_attempt_id)
+        last = 0 if pd.isna(row.last_attempt_id) else int(row.last_attempt_id)
+        if folded is not None and last <= folded:
+            continue
+        evaluation_id = int(row.evaluation_id)
+        if folded is None:
+            # Filas anteriores a la marca de agua: no se sabe qué cubren
+            for qid in [qid for qid, c in counts.items() if c[0] == evaluation_id]:
+                del counts[qid]
+        pending.append(evaluation_id)
+
+    if pending:
+        questions, keys = {}, []
+        for qid, evaluation_id, text, correct_raw in db.execute(
+            select(Question.id, Question.evaluation_id, Question.text, Question.correct_index)
+            .where(Question.evaluation_id.in_(pending))
+            .order_by(Question.id)
+        ):
+            questions[qid] = (evaluation_id, text)
+            keys.append((qid, normalize_correct(correct_raw)))
+        for qid, (answered, correct) in tail_question_accuracy(db, pending, keys).items():
+            if qid not in questions:
+                continue
+            entry = counts.setdefault(qid, [*questions[qid], 0, 0])
+            entry[2] += answered
+            entry[3] += correct
+
+    ranked = sorted(
+        (c[3] * 100.0 / c[2], qid, c) for qid, c in counts.items() if c[2] >= HARDEST_MIN_ANSWERED
+    )[:top]
+    return [
+        {
+            "question_id": qid,
+            "evaluation_id": c[0],
+            "text": c[1],
+            "answered": c[2],
+            "accuracy_pct": round(accuracy, 2),
+        }
+        for accuracy, qid, c in ranked
+    ]
@@ -1,6 +1,25 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from pool_metrics import (
+    MeteredAsyncQueuePool,
+    MeteredAsyncReplicaQueuePool,
+    MeteredQueuePool,
+    MeteredReplicaQueuePool,
+    instrument,
+)
+from instrumentation import instrument_queries, request_metrics_enabled
+import logging
 import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
 
 # Intentar leer la URL directamente del entorno (Render o local)
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -14,8 +33,42 @@ if not DATABASE_URL:
     DB_NAME = os.getenv("DB_NAME", "edutest")
     DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# === Pool de conexiones ===
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Reciclar conexiones antes de que el proxy/servidor las corte por inactividad
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Detrás de PgBouncer en modo transacción: sin pool propio (lo hace PgBouncer)
+# y, con asyncpg, sin prepared statements cacheados por conexión
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+
+def pool_options(url: str, pool_class) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    if DB_PGBOUNCER:
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+# Crear las tablas faltantes en el startup de la app. Con DB_CREATE_ALL=false
+# el arranque no consulta la base: el esquema se crea con `manage.py migrate`.
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "true").lower() in ("1", "true", "yes")
+
 # Crear el motor SQLAlchemy
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, MeteredQueuePool))
+instrument(engine, MeteredQueuePool.metrics)
+if request_metrics_enabled():
+    instrument_queries(engine)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
@@ -25,3 +78,322 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# === Réplica de lectura (DATABASE_REPLICA_URL, opcional) ===
+# Las rutas de lectura pesadas (stats, intentos, análisis de ítems, exportación
+# y cohorte) leen de la réplica vía get_read_db / get_read_session. Se vuelve al
+# primario si no hay réplica, si el último chequeo de salud falló o la réplica
+# va atrasada más de REPLICA_MAX_LAG_SECONDS, y para leer lo recién escrito.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "5"))
+# Tras escribir en una evaluación, sus lecturas van al primario durante este
+# tiempo: en este proceso (note_write) y para el cliente que envió (cookie)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_PRIMARY_COOKIE = "edutest_read_primary"
+
+replica_engine = None
+ReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(DATABASE_REPLICA_URL, **pool_options(DATABASE_REPLICA_URL, MeteredReplicaQueuePool))
+    instrument(replica_engine, MeteredReplicaQueuePool.metrics)
+    if request_metrics_enabled():
+        instrument_queries(replica_engine)
+    ReplicaSessionLocal = sessionmaker(bind=replica_engine, autocommit=False, autoflush=False)
+
+
+# === Modo async (DB_MODE=async) ===
+# "sync" (por defecto): sesiones síncronas y el trabajo de BD en el threadpool.
+# "async": AsyncEngine con asyncpg (Postgres) o aiosqlite (SQLite); las rutas
+# esperan la BD sin ocupar un hilo por petición.
+DB_MODE = os.getenv("DB_MODE", "sync").lower()
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.drivername.split("+")[0]
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"DB_MODE=async no soporta el motor {parsed.drivername}")
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+async_engine = None
+AsyncSessionLocal = None
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+if DB_MODE == "async":
+    from uuid import uuid4
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    def _async_pool_options(url: str, pool_class) -> dict:
+        options = pool_options(url, pool_class)
+        if DB_PGBOUNCER and make_url(url).get_backend_name() != "sqlite":
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+        return options
+
+    # SQLite admite un solo escritor: con varias conexiones concurrentes las
+    # transacciones que pasan de lectura a escritura fallan con "database is
+    # locked", así que en aiosqlite se serializa sobre una conexión
+    if engine.dialect.name == "sqlite":
+        _async_options = {"poolclass": MeteredAsyncQueuePool, "pool_size": 1, "max_overflow": 0}
+    else:
+        _async_options = _async_pool_options(DATABASE_URL, MeteredAsyncQueuePool)
+    async_engine = create_async_engine(to_async_url(DATABASE_URL), **_async_options)
+    instrument(async_engine.sync_engine, MeteredAsyncQueuePool.metrics)
+    if request_metrics_enabled():
+        instrument_queries(async_engine.sync_engine)
+    # expire_on_commit=False: leer un atributo expirado haría IO implícito,
+    # que no está permitido fuera de un await
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    # La réplica solo recibe lecturas: en SQLite puede usar varias conexiones
+    if DATABASE_REPLICA_URL:
+        async_replica_engine = create_async_engine(
+            to_async_url(DATABASE_REPLICA_URL), **_async_pool_options(DATABASE_REPLICA_URL, MeteredAsyncReplicaQueuePool)
+        )
+        instrument(async_replica_engine.sync_engine, MeteredAsyncReplicaQueuePool.metrics)
+        if request_metrics_enabled():
+            instrument_queries(async_replica_engine.sync_engine)
+        AsyncReplicaSessionLocal = async_sessionmaker(bind=async_replica_engine, autoflush=False, expire_on_commit=False)
+
+
+# Estado de los pools para el endpoint interno de métricas
+def pool_stats() -> dict:
+    stats = {"sync": MeteredQueuePool.metrics.snapshot(engine.pool)}
+    if async_engine is not None:
+        stats["async"] = MeteredAsyncQueuePool.metrics.snapshot(async_engine.pool)
+    if replica_engine is not None:
+        stats["replica"] = {
+            **MeteredReplicaQueuePool.metrics.snapshot(replica_engine.pool),
+            "replica_healthy": int(replica_monitor.healthy),
+            "replica_lag_seconds": replica_monitor.lag_seconds,
+            # Solo la categoría: el mensaje completo (hosts, usuarios) va al log
+            "replica_error": replica_monitor.error_kind,
+        }
+    if async_replica_engine is not None:
+        stats["replica_async"] = MeteredAsyncReplicaQueuePool.metrics.snapshot(async_replica_engine.pool)
+    return stats
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependencia de sesión para las rutas async: AsyncSession en modo async,
+# Session síncrona en modo sync
+get_session = get_async_db if DB_MODE == "async" else get_db
+
+
+# Ejecuta fn(session_sync, *args) sin bloquear el event loop: en modo async vía
+# AsyncSession.run_sync (IO con await), en modo sync en el threadpool. Así la
+# misma función de acceso a datos sirve para ambos modos.
+async def run_db(db, fn, *args):
+    if DB_MODE == "async":
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
+
+
+# === Salud de la réplica ===
+# Un hilo consulta la réplica cada REPLICA_CHECK_SECONDS (fuera del camino de
+# las peticiones). En Postgres mide además el atraso de replicación: 0 si ya
+# aplicó todo lo recibido (una réplica sin escrituras nuevas no está atrasada).
+_HEALTH_SQL = "SELECT 1 FROM evaluations LIMIT 1"
+_LAG_SQL = {
+    "postgresql": (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+}
+
+
+class ReplicaMonitor:
+    def __init__(self, engine, interval: float, max_lag: float):
+        self.engine = engine
+        self.interval = interval
+        self.max_lag = max_lag
+        self.healthy = False
+        self.lag_seconds = None
+        self.last_error = None
+        self.error_kind = None  # "lag" o el nombre de la excepción
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # El primer chequeo es síncrono: la réplica se usa desde la primera petición
+    def start(self):
+        if self.engine is None or self.running:
+            return
+        self.check()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.interval)
+            self._thread = None
+
+    def check(self) -> bool:
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text(_HEALTH_SQL))  # la réplica tiene el esquema
+                lag = conn.execute(text(_LAG_SQL[self.engine.dialect.name])).scalar() if self.engine.dialect.name in _LAG_SQL else 0
+            self.lag_seconds = float(lag or 0)
+            self.last_error = None if self.lag_seconds <= self.max_lag else f"atraso de {self.lag_seconds:.1f}s"
+            self.error_kind = None if self.last_error is None else "lag"
+        except Exception as e:
+            self.lag_seconds = None
+            self.last_error = str(e).splitlines()[0]
+            self.error_kind = type(e).__name__
+        self._set_healthy(self.last_error is None)
+        return self.healthy
+
+    # Una petición no pudo conectarse a la réplica: se deja de usar hasta el
+    # próximo chequeo exitoso
+    def mark_unhealthy(self, error: Exception):
+        self.last_error = str(error).splitlines()[0]
+        self.error_kind = type(error).__name__
+        self._set_healthy(False)
+
+    def _set_healthy(self, healthy: bool):
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Réplica de lectura disponible")
+            else:
+                logger.warning("Réplica de lectura no disponible, se lee del primario: %s", self.last_error)
+        self.healthy = healthy
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+
+replica_monitor = ReplicaMonitor(replica_engine, REPLICA_CHECK_SECONDS, REPLICA_MAX_LAG_SECONDS)
+
+
+# === Read-your-writes ===
+# evaluation_id (str, como llega en la ruta) -> instante hasta el que sus
+# lecturas van al primario en este proceso. Cubre también las cachés (respuestas,
+# claves) que se reconstruyen justo después de invalidarlas en una escritura.
+_recent_writes = {}
+
+
+def note_write(evaluation_id: int):
+    if replica_engine is None:
+        return
+    now = time.monotonic()
+    if len(_recent_writes) > 1024:
+        for key in [k for k, deadline in _recent_writes.items() if deadline <= now]:
+            _recent_writes.pop(key, None)
+    _recent_writes[str(evaluation_id)] = now + READ_YOUR_WRITES_SECONDS
+
+
+# Cookie para el cliente que escribió, limitada a las rutas de esa evaluación
+# (cubre el caso de varios workers, donde note_write es local a cada uno)
+def read_primary_cookie(response, evaluation_id: int):
+    if replica_engine is not None:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, "1",
+            max_age=max(1, round(READ_YOUR_WRITES_SECONDS)),
+            path=f"/evaluations/{evaluation_id}",
+            httponly=True,
+            samesite="lax",
+        )
+
+
+def use_replica(request: Request) -> bool:
+    if not replica_monitor.healthy or request.cookies.get(READ_PRIMARY_COOKIE):
+        return False
+    evaluation_id = request.path_params.get("evaluation_id")
+    if evaluation_id is not None:
+        deadline = _recent_writes.get(str(evaluation_id))
+        if deadline is not None and deadline > time.monotonic():
+            return False
+    return True
+
+
+# Sesión de solo lectura: réplica si corresponde, si no primario. La conexión
+# se abre acá para volver al primario si la réplica no responde.
+def _read_session(request: Request):
+    if replica_engine is not None and use_replica(request):
+        db = ReplicaSessionLocal()
+        try:
+            db.connection()
+            return db
+        except OperationalError as e:
+            db.close()
+            replica_monitor.mark_unhealthy(e)
+    return SessionLocal()
+
+
+def get_read_db(request: Request):
+    db = _read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    db = None
+    if async_replica_engine is not None and use_replica(request):
+        db = AsyncReplicaSessionLocal()
+        try:
+            await db.connection()
+        except OperationalError as e:
+            await db.close()
+            replica_monitor.mark_unhealthy(e)
+            db = None
+    if db is None:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+get_read_session = get_async_read_db if DB_MODE == "async" else get_read_db
+
+
+# True si la sesión (Session o AsyncSession) lee de la réplica
+def is_replica_session(db) -> bool:
+    bind = getattr(db, "sync_session", db).get_bind()
+    if async_replica_engine is not None and bind is async_replica_engine.sync_engine:
+        return True
+    return replica_engine is not None and bind is replica_engine
+
+
+# Sesión del primario del mismo tipo que get_read_session, para rehacer en el
+# primario una lectura que no debe salir de la réplica
+@asynccontextmanager
+async def primary_read_session():
+    if DB_MODE == "async":
+        async with AsyncSessionLocal() as db:
+            yield db
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Fábrica de sesiones del mismo motor que db (para lecturas que siguen después
+# de la petición, como la exportación en streaming)
+def session_factory_for(db):
+    if replica_engine is not None and db.get_bind() is replica_engine:
+        return ReplicaSessionLocal
+    return SessionLocal
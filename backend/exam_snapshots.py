@@ -0,0 +1,90 @@
+import json
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from answer_keys import invalidate_answer_key
+from models import Evaluation, ExamSnapshot, Question
+from summaries import upsert_dialect
+
+
+def snapshot_etag(evaluation_id: int, version: int) -> str:
+    return f'"exam-{evaluation_id}-v{version}"'
+
+
+def _payload(db: Session, evaluation_id: int, version: int) -> bytes:
+    rows = db.execute(
+        select(Question.id, Question.text, Question.options_joined, Question.multiple)
+        .where(Question.evaluation_id == evaluation_id)
+        .order_by(Question.id)
+    ).all()
+    return json.dumps(
+        {
+            "evaluation_id": evaluation_id,
+            "version": version,
+            "questions": [
+                {"id": qid, "text": text, "options": options_joined.split("||"), "multiple": bool(multiple)}
+                for qid, text, options_joined, multiple in rows
+            ],
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _locked_snapshot(db: Session, evaluation_id: int):
+    return db.execute(
+        select(ExamSnapshot).where(ExamSnapshot.evaluation_id == evaluation_id).with_for_update()
+    ).scalar_one_or_none()
+
+
+# Inserta la versión 1 si la evaluación aún no tiene snapshot. Con
+# ON CONFLICT DO NOTHING, si otra transacción la creó a la vez no se inserta
+# nada y devuelve False en lugar de fallar por la clave primaria.
+def _insert_first(db: Session, evaluation_id: int) -> bool:
+    insert_fn, _, _ = upsert_dialect(db)
+    stmt = insert_fn(ExamSnapshot).values(
+        evaluation_id=evaluation_id, version=1, payload=_payload(db, evaluation_id, 1)
+    ).on_conflict_do_nothing(index_elements=[ExamSnapshot.evaluation_id])
+    return bool(db.execute(stmt).rowcount)
+
+
+# === Reconstrucción del snapshot ===
+# Se llama en la misma transacción que modifica las preguntas, antes del
+# commit. La fila del snapshot se bloquea primero (FOR UPDATE en Postgres), así
+# dos cambios concurrentes se serializan y el segundo ve las preguntas del
+# primero. No hace commit.
+def rebuild_snapshot(db: Session, evaluation_id: int) -> int:
+    snapshot = _locked_snapshot(db, evaluation_id)
+    db.flush()  # las preguntas recién agregadas deben entrar en el payload
+
+    if snapshot is None:
+        if _insert_first(db, evaluation_id):
+            return 1
+        # Otra transacción creó la fila primero: se bloquea y se incrementa
+        snapshot = _locked_snapshot(db, evaluation_id)
+
+    version = snapshot.version + 1
+    snapshot.version = version
+    snapshot.payload = _payload(db, evaluation_id, version)
+    return version
+
+
+# (versión, bytes JSON) del snapshot, o None si la evaluación no existe. Las
+# evaluaciones creadas antes de los snapshots lo generan en el primer acceso.
+def get_snapshot(db: Session, evaluation_id: int):
+    row = db.execute(
+        select(ExamSnapshot.version, ExamSnapshot.payload).where(ExamSnapshot.evaluation_id == evaluation_id)
+    ).first()
+    if row is not None:
+        return row.version, row.payload
+
+    if db.get(Evaluation, evaluation_id) is None:
+        return None
+    # Dos primeros accesos concurrentes: uno inserta y el otro relee su fila
+    created = _insert_first(db, evaluation_id)
+    db.commit()
+    if created:
+        # La clave en caché no conocía la versión
+        invalidate_answer_key(evaluation_id)
+    return get_snapshot(db, evaluation_id)
@@ -0,0 +1,214 @@
+import csv
+import io
+import json
+import os
+
+from sqlalchemy import select
+
+from answer_keys import AnswerKey
+from answer_storage import compact_storage, mask_indices
+from database import SessionLocal
+from models import Attempt, AttemptAnswer, AttemptAnswerMask
+
+# Filas leídas del cursor del servidor y filas por bloque emitido
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+# === Lectura en streaming: un intento por vez ===
+# Abre su propia sesión (de session_factory: primario o réplica) porque el
+# generador se consume después de que la dependencia cerró la sesión de la
+# petición. yield_per usa un cursor del lado del servidor (Postgres) y
+# mantiene la memoria acotada al lote.
+def iter_attempts(evaluation_id: int, key: AnswerKey, session_factory=SessionLocal):
+    if compact_storage():
+        answers = AttemptAnswerMask
+        columns = (AttemptAnswerMask.question_id, AttemptAnswerMask.selected_mask, AttemptAnswerMask.is_correct)
+    else:
+        answers = AttemptAnswer
+        columns = (AttemptAnswer.question_id, AttemptAnswer.selected_index)
+
+    db = session_factory()
+    try:
+        stmt = (
+            select(Attempt.id, Attempt.student_name, Attempt.score, *columns)
+            .outerjoin(answers, answers.attempt_id == Attempt.id)
+            .where(Attempt.evaluation_id == evaluation_id)
+            .order_by(Attempt.id)
+        )
+        result = db.connection().execution_options(yield_per=EXPORT_BATCH_SIZE).execute(stmt)
+        if answers is AttemptAnswerMask:
+            yield from _group_compact(result, key)
+        else:
+            yield from _group_rows(result, key)
+    finally:
+        db.close()
+
+
+# Filas (intento, opción marcada) agrupadas por intento
+def _group_rows(result, key: AnswerKey):
+    current = None
+    for attempt_id, student_name, score, question_id, selected_index in result:
+        if current is None or current[0] != attempt_id:
+            if current is not None:
+                yield _attempt_row(current, key)
+            current = (attempt_id, student_name, score, {})
+        if question_id is not None:
+            current[3].setdefault(question_id, set()).add(selected_index)
+    if current is not None:
+        yield _attempt_row(current, key)
+
+
+# La corrección por pregunta se compara como conjuntos, igual que
+# AnswerKey.grade_detail: una pregunta sin respuestas correctas se acierta en
+# blanco, y las columnas q*_correct suman el puntaje
+def _attempt_row(current, key: AnswerKey):
+    attempt_id, student_name, score, selections = current
+    answers = []
+    for qid, correct in zip(key.question_ids, key.correct):
+        selected = sorted(selections.get(qid, ()))
+        answers.append((qid, selected, set(selected) == correct))
+    return attempt_id, student_name, score, answers
+
+
+# Formato compacto: una fila por pregunta respondida, con bitmask y corrección
+def _group_compact(result, key: AnswerKey):
+    current = None
+    for attempt_id, student_name, score, question_id, selected_mask, is_correct in result:
+        if current is None or current[0] != attempt_id:
+            if current is not None:
+                yield _attempt_row_compact(current, key)
+            current = (attempt_id, student_name, score, {})
+        if question_id is not None:
+            current[3][question_id] = (selected_mask, is_correct)
+    if current is not None:
+        yield _attempt_row_compact(current, key)
+
+
+def _attempt_row_compact(current, key: AnswerKey):
+    attempt_id, student_name, score, cells = current
+    answers = []
+    # Sin fila, la pregunta quedó en blanco: acertada solo si la clave es vacía
+    for qid, correct in zip(key.question_ids, key.correct):
+        selected_mask, is_correct = cells.get(qid, (0, not correct))
+        answers.append((qid, mask_indices(selected_mask), bool(is_correct)))
+    return attempt_id, student_name, score, answers
+
+
+def _header(key: AnswerKey):
+    columns = ["attempt_id", "student_name", "score"]
+    for qid in key.question_ids:
+        columns += [f"q{qid}_selected", f"q{qid}_correct"]
+    return columns
+
+
+# === Formatos ===
+def _stream_csv(rows, key):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(_header(key))
+    for n, (attempt_id, student_name, score, answers) in enumerate(rows, start=1):
+        line = [attempt_id, student_name, score]
+        for _, selected, correct in answers:
+            line += ["|".join(map(str, selected)), int(correct)]
+        writer.writerow(line)
+        if n % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def _stream_ndjson(rows, key):
+    chunk = []
+    for attempt_id, student_name, score, answers in rows:
+        chunk.append(json.dumps({
+            "attempt_id": attempt_id,
+            "student_name": student_name,
+            "score": score,
+            "answers": [
+                {"question_id": qid, "selected": selected, "correct": correct}
+                for qid, selected, correct in answers
+            ],
+        }, ensure_ascii=False))
+        if len(chunk) >= EXPORT_BATCH_SIZE:
+            yield ("\n".join(chunk) + "\n").encode("utf-8")
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode("utf-8")
+
+
+# Destino de escritura que se vacía después de cada row group de Parquet
+class _DrainableSink(io.RawIOBase):
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _stream_parquet(rows, key):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [pa.field("attempt_id", pa.int64()), pa.field("student_name", pa.string()), pa.field("score", pa.int64())]
+    for qid in key.question_ids:
+        fields += [pa.field(f"q{qid}_selected", pa.list_(pa.int64())), pa.field(f"q{qid}_correct", pa.bool_())]
+    schema = pa.schema(fields)
+
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def flush(batch):
+        columns = [[r[0] for r in batch], [r[1] for r in batch], [r[2] for r in batch]]
+        for j in range(len(key)):
+            columns.append([r[3][j][1] for r in batch])
+            columns.append([r[3][j][2] for r in batch])
+        writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        return sink.drain()
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield flush(batch)
+            batch = []
+    if batch:
+        yield flush(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(evaluation_id: int, key: AnswerKey, fmt: str, session_factory=SessionLocal):
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportUnavailable("Formato parquet no disponible: instala pyarrow")
+        return _stream_parquet(iter_attempts(evaluation_id, key, session_factory), key)
+    if fmt == "ndjson":
+        return _stream_ndjson(iter_attempts(evaluation_id, key, session_factory), key)
+    return _stream_csv(iter_attempts(evaluation_id, key, session_factory), key)
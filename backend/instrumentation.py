@@ -0,0 +1,313 @@
+import heapq
+import itertools
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Latencia y consultas SQL por ruta, log de peticiones lentas. Apagado no se
+# registra el middleware ni los eventos del motor: costo cero.
+REQUEST_METRICS = os.getenv("REQUEST_METRICS", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+# Sentencias más lentas que se incluyen en el log de una petición lenta
+SLOW_REQUEST_STATEMENTS = int(os.getenv("SLOW_REQUEST_STATEMENTS", "5"))
+# Profiler por muestreo (requiere REQUEST_METRICS): guarda las pilas de las
+# peticiones que superan SLOW_REQUEST_MS en formato "folded" (flamegraph)
+PROFILE_SLOW_REQUESTS = os.getenv("PROFILE_SLOW_REQUESTS", "false").lower() in ("1", "true", "yes")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "edutest-profiles"))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+def request_metrics_enabled() -> bool:
+    return REQUEST_METRICS
+
+
+# === Estado de la petición en curso ===
+# El contextvar se propaga al threadpool (run_in_threadpool) y a run_sync, así
+# que las consultas se atribuyen a la petición que las emitió aunque haya
+# varias en paralelo; las de hilos ajenos (escritor de la cola) no cuentan.
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "slowest")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest = []  # heap de (segundos, sentencia)
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        item = (seconds, statement)
+        if len(self.slowest) < SLOW_REQUEST_STATEMENTS:
+            heapq.heappush(self.slowest, item)
+        elif self.slowest and seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+
+_current_request = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_request.get() is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_request.get()
+    start = getattr(context, "_query_start", None)
+    if stats is not None and start is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+
+# Se llama desde database.py para cada motor (el síncrono subyacente en async)
+def instrument_queries(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# === Registro de métricas por ruta ===
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+
+
+class _RouteMetrics:
+    __slots__ = ("latency", "queries", "db_seconds", "statuses", "slow")
+
+    def __init__(self):
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.queries = _Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.statuses = Counter()
+        self.slow = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def observe(self, method, route, status, seconds, stats: RequestStats, slow: bool):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = _RouteMetrics()
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(stats.queries)
+            metrics.db_seconds += stats.db_seconds
+            metrics.statuses[status] += 1
+            metrics.slow += slow
+
+    def render(self) -> list:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = []
+            _histogram_lines(lines, "edutest_http_request_duration_seconds", "Latencia por ruta", routes, "latency")
+            _histogram_lines(lines, "edutest_http_request_db_queries", "Consultas SQL por petición", routes, "queries")
+            lines += ["# HELP edutest_http_request_db_seconds_total Tiempo en SQL por ruta",
+                      "# TYPE edutest_http_request_db_seconds_total counter"]
+            lines += [f"edutest_http_request_db_seconds_total{_labels(method=m, route=r)} {rm.db_seconds:.6f}"
+                      for (m, r), rm in routes]
+            lines += ["# HELP edutest_http_requests_total Peticiones por ruta y código",
+                      "# TYPE edutest_http_requests_total counter"]
+            lines += [f"edutest_http_requests_total{_labels(method=m, route=r, status=str(s))} {n}"
+                      for (m, r), rm in routes for s, n in sorted(rm.statuses.items())]
+            lines += [f"# HELP edutest_http_slow_requests_total Peticiones sobre {SLOW_REQUEST_MS:g} ms",
+                      "# TYPE edutest_http_slow_requests_total counter"]
+            lines += [f"edutest_http_slow_requests_total{_labels(method=m, route=r)} {rm.slow}" for (m, r), rm in routes]
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(lines, name, help_text, routes, attr):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), rm in routes:
+        h = getattr(rm, attr)
+        cumulative = 0
+        for bound, n in zip(h.buckets, h.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=f'{bound:g}')} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {h.count}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {h.total}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {h.count}")
+
+
+registry = MetricsRegistry()
+
+
+# === Profiler por muestreo ===
+# Un hilo toma sys._current_frames() cada PROFILE_INTERVAL_MS mientras haya
+# peticiones en curso y suma las pilas a cada una. Las muestras son de todo el
+# proceso (hilo del loop y threadpool), así que con peticiones concurrentes un
+# volcado puede incluir trabajo ajeno: pensado para diagnóstico puntual.
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < 128:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+
+    def begin(self) -> Counter:
+        samples = Counter()
+        with self._lock:
+            self._active[id(samples)] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def end(self, samples: Counter):
+        with self._lock:
+            self._active.pop(id(samples), None)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                continue
+            stacks = [
+                _collapse(frame)
+                for ident, frame in sys._current_frames().items()
+                if ident != me and os.path.basename(frame.f_code.co_filename) not in _IDLE_FILES
+            ]
+            for samples in active:
+                samples.update(stacks)
+
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_MS) if PROFILE_SLOW_REQUESTS else None
+_dump_sequence = itertools.count(1)
+
+
+def _dump_profile(samples: Counter, method: str, path: str, elapsed_ms: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    file_path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_dump_sequence)}-{method}-{name}-{elapsed_ms:.0f}ms.folded")
+    with open(file_path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return file_path
+
+
+# === Middleware ASGI ===
+# ASGI puro (no BaseHTTPMiddleware): mide hasta el último byte enviado, incluidas
+# las respuestas en streaming, y no agrega tareas por petición.
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        samples = profiler.begin() if profiler is not None else None
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current_request.reset(token)
+            if samples is not None:
+                profiler.end(samples)
+
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            slow = elapsed * 1000 >= SLOW_REQUEST_MS
+            registry.observe(scope["method"], route_path, status[0], elapsed, stats, slow)
+            if slow:
+                _log_slow_request(scope, status[0], elapsed, stats, samples)
+
+
+def _log_slow_request(scope, status, elapsed, stats: RequestStats, samples):
+    elapsed_ms = elapsed * 1000
+    profile = ""
+    if samples:
+        profile = f", perfil en {_dump_profile(samples, scope['method'], scope['path'], elapsed_ms)}"
+    statements = "".join(
+        f"\n  {seconds * 1000:8.1f} ms  {' '.join(statement.split())[:500]}"
+        for seconds, statement in sorted(stats.slowest, reverse=True)
+    )
+    logger.warning(
+        "Petición lenta: %s %s -> %d en %.0f ms, %d consultas (%.0f ms en SQL)%s%s",
+        scope["method"], scope["path"], status, elapsed_ms, stats.queries, stats.db_seconds * 1000, profile, statements,
+    )
+
+
+# === Exposición en formato de texto de Prometheus ===
+# Incluye el estado de los pools (database.pool_stats) aunque REQUEST_METRICS
+# esté apagado
+def render_metrics(pool_stats: dict) -> str:
+    lines = [
+        "# HELP edutest_request_metrics_enabled 1 si REQUEST_METRICS está activo",
+        "# TYPE edutest_request_metrics_enabled gauge",
+        f"edutest_request_metrics_enabled {int(REQUEST_METRICS)}",
+    ]
+    if REQUEST_METRICS:
+        lines += registry.render()
+
+    by_metric = {}
+    for engine_name, stats in pool_stats.items():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                by_metric.setdefault(key, []).append((engine_name, value))
+    for key, values in sorted(by_metric.items()):
+        name = f"edutest_db_pool_{key}"
+        lines.append(f"# TYPE {name} {'counter' if key.endswith('_total') else 'gauge'}")
+        lines += [f"{name}{_labels(engine=engine_name)} {value}" for engine_name, value in values]
+    return "\n".join(lines) + "\n"
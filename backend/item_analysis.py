@@ -0,0 +1,171 @@
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from answer_keys import AnswerKey
+from answer_storage import MAX_BIT, compact_storage
+from models import Attempt, AttemptAnswer, AttemptAnswerMask
+
+# Fracción de intentos en los grupos superior/inferior (Kelley)
+GROUP_FRACTION = 0.27
+
+
+# === Matriz de respuestas intentos × preguntas en una pasada ===
+# Devuelve los ids de intento (ordenados), la matriz de bitmasks de selección
+# y una matriz booleana con las celdas que tenían índices fuera de rango.
+def build_response_matrix(db: Session, evaluation_id: int, key: AnswerKey):
+    conn = db.connection()
+    attempt_ids = np.array(
+        conn.execute(
+            select(Attempt.id).where(Attempt.evaluation_id == evaluation_id).order_by(Attempt.id)
+        ).scalars().all(),
+        dtype=np.int64,
+    )
+    n_attempts, n_questions = len(attempt_ids), len(key)
+    masks = np.zeros((n_attempts, n_questions), dtype=np.int64)
+    invalid = np.zeros((n_attempts, n_questions), dtype=bool)
+    if n_attempts == 0 or n_questions == 0:
+        return attempt_ids, masks, invalid
+    if compact_storage():
+        return _fill_compact(conn, evaluation_id, key, attempt_ids, masks, invalid)
+
+    rows = conn.execute(
+        select(AttemptAnswer.attempt_id, AttemptAnswer.question_id, AttemptAnswer.selected_index)
+        .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+        .where(Attempt.evaluation_id == evaluation_id)
+    ).fetchall()
+    if not rows:
+        return attempt_ids, masks, invalid
+
+    a, q, s = (np.asarray(col, dtype=np.int64) for col in zip(*rows))
+    question_ids = np.asarray(key.question_ids, dtype=np.int64)  # ordenados por id
+    cols = np.searchsorted(question_ids, q)
+    cols_ok = (cols < n_questions) & (question_ids[np.minimum(cols, n_questions - 1)] == q)
+    a, s, cols = a[cols_ok], s[cols_ok], cols[cols_ok]
+    rows_idx = np.searchsorted(attempt_ids, a)
+
+    bad = (s < 0) | (s >= MAX_BIT)
+    invalid[rows_idx[bad], cols[bad]] = True
+    ok = ~bad
+    np.bitwise_or.at(masks, (rows_idx[ok], cols[ok]), np.left_shift(1, s[ok]))
+    return attempt_ids, masks, invalid
+
+
+# Formato compacto: el bitmask ya viene calculado. Una celda respondida pero
+# incorrecta cuyo bitmask coincide con la clave (o vacío) tenía índices fuera
+# de rango: se marca inválida para que la matriz respete is_correct.
+def _fill_compact(conn, evaluation_id, key, attempt_ids, masks, invalid):
+    rows = conn.execute(
+        select(AttemptAnswerMask.attempt_id, AttemptAnswerMask.question_id,
+               AttemptAnswerMask.selected_mask, AttemptAnswerMask.is_correct)
+        .join(Attempt, Attempt.id == AttemptAnswerMask.attempt_id)
+        .where(Attempt.evaluation_id == evaluation_id)
+    ).fetchall()
+    if not rows:
+        return attempt_ids, masks, invalid
+
+    a, q, m, ok = (np.asarray(col) for col in zip(*rows))
+    a, q, m, ok = a.astype(np.int64), q.astype(np.int64), m.astype(np.int64), ok.astype(bool)
+    n_questions = len(key)
+    question_ids = np.asarray(key.question_ids, dtype=np.int64)
+    cols = np.searchsorted(question_ids, q)
+    cols_ok = (cols < n_questions) & (question_ids[np.minimum(cols, n_questions - 1)] == q)
+    a, m, ok, cols = a[cols_ok], m[cols_ok], ok[cols_ok], cols[cols_ok]
+    rows_idx = np.searchsorted(attempt_ids, a)
+
+    masks[rows_idx, cols] = m
+    key_masks = np.asarray(key.masks, dtype=np.int64)
+    invalid[rows_idx, cols] = ~ok & ((m == 0) | (m == key_masks[cols]))
+    return attempt_ids, masks, invalid
+
+
+def _clean(value, digits=4):
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), digits)
+
+
+# === Indicadores psicométricos sobre la matriz ===
+def analyze_matrix(masks: np.ndarray, invalid: np.ndarray, key: AnswerKey) -> dict:
+    n, k = masks.shape
+    key_masks = np.asarray(key.masks, dtype=np.int64)
+    answered = (masks != 0) | invalid
+    X = ((masks == key_masks) & answered & ~invalid).astype(np.float64)
+    total = X.sum(axis=1)
+
+    # Sin intentos no hay indicadores: todo queda en None
+    if n == 0:
+        empty = np.full(k, np.nan)
+        difficulty = point_biserial = upper = lower = omit_rate = empty
+        option_rates = np.full((MAX_BIT, k), np.nan)
+        max_options = MAX_BIT
+        kr20 = None
+        group = 0
+    else:
+        # Dificultad (proporción de aciertos)
+        difficulty = X.mean(axis=0)
+
+        # Punto-biserial corregida (ítem contra el puntaje del resto de la
+        # prueba) en forma cerrada: para ítems 0/1, var_j = p(1-p) y
+        # cov(X_j, total - X_j) = cov(X_j, total) - var_j; un solo producto
+        # matriz-vector en lugar de materializar la matriz "resto"
+        item_var = difficulty * (1 - difficulty)
+        total_var = total.var()
+        cov_total = X.T @ total / n - difficulty * total.mean()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            point_biserial = (cov_total - item_var) / np.sqrt(item_var * (total_var + item_var - 2 * cov_total))
+
+        # Discriminación por grupos extremos (27% superior menos 27% inferior)
+        group = max(1, int(round(GROUP_FRACTION * n)))
+        order = np.argsort(total, kind="stable")
+        lower = X[order[:group]].mean(axis=0)
+        upper = X[order[-group:]].mean(axis=0)
+
+        # Confiabilidad: KR-20, que para ítems 0/1 es el alfa de Cronbach
+        kr20 = None
+        if k >= 2 and n >= 2 and total_var > 0:
+            kr20 = (k / (k - 1)) * (1 - item_var.sum() / total_var)
+
+        # Distractores: tasa de selección de cada opción por pregunta
+        max_options = min(max(key.option_counts), MAX_BIT) if k else 0
+        option_rates = np.stack(
+            [np.count_nonzero(masks & (1 << i), axis=0) / n for i in range(max_options)]
+        ) if max_options else None
+        omit_rate = (~answered).mean(axis=0)
+
+    items = []
+    for j, qid in enumerate(key.question_ids):
+        items.append({
+            "question_id": qid,
+            "text": key.texts[j],
+            "difficulty": _clean(difficulty[j]),
+            "point_biserial": _clean(point_biserial[j]),
+            "upper_27": _clean(upper[j]),
+            "lower_27": _clean(lower[j]),
+            "discrimination_27": _clean(upper[j] - lower[j]),
+            "omit_rate": _clean(omit_rate[j]),
+            "options": [
+                {
+                    "index": i,
+                    "selection_rate": _clean(option_rates[i, j]) if i < max_options else None,
+                    "is_correct": i in key.correct[j],
+                }
+                for i in range(key.option_counts[j])
+            ],
+        })
+
+    return {
+        "total_attempts": int(n),
+        "total_questions": int(k),
+        "mean_score": _clean(total.mean()) if n else None,
+        # Desviación poblacional, la misma convención que /stats
+        "std_score": _clean(total.std()) if n else None,
+        "reliability": {"kr20": _clean(kr20)},
+        "group_size_27": group,
+        "items": items,
+    }
+
+
+def item_analysis(db: Session, evaluation_id: int, key: AnswerKey) -> dict:
+    _, masks, invalid = build_response_matrix(db, evaluation_id, key)
+    return {"evaluation_id": evaluation_id, **analyze_matrix(masks, invalid, key)}
@@ -1,14 +1,44 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr
-from typing import List
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, EmailStr, ValidationError
+from typing import List, Optional
+from sqlalchemy import case, func, insert
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
-from database import Base, engine, get_db
-from auth import router as auth_router, get_current_user
-from models import User, Evaluation, Question, Attempt, AttemptAnswer
-from analytics import generar_analitica
+from database import (
+    Base,
+    DB_CREATE_ALL,
+    async_engine,
+    async_replica_engine,
+    engine,
+    get_read_db,
+    get_read_session,
+    get_session,
+    note_write,
+    pool_stats,
+    read_primary_cookie,
+    replica_monitor,
+    run_db,
+    session_factory_for,
+)
+from auth import router as auth_router, get_current_user, CurrentUser
+from models import User, Evaluation, Question, Attempt, AttemptAnswer, AttemptAnswerMask
+from stats import MAX_PERCENTILES, evaluation_stats_payload
+# cohort e item_analysis (pandas/numpy) se importan en la primera petición que
+# los usa, no al arrancar el worker
+from export import EXPORT_FORMATS, ExportUnavailable, stream_export
+from response_cache import cached_json_async, etag_matches, evaluations_tag, invalidate, questions_tag, stats_tag
+from answer_keys import get_answer_key, invalidate_answer_key
+from submissions import grade_submission, write_attempts
+from answer_storage import compact_storage
+from question_import import BULK_QUESTIONS_MAX, QuestionImportError, parse_questions
+from exam_snapshots import get_snapshot, rebuild_snapshot, snapshot_etag
+from submission_queue import QueueFull, queued_mode, submission_writer
+from pool_metrics import check_metrics_token
+from instrumentation import PROMETHEUS_CONTENT_TYPE, InstrumentationMiddleware, render_metrics, request_metrics_enabled
+from reports import REPORT_AUTO, report_etag, report_version, report_worker, stored_report
+from summaries import SUMMARY_FOLD_SECONDS, summary_folder
 
 # === CREACIÓN DE LA APP ===
 app = FastAPI(title="EduTest Analytics API")
@@ -20,18 +50,78 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-After-Id", "ETag", "X-Exam-Version", "Location", "X-Report-Version", "X-Report-Job"],
 )
 
+# === INSTRUMENTACIÓN (REQUEST_METRICS=true) ===
+# Latencia y consultas SQL por ruta, log de peticiones lentas y profiler
+# opcional; apagado no agrega ningún costo por petición
+if request_metrics_enabled():
+    app.add_middleware(InstrumentationMiddleware)
+
 @app.options("/{rest_of_path:path}")
 async def preflight_handler(request: Request):
     return {}
 
 # === BASE DE DATOS ===
-Base.metadata.create_all(bind=engine)
+# Una consulta por tabla en cada arranque: en despliegues con autoescalado
+# conviene DB_CREATE_ALL=false y `python manage.py migrate` una vez por release
+@app.on_event("startup")
+def create_tables():
+    if DB_CREATE_ALL:
+        Base.metadata.create_all(bind=engine)
 
 # === ROUTERS ===
 app.include_router(auth_router)
 
+# === COLA DE ENVÍOS (SUBMIT_MODE=queued) ===
+@app.on_event("startup")
+def start_submission_writer():
+    if queued_mode():
+        submission_writer.start()
+
+@app.on_event("shutdown")
+def flush_submission_writer():
+    if queued_mode():
+        submission_writer.stop()
+
+# === PLEGADO DE RESÚMENES (SUMMARY_FOLD_SECONDS) ===
+@app.on_event("startup")
+def start_summary_folder():
+    if SUMMARY_FOLD_SECONDS > 0:
+        summary_folder.start()
+
+@app.on_event("shutdown")
+def stop_summary_folder():
+    summary_folder.stop()
+
+# === REPORTES EN SEGUNDO PLANO ===
+@app.on_event("startup")
+def start_report_worker():
+    if REPORT_AUTO:
+        report_worker.start()
+
+@app.on_event("shutdown")
+def stop_report_worker():
+    report_worker.stop()
+
+# === RÉPLICA DE LECTURA (DATABASE_REPLICA_URL) ===
+@app.on_event("startup")
+def start_replica_monitor():
+    replica_monitor.start()
+
+@app.on_event("shutdown")
+def stop_replica_monitor():
+    replica_monitor.stop()
+
+# === MOTOR ASYNC (DB_MODE=async) ===
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+    if async_replica_engine is not None:
+        await async_replica_engine.dispose()
+
 # ================================
 #       MODELOS Pydantic
 # ================================
@@ -52,6 +142,7 @@ class QuestionCreate(BaseModel):
 class AttemptSubmit(BaseModel):
     student_name: str
     answers: List[List[int]]   # ✅ soporta múltiples selecciones por pregunta
+    version: Optional[int] = None   # versión del examen (GET /exam) con la que se respondió
 
 
 # ================================
@@ -62,9 +153,13 @@ class AttemptSubmit(BaseModel):
 def root():
     return {"message": "EduTest Analytics API with JWT 🔐"}
 
+# Las rutas transaccionales son async: el acceso a datos vive en funciones
+# síncronas (_*) que run_db ejecuta con AsyncSession.run_sync (DB_MODE=async)
+# o en el threadpool (DB_MODE=sync). Las rutas de cómputo pesado
+# (item-analysis, export) siguen siendo síncronas para no bloquear el loop.
+
 # Crear usuario
-@app.post("/users/")
-def create_user(payload: UserCreate, db: Session = Depends(get_db)):
+def _create_user(db: Session, payload: UserCreate):
     exists = db.query(User).filter(User.email == payload.email).first()
     if exists:
         raise HTTPException(status_code=400, detail="Email ya registrado")
@@ -75,33 +170,38 @@ def create_user(payload: UserCreate, db: Session = Depends(get_db)):
     return {"id": u.id, "name": u.name, "email": u.email}
 
 
+@app.post("/users/")
+async def create_user(payload: UserCreate, db: Session = Depends(get_session)):
+    return await run_db(db, _create_user, payload)
+
+
 # Crear evaluación
-@app.post("/evaluations/")
-def create_evaluation(
-    payload: EvaluationCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
-):
-    ev = Evaluation(title=payload.title, teacher_name=current_user.name)
+def _create_evaluation(db: Session, payload: EvaluationCreate, teacher_name: str):
+    ev = Evaluation(title=payload.title, teacher_name=teacher_name)
     db.add(ev)
     db.commit()
     db.refresh(ev)
     return {"id": ev.id, "title": ev.title, "teacher_name": ev.teacher_name}
 
 
-# Agregar pregunta a una evaluación
-@app.post("/evaluations/{evaluation_id}/questions")
-def add_question(
-    evaluation_id: int,
-    payload: QuestionCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+@app.post("/evaluations/")
+async def create_evaluation(
+    payload: EvaluationCreate,
+    db: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
+    created = await run_db(db, _create_evaluation, payload, current_user.name)
+    invalidate(evaluations_tag(created["teacher_name"]))
+    return created
+
+
+# Agregar pregunta a una evaluación
+def _add_question(db: Session, evaluation_id: int, payload: QuestionCreate, role: str):
     ev = db.query(Evaluation).get(evaluation_id)
     if not ev:
         raise HTTPException(status_code=404, detail="Evaluación no encontrada")
 
-    if current_user.role != "teacher":
+    if role != "teacher":
         raise HTTPException(status_code=403, detail="Solo docentes pueden agregar preguntas")
 
     if any(i >= len(payload.options) or i < 0 for i in payload.correct_index):
@@ -115,6 +215,7 @@ def add_question(
         multiple=payload.multiple,
     )
     db.add(q)
+    rebuild_snapshot(db, ev.id)
     db.commit()
     db.refresh(q)
     return {
@@ -126,14 +227,100 @@ def add_question(
     }
 
 
-# Listar preguntas de una evaluación
-@app.get("/evaluations/{evaluation_id}/questions")
-def list_questions(evaluation_id: int, db: Session = Depends(get_db)):
+@app.post("/evaluations/{evaluation_id}/questions")
+async def add_question(
+    evaluation_id: int,
+    payload: QuestionCreate,
+    db: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    created = await run_db(db, _add_question, evaluation_id, payload, current_user.role)
+    invalidate_answer_key(evaluation_id)
+    invalidate(questions_tag(evaluation_id), stats_tag(evaluation_id))
+    note_write(evaluation_id)
+    report_worker.notify_change(evaluation_id)
+    return created
+
+
+# Importación masiva de preguntas (JSON, NDJSON o CSV): todo se valida antes
+# de escribir y se inserta con un INSERT multi-fila en una sola transacción
+def _validate_bulk(items):
+    if not items:
+        raise HTTPException(status_code=400, detail="No se recibieron preguntas")
+    if len(items) > BULK_QUESTIONS_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {BULK_QUESTIONS_MAX} preguntas por importación")
+
+    questions, errors = [], []
+    for n, item in enumerate(items):
+        try:
+            q = QuestionCreate.model_validate(item)
+        except ValidationError as e:
+            errors.append({
+                "index": n,
+                "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()),
+            })
+            continue
+        if any(i >= len(q.options) or i < 0 for i in q.correct_index):
+            errors.append({"index": n, "error": "Índice de respuesta correcta fuera de rango"})
+            continue
+        questions.append(q)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    return questions
+
+
+def _insert_questions(db: Session, evaluation_id: int, questions):
+    if db.query(Evaluation.id).filter(Evaluation.id == evaluation_id).first() is None:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    ids = db.scalars(
+        insert(Question).returning(Question.id, sort_by_parameter_order=True),
+        [
+            {
+                "evaluation_id": evaluation_id,
+                "text": q.text,
+                "options_joined": "||".join(q.options),
+                "correct_index": q.correct_index,
+                "multiple": q.multiple,
+            }
+            for q in questions
+        ],
+    ).all()
+    rebuild_snapshot(db, evaluation_id)
+    db.commit()
+    return ids
+
+
+@app.post("/evaluations/{evaluation_id}/questions:bulk")
+async def add_questions_bulk(
+    evaluation_id: int,
+    request: Request,
+    db: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Solo docentes pueden agregar preguntas")
+
+    try:
+        items = parse_questions(await request.body(), request.headers.get("content-type"))
+    except QuestionImportError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+
+    ids = await run_db(db, _insert_questions, evaluation_id, _validate_bulk(items))
+    invalidate_answer_key(evaluation_id)
+    invalidate(questions_tag(evaluation_id), stats_tag(evaluation_id))
+    note_write(evaluation_id)
+    report_worker.notify_change(evaluation_id)
+    return {"evaluation_id": evaluation_id, "created": len(ids), "ids": ids}
+
+
+# Listar preguntas de una evaluación (cacheada; ETag / If-None-Match)
+def _questions_payload(db: Session, evaluation_id: int):
     ev = db.query(Evaluation).get(evaluation_id)
     if not ev:
         raise HTTPException(status_code=404, detail="Evaluación no encontrada")
 
-    qs = db.query(Question).filter(Question.evaluation_id == evaluation_id).all()
+    qs = db.query(Question).filter(Question.evaluation_id == evaluation_id).order_by(Question.id).all()
     return [
         {
             "id": q.id,
@@ -146,209 +333,392 @@ def list_questions(evaluation_id: int, db: Session = Depends(get_db)):
     ]
 
 
+@app.get("/evaluations/{evaluation_id}/questions")
+async def list_questions(evaluation_id: int, request: Request, db: Session = Depends(get_session)):
+    async def build():
+        return await run_db(db, _questions_payload, evaluation_id)
+
+    return await cached_json_async(request, questions_tag(evaluation_id), build)
+
+
+# Examen para estudiantes: snapshot versionado sin la clave de respuestas,
+# servido como bytes ya serializados con la versión como ETag
+@app.get("/evaluations/{evaluation_id}/exam")
+async def get_exam(evaluation_id: int, request: Request, db: Session = Depends(get_session)):
+    snapshot = await run_db(db, get_snapshot, evaluation_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    version, payload = snapshot
+    etag = snapshot_etag(evaluation_id, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Exam-Version": str(version)}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+
 # Enviar intento de estudiante
+def _write_attempt(db: Session, graded):
+    # Persistencia en un solo viaje: INSERT del intento + INSERT multi-fila
+    # de sus respuestas + commit
+    attempt_id = write_attempts(db, [graded])[0]
+    db.commit()
+    return attempt_id
+
+
 @app.post("/evaluations/{evaluation_id}/submit")
-def submit_attempt(evaluation_id: int, payload: AttemptSubmit, db: Session = Depends(get_db)):
-    qs = db.query(Question).filter(Question.evaluation_id == evaluation_id).order_by(Question.id).all()
-    if not qs:
+async def submit_attempt(
+    evaluation_id: int,
+    payload: AttemptSubmit,
+    response: Response,
+    db: Session = Depends(get_session),
+):
+    key = await run_db(db, get_answer_key, evaluation_id)
+    # La clave en caché puede ser más vieja que el examen que vio el
+    # estudiante (la invalidación es local al worker y el TTL la acota): ante
+    # una versión más nueva o una cantidad de respuestas distinta se recarga
+    # una vez desde la base antes de rechazar
+    newer = payload.version is not None and (key.version is None or payload.version > key.version)
+    if newer or len(payload.answers) != len(key):
+        invalidate_answer_key(evaluation_id)
+        key = await run_db(db, get_answer_key, evaluation_id)
+    if payload.version is not None and payload.version != key.version:
+        raise HTTPException(
+            status_code=409,
+            detail="La evaluación cambió desde que se cargó; vuelve a cargar las preguntas",
+            headers={"X-Exam-Version": str(key.version)},
+        )
+    if not key.question_ids:
         raise HTTPException(status_code=400, detail="La evaluación no tiene preguntas")
-    if len(payload.answers) != len(qs):
+    if len(payload.answers) != len(key):
         raise HTTPException(status_code=400, detail="Cantidad de respuestas no coincide con preguntas")
 
-    score = 0
-    attempt = Attempt(evaluation_id=evaluation_id, student_name=payload.student_name, score=0)
-    db.add(attempt)
-    db.flush()  # obtener el ID del intento
-
-    for q, selected_list in zip(qs, payload.answers):
-        # Normaliza la lista de respuestas seleccionadas
-        if not isinstance(selected_list, list):
-            selected_list = [selected_list]
-
-        # Guarda todas las respuestas seleccionadas
-        for sel in selected_list:
-            ans = AttemptAnswer(
-                attempt_id=attempt.id,
-                question_id=q.id,
-                selected_index=int(sel)
+    # Calificación en memoria contra la clave precompilada
+    graded = grade_submission(key, payload.student_name, payload.answers)
+
+    if queued_mode():
+        # El escritor en segundo plano confirma el intento en el próximo lote
+        try:
+            submission_writer.enqueue(graded)
+        except QueueFull:
+            raise HTTPException(
+                status_code=503,
+                detail="Demasiados envíos en curso, intenta de nuevo",
+                headers={"Retry-After": "1"},
             )
-            db.add(ans)
-
-        # --- Normaliza el campo correct_index ---
-        correct_raw = q.correct_index
-
-        # Caso 1: viene como string tipo "1,2"
-        if isinstance(correct_raw, str):
-            correct_indices = [int(x) for x in correct_raw.split(",") if x.strip().isdigit()]
-
-        # Caso 2: ya es lista de ints o lista dentro de lista
-        elif isinstance(correct_raw, list):
-            # Aplana si es [[1,2]]
-            correct_indices = []
-            for c in correct_raw:
-                if isinstance(c, list):
-                    correct_indices.extend(c)
-                else:
-                    correct_indices.append(int(c))
-
-        # Caso 3: número simple
-        else:
-            correct_indices = [int(correct_raw)]
-
-        # --- Comparación flexible ---
-        if set(map(int, selected_list)) == set(correct_indices):
-            score += 1
-
-    attempt.score = score
-    db.commit()
-    db.refresh(attempt)
+        attempt_id = None
+    else:
+        attempt_id = await run_db(db, _write_attempt, graded)
+        invalidate(stats_tag(evaluation_id))
+    # Las lecturas siguientes de esta evaluación (de este proceso y de este
+    # cliente) van al primario hasta que la réplica alcance la escritura
+    note_write(evaluation_id)
+    read_primary_cookie(response, evaluation_id)
+    report_worker.notify_change(evaluation_id)
 
     return {
-        "attempt_id": attempt.id,
-        "student_name": attempt.student_name,
-        "score": score,
-        "total_questions": len(qs)
+        "attempt_id": attempt_id,
+        "student_name": graded.student_name,
+        "score": graded.score,
+        "total_questions": len(key)
     }
 
 
-# Analítica simple
+# Analítica simple (cacheada hasta el próximo envío o pregunta nueva)
+def _stats_payload(db: Session, evaluation_id: int, percentiles):
+    ev = db.query(Evaluation).get(evaluation_id)
+    if not ev:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    # Estadísticas globales, distribución (histograma) y precisión por pregunta
+    # en consultas agregadas
+    return evaluation_stats_payload(db, evaluation_id, percentiles)
+
+
+# "10,90,99.5" -> (10.0, 90.0, 99.5), sin repetidos y en orden
+def _parse_percentiles(raw: Optional[str]):
+    if not raw:
+        return ()
+    try:
+        values = sorted({float(p) for p in raw.split(",") if p.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles debe ser una lista de números separados por coma")
+    if len(values) > MAX_PERCENTILES or any(not 0 <= p <= 100 for p in values):
+        raise HTTPException(status_code=400, detail=f"Hasta {MAX_PERCENTILES} percentiles entre 0 y 100")
+    return tuple(values)
+
+
 @app.get("/evaluations/{evaluation_id}/stats")
-def evaluation_stats(evaluation_id: int, db: Session = Depends(get_db)):
+async def evaluation_stats(
+    evaluation_id: int,
+    request: Request,
+    percentiles: Optional[str] = Query(None),
+    db: Session = Depends(get_read_session),
+):
+    requested = _parse_percentiles(percentiles)
+
+    async def build(session):
+        return await run_db(session, _stats_payload, evaluation_id, requested)
+
+    variant = ",".join(f"{p:g}" for p in requested)
+    return await cached_json_async(request, stats_tag(evaluation_id), build, variant=variant, session=db)
+
+
+# Análisis de ítems: dificultad, discriminación, confiabilidad y distractores
+@app.get("/evaluations/{evaluation_id}/item-analysis")
+def evaluation_item_analysis(evaluation_id: int, db: Session = Depends(get_read_db)):
+    from item_analysis import item_analysis
+
     ev = db.query(Evaluation).get(evaluation_id)
     if not ev:
         raise HTTPException(status_code=404, detail="Evaluación no encontrada")
 
-    total_attempts = db.query(Attempt).filter(Attempt.evaluation_id == evaluation_id).count()
-    if total_attempts == 0:
-        return {
-            "total_attempts": 0,
-            "avg_score": 0,
-            "max_score": 0,
-            "min_score": 0,
-            "per_question_accuracy": []
-        }
+    return item_analysis(db, evaluation_id, get_answer_key(db, evaluation_id))
 
-    # === Cálculos globales ===
-    avg_score = db.query(func.avg(Attempt.score)).filter(Attempt.evaluation_id == evaluation_id).scalar() or 0
-    max_score = db.query(func.max(Attempt.score)).filter(Attempt.evaluation_id == evaluation_id).scalar() or 0
-    min_score = db.query(func.min(Attempt.score)).filter(Attempt.evaluation_id == evaluation_id).scalar() or 0
 
-    # === Calcular precisión por pregunta ===
-    qs = db.query(Question).filter(Question.evaluation_id == evaluation_id).all()
-    per_question_accuracy = []
+# Pares de intentos con demasiadas respuestas incorrectas idénticas (posible
+# copia). Recorre todos los pares con productos de matrices por bloques; alpha
+# acota la probabilidad de marcar algún par sin copia entre todos los
+# comparados. Los intentos de un mismo estudiante no se comparan salvo
+# same_student=true.
+@app.get("/evaluations/{evaluation_id}/similarity")
+def evaluation_similarity(
+    evaluation_id: int,
+    alpha: float = Query(0.01, gt=0, le=0.5),
+    min_identical: int = Query(3, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+    same_student: bool = Query(False),
+    db: Session = Depends(get_read_db),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    from similarity import similarity_analysis
 
-    for q in qs:
-        answers = (
-            db.query(AttemptAnswer)
-            .join(Attempt)
-            .filter(Attempt.evaluation_id == evaluation_id, AttemptAnswer.question_id == q.id)
-            .all()
-        )
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Solo docentes pueden ver el análisis de similitud")
 
-        total_respondieron = len(set(a.attempt_id for a in answers))
-        if total_respondieron == 0:
-            accuracy_pct = 0.0
-        else:
-            correct_count = 0
-
-            # Normaliza el campo correct_index
-            correct_raw = q.correct_index
-            if isinstance(correct_raw, str):
-                correct_indices = [int(x) for x in correct_raw.split(",") if x.strip().isdigit()]
-            elif isinstance(correct_raw, list):
-                correct_indices = []
-                for c in correct_raw:
-                    if isinstance(c, list):
-                        correct_indices.extend(c)
-                    else:
-                        correct_indices.append(int(c))
-            else:
-                correct_indices = [int(correct_raw)]
-
-            # Agrupa respuestas por intento
-            attempts_dict = {}
-            for ans in answers:
-                attempts_dict.setdefault(ans.attempt_id, []).append(ans.selected_index)
-
-            # Calcula precisión
-            for selected_list in attempts_dict.values():
-                if set(selected_list) == set(correct_indices):
-                    correct_count += 1
-
-            accuracy_pct = round((correct_count / total_respondieron) * 100, 2)
-
-        per_question_accuracy.append({
-            "question_id": q.id,
-            "text": q.text,
-            "accuracy_pct": accuracy_pct
-        })
+    ev = db.query(Evaluation).get(evaluation_id)
+    if not ev:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
 
-    return {
-        "total_attempts": total_attempts,
-        "avg_score": round(float(avg_score), 2),
-        "max_score": int(max_score),
-        "min_score": int(min_score),
-        "per_question_accuracy": per_question_accuracy
+    return similarity_analysis(
+        db, evaluation_id, get_answer_key(db, evaluation_id), alpha, min_identical, limit, same_student
+    )
+
+
+# === REPORTES PRECALCULADOS ===
+# Analítica completa + análisis de ítems calculados en un proceso aparte (tras
+# REPORT_QUIET_SECONDS sin envíos, o a pedido). Si el reporte guardado está al
+# día se sirve tal cual; si no, se encola un cálculo y se responde 202 con el
+# job a consultar. allow_stale=true sirve igual el reporte viejo mientras tanto.
+def _report_state(db: Session, evaluation_id: int):
+    if db.get(Evaluation, evaluation_id) is None:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+    return stored_report(db, evaluation_id), report_version(db, evaluation_id)
+
+
+def _report_accepted(job):
+    return JSONResponse(status_code=202, content=job.as_dict(), headers={"Location": f"/reports/jobs/{job.id}"})
+
+
+@app.get("/evaluations/{evaluation_id}/report")
+async def evaluation_report(
+    evaluation_id: int,
+    request: Request,
+    allow_stale: bool = Query(False),
+    db: Session = Depends(get_session),
+):
+    stored, version = await run_db(db, _report_state, evaluation_id)
+    if stored is None or (stored.version != version and not allow_stale):
+        return _report_accepted(report_worker.submit(evaluation_id))
+
+    headers = {
+        "ETag": report_etag(evaluation_id, stored.version),
+        "Cache-Control": "no-cache",
+        "X-Report-Version": stored.version,
     }
+    if stored.version != version:
+        headers["X-Report-Job"] = report_worker.submit(evaluation_id).id
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=stored.payload, media_type="application/json", headers=headers)
+
+
+@app.post("/evaluations/{evaluation_id}/report")
+async def refresh_report(
+    evaluation_id: int,
+    db: Session = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Solo docentes pueden recalcular reportes")
+    await run_db(db, _report_state, evaluation_id)
+    return _report_accepted(report_worker.submit(evaluation_id))
+
+
+@app.get("/reports/jobs/{job_id}")
+def report_job(job_id: str):
+    job = report_worker.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job.as_dict()
+
+
+# Exportar intentos y respuestas (CSV, NDJSON o Parquet) en streaming
+@app.get("/evaluations/{evaluation_id}/export")
+def export_attempts(
+    evaluation_id: int,
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson|parquet)$"),
+    db: Session = Depends(get_read_db),
+):
+    ev = db.query(Evaluation).get(evaluation_id)
+    if not ev:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    try:
+        body = stream_export(evaluation_id, get_answer_key(db, evaluation_id), fmt, session_factory_for(db))
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="evaluacion_{evaluation_id}.{fmt}"'},
+    )
+
+
+def _evaluations_payload(db: Session, teacher_name: str):
+    evaluations = db.query(Evaluation).filter(Evaluation.teacher_name == teacher_name).all()
+    return [{"id": ev.id, "title": ev.title, "teacher_name": ev.teacher_name} for ev in evaluations]
 
 
 @app.get("/evaluations/")
-def list_evaluations(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def list_evaluations(request: Request, db: Session = Depends(get_session), current_user: CurrentUser = Depends(get_current_user)):
     if current_user.role != "teacher":
         raise HTTPException(status_code=403, detail="Solo docentes pueden listar evaluaciones")
-    evaluations = db.query(Evaluation).filter(Evaluation.teacher_name == current_user.name).all()
-    return [{"id": ev.id, "title": ev.title, "teacher_name": ev.teacher_name} for ev in evaluations]
+
+    async def build():
+        return await run_db(db, _evaluations_payload, current_user.name)
+
+    return await cached_json_async(request, evaluations_tag(current_user.name), build)
+
+
+# === ANALÍTICA DE COHORTE ===
+# Todas las evaluaciones del docente en un número fijo de consultas. Comparte
+# la etiqueta del listado (se invalida al crear evaluaciones); los intentos
+# nuevos se reflejan al vencer el TTL de la caché.
+@app.get("/cohort/analytics")
+async def cohort_analytics_view(
+    request: Request,
+    top: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_read_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    if current_user.role != "teacher":
+        raise HTTPException(status_code=403, detail="Solo docentes pueden ver la analítica de cohorte")
+    from cohort import cohort_analytics
+
+    async def build(session):
+        return await run_db(session, cohort_analytics, current_user.name, top)
+
+    return await cached_json_async(
+        request, evaluations_tag(current_user.name), build, variant=f"cohort:{top}", session=db
+    )
+
 
 # Listar intentos de estudiantes con detalles
-@app.get("/evaluations/{evaluation_id}/attempts")
-def list_attempts(evaluation_id: int, db: Session = Depends(get_db)):
-    attempts = (
-        db.query(Attempt)
-        .filter(Attempt.evaluation_id == evaluation_id)
-        .order_by(Attempt.id.desc())
+# Paginación por cursor (keyset): `after_id` es el último attempt_id recibido
+# y la siguiente página trae los intentos con id menor, en orden descendente.
+# {attempt_id: (correctas, respondidas)} para los intentos en [first_id, last_id]
+def _answer_counts(db: Session, evaluation_id: int, first_id: int, last_id: int):
+    if compact_storage():
+        rows = (
+            db.query(
+                AttemptAnswerMask.attempt_id,
+                func.sum(case((AttemptAnswerMask.is_correct, 1), else_=0)),
+                func.count(),
+            )
+            .join(Attempt, Attempt.id == AttemptAnswerMask.attempt_id)
+            .filter(Attempt.evaluation_id == evaluation_id, AttemptAnswerMask.attempt_id.between(first_id, last_id))
+            .group_by(AttemptAnswerMask.attempt_id)
+            .all()
+        )
+        return {attempt_id: (int(correct or 0), total) for attempt_id, correct, total in rows}
+
+    answers = (
+        db.query(AttemptAnswer.attempt_id, AttemptAnswer.question_id, AttemptAnswer.selected_index)
+        .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+        .filter(Attempt.evaluation_id == evaluation_id, AttemptAnswer.attempt_id.between(first_id, last_id))
         .all()
     )
+
+    # Clave de respuestas de la evaluación (caché en memoria)
+    key = get_answer_key(db, evaluation_id)
+
+    # Agrupa selecciones por (intento, pregunta) en una pasada
+    selections = {}
+    for attempt_id, question_id, selected_index in answers:
+        selections.setdefault(attempt_id, {}).setdefault(question_id, set()).add(selected_index)
+
+    counts = {}
+    for attempt_id, per_question in selections.items():
+        correct = sum(1 for qid, selected in per_question.items() if selected == key.correct_for(qid))
+        counts[attempt_id] = (correct, len(per_question))
+    return counts
+
+
+def _attempts_page(db: Session, evaluation_id: int, after_id: Optional[int], limit: Optional[int]):
+    query = db.query(Attempt.id, Attempt.student_name, Attempt.score).filter(Attempt.evaluation_id == evaluation_id)
+    if after_id is not None:
+        query = query.filter(Attempt.id < after_id)
+    query = query.order_by(Attempt.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    attempts = query.all()
     if not attempts:
-        return []
+        return [], None
+
+    # Aciertos y preguntas respondidas de toda la página en una sola consulta
+    counts = _answer_counts(db, evaluation_id, attempts[-1].id, attempts[0].id)
 
     data = []
     for a in attempts:
-        # Obtener respuestas de ese intento
-        answers = db.query(AttemptAnswer).filter(AttemptAnswer.attempt_id == a.id).all()
-
-        correct = 0
-        incorrect = 0
-        total = len(set(ans.question_id for ans in answers))
-
-        for qid in set(ans.question_id for ans in answers):
-            question = db.query(Question).get(qid)
-            selected = [ans.selected_index for ans in answers if ans.question_id == qid]
-
-            # Normalizar correct_index igual que en submit_attempt
-            correct_raw = question.correct_index
-            if isinstance(correct_raw, str):
-                correct_indices = [int(x) for x in correct_raw.split(",") if x.strip().isdigit()]
-            elif isinstance(correct_raw, list):
-                correct_indices = []
-                for c in correct_raw:
-                    if isinstance(c, list):
-                        correct_indices.extend(c)
-                    else:
-                        correct_indices.append(int(c))
-            else:
-                correct_indices = [int(correct_raw)]
-
-            if set(selected) == set(correct_indices):
-                correct += 1
-            else:
-                incorrect += 1
-
+        correct, total = counts.get(a.id, (0, 0))
         data.append({
+            "attempt_id": a.id,
             "student_name": a.student_name,
             "score": a.score,
             "correct": correct,
-            "incorrect": incorrect,
+            "incorrect": total - correct,
             "total": total
         })
 
-    return data
\ No newline at end of file
+    next_after_id = attempts[-1].id if limit is not None and len(attempts) == limit else None
+    return data, next_after_id
+
+
+@app.get("/evaluations/{evaluation_id}/attempts")
+async def list_attempts(
+    evaluation_id: int,
+    response: Response,
+    after_id: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(get_read_session),
+):
+    data, next_after_id = await run_db(db, _attempts_page, evaluation_id, after_id, limit)
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
+    return data
+
+
+# === MÉTRICAS INTERNAS ===
+# Estado del pool de conexiones (exige METRICS_TOKEN; cerrado si no está definido
+# salvo METRICS_PUBLIC=true)
+@app.get("/internal/pool", dependencies=[Depends(check_metrics_token)], include_in_schema=False)
+def internal_pool_stats():
+    return pool_stats()
+
+
+# Formato de texto de Prometheus: métricas por ruta (REQUEST_METRICS) y pools
+@app.get("/metrics", dependencies=[Depends(check_metrics_token)], include_in_schema=False)
+def prometheus_metrics():
+    return Response(render_metrics(pool_stats()), media_type=PROMETHEUS_CONTENT_TYPE)
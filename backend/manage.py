@@ -0,0 +1,94 @@
+# Comandos de mantenimiento del backend.
+#
+#   python manage.py rebuild-summaries                 # todas las evaluaciones
+#   python manage.py rebuild-summaries --evaluation 7  # solo una
+#   python manage.py migrate                           # tablas e índices faltantes
+#   python manage.py compact-answers [--drop-rows]     # attempt_answers -> formato compacto
+
+import argparse
+
+from sqlalchemy import inspect, text
+
+from database import Base, SessionLocal, engine
+
+
+def rebuild_summaries(args):
+    from summaries import rebuild
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        total = rebuild(db, args.evaluation or None)
+    finally:
+        db.close()
+    print(f"Resúmenes reconstruidos para {total} evaluación(es)")
+
+
+# create_all solo crea tablas nuevas: las columnas (siempre anulables) y los
+# índices agregados a tablas que ya existen se crean aparte
+def migrate(args):
+    import models  # noqa: F401  (registra las tablas en Base.metadata)
+
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    added = created = 0
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    added += 1
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                created += 1
+    print(f"Esquema al día ({added} columna(s) y {created} índice(s) creados)")
+
+
+def compact_answers(args):
+    from answer_storage import compact_evaluation
+    from models import Evaluation
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        evaluation_ids = args.evaluation or [eid for (eid,) in db.query(Evaluation.id).order_by(Evaluation.id)]
+        total = 0
+        for eid in evaluation_ids:
+            total += compact_evaluation(db, eid, drop_rows=args.drop_rows)
+            db.commit()
+    finally:
+        db.close()
+    print(f"{total} intento(s) de {len(evaluation_ids)} evaluación(es) migrados a attempt_answer_masks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos de mantenimiento de EduTest Analytics")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_cmd = commands.add_parser(
+        "rebuild-summaries", help="Recalcula los resúmenes de estadísticas desde los datos crudos"
+    )
+    rebuild_cmd.add_argument("--evaluation", type=int, action="append", help="ID de evaluación (repetible)")
+    rebuild_cmd.set_defaults(func=rebuild_summaries)
+
+    migrate_cmd = commands.add_parser("migrate", help="Crea tablas e índices faltantes en una base existente")
+    migrate_cmd.set_defaults(func=migrate)
+
+    compact_cmd = commands.add_parser(
+        "compact-answers", help="Copia attempt_answers al formato compacto (usar con ANSWER_STORAGE=compact)"
+    )
+    compact_cmd.add_argument("--evaluation", type=int, action="append", help="ID de evaluación (repetible)")
+    compact_cmd.add_argument("--drop-rows", action="store_true", help="Borra las filas originales ya migradas")
+    compact_cmd.set_defaults(func=compact_answers)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Text, Boolean, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 from sqlalchemy.dialects.postgresql import JSON
@@ -36,6 +36,9 @@ class Question(Base):
 
     evaluation = relationship("Evaluation", back_populates="questions")
 
+    # Preguntas de una evaluación en orden de id (clave de respuestas, listado)
+    __table_args__ = (Index("ix_questions_evaluation_id_id", "evaluation_id", "id"),)
+
     def options(self):
         return self.options_joined.split("||")
 
@@ -50,6 +53,9 @@ class Attempt(Base):
     evaluation = relationship("Evaluation", back_populates="attempts")
     answers = relationship("AttemptAnswer", back_populates="attempt", cascade="all, delete-orphan")
 
+    # Filtro por evaluación + orden/rango por id (paginación por cursor, joins)
+    __table_args__ = (Index("ix_attempts_evaluation_id_id", "evaluation_id", "id"),)
+
 # Respuesta por pregunta dentro de un intento
 class AttemptAnswer(Base):
     __tablename__ = "attempt_answers"
@@ -59,3 +65,64 @@ class AttemptAnswer(Base):
     selected_index = Column(Integer, nullable=False)  # índice que eligió el estudiante
 
     attempt = relationship("Attempt", back_populates="answers")
+
+    __table_args__ = (
+        Index("ix_attempt_answers_attempt_id_question_id", "attempt_id", "question_id"),
+        Index("ix_attempt_answers_question_id", "question_id"),
+    )
+
+# Almacenamiento compacto (ANSWER_STORAGE=compact): una fila por (intento,
+# pregunta respondida) con la selección como bitmask (bit i = opción i) y la
+# corrección calculada al calificar
+class AttemptAnswerMask(Base):
+    __tablename__ = "attempt_answer_masks"
+    attempt_id = Column(Integer, ForeignKey("attempts.id", ondelete="CASCADE"), primary_key=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    selected_mask = Column(BigInteger, nullable=False)
+    is_correct = Column(Boolean, nullable=False)
+
+# Versión publicada de una evaluación para estudiantes: preguntas ordenadas
+# por id, sin la clave de respuestas, ya serializadas como JSON
+class ExamSnapshot(Base):
+    __tablename__ = "exam_snapshots"
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+
+# Reporte de analítica precalculado en segundo plano (JSON serializado) con la
+# versión de los datos con que se calculó: "versión del examen-último intento"
+class AnalyticsReport(Base):
+    __tablename__ = "analytics_reports"
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(String, nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+
+# Resumen incremental por evaluación. Cubre los intentos con id <=
+# folded_attempt_id (marca de agua que avanza summaries.fold); NULL en filas
+# anteriores a la marca de agua, que se reconstruyen al plegar.
+class EvaluationSummary(Base):
+    __tablename__ = "evaluation_summaries"
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete="CASCADE"), primary_key=True)
+    attempt_count = Column(Integer, nullable=False, default=0)
+    score_sum = Column(BigInteger, nullable=False, default=0)
+    score_sq_sum = Column(BigInteger, nullable=False, default=0)  # para la desviación estándar
+    min_score = Column(Integer, nullable=True)
+    max_score = Column(Integer, nullable=True)
+    folded_attempt_id = Column(Integer, nullable=True)
+
+# Histograma de puntajes por evaluación: un contador por puntaje entero
+# (0..n_preguntas). Se pliega por tramos igual que los resúmenes, así que dos
+# histogramas parciales se combinan sumando contadores.
+class ScoreHistogram(Base):
+    __tablename__ = "score_histograms"
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Integer, primary_key=True)
+    attempt_count = Column(Integer, nullable=False, default=0)
+
+# Resumen incremental por pregunta
+class QuestionSummary(Base):
+    __tablename__ = "question_summaries"
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), primary_key=True)
+    evaluation_id = Column(Integer, ForeignKey("evaluations.id", ondelete="CASCADE"), nullable=False, index=True)
+    answered_count = Column(Integer, nullable=False, default=0)  # intentos que marcaron alguna opción
+    correct_count = Column(Integer, nullable=False, default=0)
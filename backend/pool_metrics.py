@@ -0,0 +1,139 @@
+import hmac
+import os
+import threading
+import time
+
+from fastapi import Header, HTTPException
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Ventana (segundos) para calcular checkouts por segundo
+POOL_METRICS_WINDOW = 60
+# Los endpoints internos (/internal/pool, /metrics) exigen el header
+# X-Metrics-Token; sin METRICS_TOKEN quedan cerrados salvo METRICS_PUBLIC=true
+# (p. ej. en desarrollo o detrás de una red privada)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "false").lower() in ("1", "true", "yes")
+
+
+# === Contadores de un pool ===
+# checkouts/s se calcula con un anillo de contadores por segundo, así el costo
+# por checkout es constante y la memoria no depende del tráfico.
+class PoolMetrics:
+    def __init__(self, window: int = POOL_METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._seconds = [0] * window
+        self._counts = [0] * window
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.acquires = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self):
+        second = int(time.monotonic())
+        slot = second % self.window
+        with self._lock:
+            if self._seconds[slot] != second:
+                self._seconds[slot] = second
+                self._counts[slot] = 0
+            self._counts[slot] += 1
+            self.checkouts += 1
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.acquires += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def checkouts_per_second(self) -> float:
+        now = int(time.monotonic())
+        with self._lock:
+            recent = sum(c for s, c in zip(self._seconds, self._counts) if now - self.window < s <= now)
+        return recent / self.window
+
+    def snapshot(self, pool) -> dict:
+        stats = {
+            "pool_class": type(pool).__name__,
+            "checkouts_total": self.checkouts,
+            "checkouts_per_second": round(self.checkouts_per_second(), 3),
+            "connects_total": self.connects,
+            "invalidations_total": self.invalidations,
+            "timeouts_total": self.timeouts,
+            "wait_ms_avg": round(self.wait_total / self.acquires * 1000, 3) if self.acquires else None,
+            "wait_ms_max": round(self.wait_max * 1000, 3) if self.acquires else None,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+            })
+        return stats
+
+
+# === Pools medidos ===
+# connect() cubre la espera en la cola, la creación de conexiones nuevas y el
+# pre-ping: el tiempo total hasta tener una conexión usable. Las métricas son
+# atributo de clase porque Pool.recreate() (dispose) instancia la misma clase
+# sin argumentos extra; hay una clase por motor.
+class _MeteredConnect:
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeout:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+
+class MeteredQueuePool(_MeteredConnect, QueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredAsyncQueuePool(_MeteredConnect, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredReplicaQueuePool(_MeteredConnect, QueuePool):
+    metrics = PoolMetrics()
+
+
+class MeteredAsyncReplicaQueuePool(_MeteredConnect, AsyncAdaptedQueuePool):
+    metrics = PoolMetrics()
+
+
+# Checkouts, conexiones nuevas e invalidaciones (p. ej. pre-ping fallido)
+# vía eventos; funciona con cualquier clase de pool, incluida NullPool
+def instrument(sync_engine, metrics: PoolMetrics):
+    event.listen(sync_engine, "checkout", lambda *_: metrics.record_checkout())
+    event.listen(sync_engine, "connect", lambda *_: metrics.record_connect())
+    event.listen(sync_engine, "invalidate", lambda *_: metrics.record_invalidation())
+    event.listen(sync_engine, "soft_invalidate", lambda *_: metrics.record_invalidation())
+
+
+def check_metrics_token(x_metrics_token: str = Header(None)):
+    if METRICS_TOKEN:
+        if not hmac.compare_digest((x_metrics_token or "").encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="Token de métricas inválido")
+    elif not METRICS_PUBLIC:
+        raise HTTPException(status_code=403, detail="Métricas deshabilitadas: define METRICS_TOKEN")
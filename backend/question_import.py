@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+import os
+import re
+
+# Máximo de preguntas por importación masiva
+BULK_QUESTIONS_MAX = int(os.getenv("BULK_QUESTIONS_MAX", "1000"))
+
+
+class QuestionImportError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors  # [{"index": n, "error": "..."}]
+
+
+# === Decodificación del cuerpo: JSON (arreglo), NDJSON o CSV ===
+# Devuelve una lista de dicts con las claves de QuestionCreate; la validación
+# de tipos y rangos la hace la ruta sobre la lista completa.
+def parse_questions(body: bytes, content_type: str) -> list:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise QuestionImportError([{"index": None, "error": "El cuerpo debe estar en UTF-8"}])
+
+    if content_type == "text/csv":
+        return _parse_csv(text)
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        return _parse_ndjson(text)
+    try:
+        items = json.loads(text)
+    except ValueError as e:
+        raise QuestionImportError([{"index": None, "error": f"JSON inválido: {e}"}])
+    if not isinstance(items, list):
+        raise QuestionImportError([{"index": None, "error": "Se esperaba un arreglo JSON de preguntas"}])
+    return items
+
+
+def _parse_ndjson(text: str) -> list:
+    items, errors = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            errors.append({"index": len(items) + len(errors), "error": f"JSON inválido: {e}"})
+    if errors:
+        raise QuestionImportError(errors)
+    return items
+
+
+# CSV con encabezado: text, options (separadas por "||", como en la base),
+# correct_index ("1" o "0,2") y multiple opcional (true/false/1/0)
+def _parse_csv(text: str) -> list:
+    reader = csv.DictReader(io.StringIO(text))
+    missing = {"text", "options", "correct_index"} - set(reader.fieldnames or ())
+    if missing:
+        raise QuestionImportError([{"index": None, "error": f"Faltan columnas: {', '.join(sorted(missing))}"}])
+
+    items, errors = [], []
+    for n, row in enumerate(reader):
+        try:
+            correct = [int(x) for x in re.split(r"[,;|]", row["correct_index"] or "") if x.strip()]
+        except ValueError:
+            errors.append({"index": n, "error": "correct_index debe ser una lista de enteros"})
+            continue
+        items.append({
+            "text": row["text"],
+            "options": (row["options"] or "").split("||"),
+            "correct_index": correct,
+            "multiple": (row.get("multiple") or "").strip().lower() in ("1", "true", "yes", "si", "sí"),
+        })
+    if errors:
+        raise QuestionImportError(errors)
+    return items
@@ -0,0 +1,237 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from answer_keys import get_answer_key, invalidate_answer_key
+from database import SessionLocal
+from models import AnalyticsReport, Attempt, ExamSnapshot
+from summaries import upsert_dialect
+
+logger = logging.getLogger(__name__)
+
+# Procesos del pool que calculan los reportes (fuera del GIL del servidor web)
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "1"))
+# Segundos sin envíos nuevos antes de recalcular automáticamente un reporte
+REPORT_QUIET_SECONDS = float(os.getenv("REPORT_QUIET_SECONDS", "30"))
+REPORT_AUTO = os.getenv("REPORT_AUTO", "true").lower() in ("1", "true", "yes")
+# Jobs terminados que se recuerdan para GET /reports/jobs/{id}
+REPORT_JOBS_MAX = 1000
+
+
+# === Versión de los datos ===
+# "versión del examen-último intento": cambia con cada pregunta agregada y con
+# cada envío, así que un reporte guardado con la versión actual está al día.
+def report_version(db: Session, evaluation_id: int) -> str:
+    exam_version = db.scalar(select(ExamSnapshot.version).where(ExamSnapshot.evaluation_id == evaluation_id))
+    last_attempt = db.scalar(select(func.max(Attempt.id)).where(Attempt.evaluation_id == evaluation_id))
+    return f"{exam_version or 0}-{last_attempt or 0}"
+
+
+def report_etag(evaluation_id: int, version: str) -> str:
+    return f'"report-{evaluation_id}-{version}"'
+
+
+# (versión, bytes JSON) del último reporte calculado, o None
+def stored_report(db: Session, evaluation_id: int):
+    return db.execute(
+        select(AnalyticsReport.version, AnalyticsReport.payload).where(AnalyticsReport.evaluation_id == evaluation_id)
+    ).first()
+
+
+def _json_default(value):
+    if hasattr(value, "item"):  # escalares de numpy
+        return value.item()
+    raise TypeError(f"{type(value).__name__} no es serializable")
+
+
+# === Cálculo (se ejecuta en un proceso del pool) ===
+# Abre su propia sesión; la versión se lee antes de calcular, así un envío que
+# llegue durante el cálculo deja el reporte marcado como desactualizado.
+def compute_report(evaluation_id: int) -> str:
+    from analytics import generar_analitica
+    from item_analysis import item_analysis
+
+    # La caché de claves del proceso no se entera de los cambios del servidor
+    invalidate_answer_key(evaluation_id)
+    db = SessionLocal()
+    try:
+        version = report_version(db, evaluation_id)
+        stored = stored_report(db, evaluation_id)
+        if stored is not None and stored.version == version:
+            # Otro worker ya lo calculó para estos datos
+            return version
+        start = time.perf_counter()
+        key = get_answer_key(db, evaluation_id)
+        payload = {
+            "evaluation_id": evaluation_id,
+            "version": version,
+            "analytics": generar_analitica(evaluation_id, db),
+            "item_analysis": item_analysis(db, evaluation_id, key) if key.question_ids else None,
+        }
+        payload["computed_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        payload["compute_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+        # INSERT ... ON CONFLICT: dos workers que guardan a la vez no chocan
+        # con la clave primaria; gana el último
+        insert_fn, _, _ = upsert_dialect(db)
+        stmt = insert_fn(AnalyticsReport).values(evaluation_id=evaluation_id, version=version, payload=body)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[AnalyticsReport.evaluation_id],
+            set_={"version": stmt.excluded.version, "payload": stmt.excluded.payload},
+        ))
+        db.commit()
+        return version
+    finally:
+        db.close()
+
+
+class ReportJob:
+    __slots__ = ("id", "evaluation_id", "status", "version", "error", "created_at", "finished_at")
+
+    def __init__(self, evaluation_id: int):
+        self.id = uuid.uuid4().hex
+        self.evaluation_id = evaluation_id
+        self.status = "queued"
+        self.version = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "evaluation_id": self.evaluation_id,
+            "status": self.status,
+            "version": self.version,
+            "error": self.error,
+        }
+
+
+# === Runner local de reportes ===
+# Pool de procesos para el cálculo y un hilo que programa los recálculos: cada
+# envío marca su evaluación como modificada y, tras REPORT_QUIET_SECONDS sin
+# cambios nuevos, se encola el reporte. Hay a lo sumo un job pendiente por
+# evaluación; pedirlo de nuevo devuelve el mismo. Los jobs viven en memoria del
+# proceso: con varios workers de uvicorn cada uno tiene los suyos, pero todos
+# sirven el reporte guardado en la base.
+class ReportWorker:
+    def __init__(self, workers: int, quiet_seconds: float):
+        self.workers = workers
+        self.quiet_seconds = quiet_seconds
+        self._lock = threading.Lock()
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._active = {}  # evaluation_id -> job pendiente
+        self._dirty = {}  # evaluation_id -> instante del último cambio
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, evaluation_id: int) -> ReportJob:
+        with self._lock:
+            job = self._active.get(evaluation_id)
+            if job is not None:
+                return job
+            job = ReportJob(evaluation_id)
+            self._jobs[job.id] = job
+            while len(self._jobs) > REPORT_JOBS_MAX:
+                self._jobs.popitem(last=False)
+            self._active[evaluation_id] = job
+            self._dirty.pop(evaluation_id, None)
+            if self._executor is None:
+                # spawn: el hijo no hereda el pool de conexiones ni los hilos
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            future = self._executor.submit(compute_report, evaluation_id)
+        future.add_done_callback(partial(self._finished, job))
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def notify_change(self, evaluation_id: int):
+        if self.running:
+            with self._lock:
+                self._dirty[evaluation_id] = time.monotonic()
+
+    def _finished(self, job, future):
+        with self._lock:
+            if self._active.get(job.evaluation_id) is job:
+                del self._active[job.evaluation_id]
+        try:
+            job.version = future.result()
+            job.status = "done"
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # Un hijo murió (p. ej. sin memoria): el próximo job crea otro pool
+                with self._lock:
+                    self._executor = None
+            job.status = "failed"
+            job.error = str(e) or type(e).__name__
+            logger.error("Falló el reporte de la evaluación %s: %s", job.evaluation_id, job.error)
+        job.finished_at = time.time()
+
+    # Con varios workers de uvicorn todos ven el mismo envío marcado; solo
+    # encola el primero que lo encuentra desactualizado en la base
+    def _is_current(self, evaluation_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            stored = stored_report(db, evaluation_id)
+            return stored is not None and stored.version == report_version(db, evaluation_id)
+        finally:
+            db.close()
+
+    # Una evaluación con un job en curso sigue marcada y se recalcula al
+    # terminar, porque el job pudo leer los datos antes del último cambio
+    def _run(self):
+        while not self._stop.wait(min(self.quiet_seconds, 1.0)):
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    (eid, changed) for eid, changed in self._dirty.items()
+                    if now - changed >= self.quiet_seconds and eid not in self._active
+                ]
+            for evaluation_id, changed in due:
+                try:
+                    if self._is_current(evaluation_id):
+                        with self._lock:
+                            # Un cambio posterior a la consulta lo mantiene marcado
+                            if self._dirty.get(evaluation_id) == changed:
+                                del self._dirty[evaluation_id]
+                        continue
+                    self.submit(evaluation_id)
+                except Exception:
+                    logger.exception("No se pudo encolar el reporte de la evaluación %s", evaluation_id)
+
+
+report_worker = ReportWorker(REPORT_WORKERS, REPORT_QUIET_SECONDS)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from database import DATABASE_REPLICA_URL, READ_YOUR_WRITES_SECONDS, is_replica_session, primary_read_session
+
+# "memory" (por proceso, por defecto), "redis" (compartido entre workers) u "off"
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+
+
+# === Backends ===
+# Interfaz: get(key) -> (etag, body) | None, set(key, value, ttl),
+# version(tag) -> int, bump(tag, hold) y recently_bumped(tag). Las claves
+# incluyen la versión de su etiqueta, así que invalidar es incrementar un
+# contador: las entradas viejas dejan de ser alcanzables y salen por TTL/LRU.
+# recently_bumped es True durante `hold` segundos tras invalidar la etiqueta.
+class MemoryBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._held = {}  # tag -> instante hasta el que cuenta como recién invalidada
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, tag):
+        with self._lock:
+            return self._versions.get(tag, 0)
+
+    def bump(self, tag, hold=0):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+            if hold > 0:
+                now = time.monotonic()
+                # Las etiquetas invalidadas que nadie vuelve a leer salen aquí:
+                # solo quedan las de la última ventana de `hold` segundos
+                for expired in [t for t, deadline in self._held.items() if deadline <= now]:
+                    del self._held[expired]
+                self._held[tag] = now + hold
+
+    def recently_bumped(self, tag):
+        with self._lock:
+            deadline = self._held.get(tag)
+            if deadline is None:
+                return False
+            if deadline <= time.monotonic():
+                del self._held[tag]
+                return False
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._held.clear()
+
+
+# Backend compartido: el LRU lo aplica Redis (maxmemory-policy allkeys-lru)
+class RedisBackend:
+    def __init__(self, url: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._redis.get("rc:" + key)
+        if raw is None:
+            return None
+        etag, _, body = raw.partition(b"\n")
+        return etag.decode(), body
+
+    def set(self, key, value, ttl):
+        etag, body = value
+        self._redis.set("rc:" + key, etag.encode() + b"\n" + body, px=int(ttl * 1000))
+
+    def version(self, tag):
+        return int(self._redis.get("rv:" + tag) or 0)
+
+    def bump(self, tag, hold=0):
+        with self._redis.pipeline() as pipe:
+            pipe.incr("rv:" + tag)
+            if hold > 0:
+                pipe.set("rb:" + tag, b"1", px=int(hold * 1000))
+            pipe.execute()
+
+    def recently_bumped(self, tag):
+        return bool(self._redis.exists("rb:" + tag))
+
+    def clear(self):
+        for key in self._redis.scan_iter("r[cvb]:*"):
+            self._redis.delete(key)
+
+
+def _default_backend():
+    if RESPONSE_CACHE_BACKEND == "off":
+        return None
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend(RESPONSE_CACHE_URL)
+    return MemoryBackend(RESPONSE_CACHE_MAX_ENTRIES)
+
+
+_backend = _default_backend()
+
+
+# Permite reemplazar el backend (por ejemplo por un stand-in local)
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    return _backend
+
+
+# === Etiquetas de invalidación ===
+def questions_tag(evaluation_id: int) -> str:
+    return f"questions:{evaluation_id}"
+
+
+def stats_tag(evaluation_id: int) -> str:
+    return f"stats:{evaluation_id}"
+
+
+def evaluations_tag(teacher_name: str) -> str:
+    return f"evaluations:{teacher_name}"
+
+
+# Con réplica, una etiqueta recién invalidada se rellena desde el primario
+# durante READ_YOUR_WRITES_SECONDS (ver cached_json_async)
+_BUMP_HOLD_SECONDS = READ_YOUR_WRITES_SECONDS if DATABASE_REPLICA_URL else 0
+
+
+def invalidate(*tags):
+    if _backend is None:
+        return
+    for tag in tags:
+        _backend.bump(tag, _BUMP_HOLD_SECONDS)
+
+
+def _render(data) -> bytes:
+    # Mismo formato que JSONResponse de FastAPI
+    return json.dumps(
+        jsonable_encoder(data), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _entry(data):
+    body = _render(data)
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"', body
+
+
+def _respond(request: Request, etag: str, body: bytes) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# === Respuesta JSON cacheada con ETag / If-None-Match ===
+# `builder` es una corrutina que solo se ejecuta en un fallo de caché; si
+# lanza HTTPException no se guarda nada. La versión de la etiqueta se lee
+# antes de construir, así una invalidación concurrente nunca deja una
+# respuesta vieja bajo la clave nueva. Con `session`, builder(session) recibe
+# la sesión de lectura. Si esa sesión es de
+# la réplica y la etiqueta se invalidó hace poco (en cualquier worker, con el
+# backend compartido), el fallo se construye en el primario: la réplica puede
+# no tener aún la escritura y dejaría la respuesta vieja bajo la clave nueva
+# hasta el TTL.
+async def cached_json_async(
+    request: Request, tag: str, builder, variant: str = "", ttl: float = None, session=None
+) -> Response:
+    async def build():
+        if session is None:
+            return await builder()
+        if backend is not None and is_replica_session(session) and backend.recently_bumped(tag):
+            async with primary_read_session() as primary:
+                return await builder(primary)
+        return await builder(session)
+
+    backend = _backend
+    if backend is None:
+        return _respond(request, *_entry(await build()))
+
+    key = f"{tag}:v{backend.version(tag)}:{variant}"
+    hit = backend.get(key)
+    if hit is None:
+        hit = _entry(await build())
+        backend.set(key, hit, RESPONSE_CACHE_TTL if ttl is None else ttl)
+    return _respond(request, *hit)
@@ -0,0 +1,282 @@
+import math
+import time
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from answer_keys import AnswerKey
+from item_analysis import build_response_matrix
+from models import Attempt
+
+# Filas de intentos por bloque: cada bloque usa unas cuatro matrices float32 de
+# SIMILARITY_BLOCK × intentos (512 × 20k ≈ 40 MB cada una)
+SIMILARITY_BLOCK = 512
+# Iteraciones del ajuste de probabilidades de error por intento y pregunta
+_FIT_ITERATIONS = 30
+# Margen (en desvíos) del filtro normal previo al cálculo exacto: la cola
+# exacta es más pesada que la normal con sesgo positivo, el margen cubre el
+# resto de la aproximación
+_PREFILTER_MARGIN = 1.5
+
+
+# === Respuestas incorrectas como vectores indicadores ===
+# Cada (pregunta, selección incorrecta) distinta es una columna; la fila de un
+# intento tiene un 1 en las columnas de sus respuestas incorrectas, así el
+# producto escalar de dos filas cuenta sus respuestas incorrectas idénticas (un
+# AND + popcount que BLAS hace en bloque, sin empaquetar bits). Las selecciones
+# que eligió un solo intento no pueden coincidir y no ocupan columna.
+class WrongAnswers:
+    __slots__ = ("vectors", "codes", "wrong", "probability", "share")
+
+    def __init__(self, vectors, codes, wrong, probability, share):
+        self.vectors = vectors  # float32 n × D, indicadores 0/1
+        self.codes = codes  # int32 n × k, columna de cada celda o -1
+        self.wrong = wrong  # bool n × k, respuestas incorrectas
+        # float32 n × k: probabilidad de que el intento responda mal cada
+        # pregunta, según su cantidad de errores y la dificultad de la pregunta
+        self.probability = probability
+        # float32 n × k: en cada respuesta incorrecta, fracción de los demás
+        # que respondieron mal esa pregunta y eligieron lo mismo (0 si no)
+        self.share = share
+
+
+def wrong_answer_vectors(masks: np.ndarray, invalid: np.ndarray, key: AnswerKey) -> WrongAnswers:
+    n, k = masks.shape
+    key_masks = np.asarray(key.masks, dtype=np.int64)
+    # Las celdas inválidas (índices fuera de rango) son incorrectas pero su
+    # selección no se conoce: no se comparan
+    wrong = (masks != 0) & (masks != key_masks) & ~invalid
+    codes = np.full((n, k), -1, dtype=np.int32)
+    share = np.zeros((n, k), dtype=np.float32)
+    offset = 0
+    for j in range(k):
+        rows = np.flatnonzero(wrong[:, j])
+        if len(rows) < 2:
+            continue
+        _, inverse, counts = np.unique(masks[rows, j], return_inverse=True, return_counts=True)
+        share[rows, j] = (counts[inverse] - 1) / (len(rows) - 1)
+        shared = counts >= 2
+        if not shared.any():
+            continue
+        dense = np.cumsum(shared) - 1
+        keep = shared[inverse]
+        codes[rows[keep], j] = offset + dense[inverse[keep]]
+        offset += int(shared.sum())
+
+    vectors = np.zeros((n, offset), dtype=np.float32)
+    r, c = np.nonzero(codes >= 0)
+    vectors[r, codes[r, c]] = 1
+    return WrongAnswers(vectors, codes, wrong, wrong_probability(wrong), share)
+
+
+# Modelo de Rasch de "responder mal": logit P = θ(intento) + β(pregunta),
+# ajustado por máxima verosimilitud conjunta (pasos de Newton alternados) para
+# que las probabilidades sumen, por fila, los errores de cada intento y, por
+# columna, los de cada pregunta. Los totales se acotan a (0.5, total - 0.5)
+# para que un intento sin errores (o con todo mal) tenga logit finito.
+def wrong_probability(wrong: np.ndarray, iterations: int = _FIT_ITERATIONS) -> np.ndarray:
+    n, k = wrong.shape
+    if not n or not k:
+        return np.zeros((n, k), dtype=np.float32)
+    row = np.clip(wrong.sum(axis=1), 0.5, max(k - 0.5, 0.5))
+    col = np.clip(wrong.sum(axis=0), 0.5, max(n - 0.5, 0.5))
+    theta = np.log(row / np.maximum(k - row, 0.5))
+    beta = np.log(col / np.maximum(n - col, 0.5)) - theta.mean()
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(theta[:, None] + beta[None, :])))
+        theta += np.clip((row - p.sum(axis=1)) / np.maximum((p * (1 - p)).sum(axis=1), 1e-9), -2, 2)
+        p = 1 / (1 + np.exp(-(theta[:, None] + beta[None, :])))
+        beta += np.clip((col - p.sum(axis=0)) / np.maximum((p * (1 - p)).sum(axis=0), 1e-9), -2, 2)
+    return (1 / (1 + np.exp(-(theta[:, None] + beta[None, :])))).astype(np.float32)
+
+
+# log P(X >= x) para X suma de Bernoulli independientes con probabilidades
+# p (una fila por par), por programación dinámica sobre la distribución exacta
+def binomial_log_tail(p: np.ndarray, x: np.ndarray) -> np.ndarray:
+    p = np.asarray(p, dtype=np.float64)
+    rows, k = p.shape
+    pmf = np.zeros((rows, k + 1))
+    pmf[:, 0] = 1
+    for q in range(k):
+        pmf[:, 1:] = pmf[:, 1:] * (1 - p[:, q, None]) + pmf[:, :-1] * p[:, q, None]
+        pmf[:, 0] *= 1 - p[:, q]
+    tail = np.where(np.arange(k + 1) >= np.asarray(x)[:, None], pmf, 0).sum(axis=1)
+    with np.errstate(divide="ignore"):
+        return np.log(np.minimum(tail, 1.0))
+
+
+# === Pares sospechosos ===
+# Índice de copia al estilo ω/K: para el par (fuente a, copista b) la cantidad
+# de incorrectas idénticas X es, si b respondió por su cuenta, una suma de
+# Bernoulli sobre las preguntas que a respondió mal, con P = P(b mal) × (fracción
+# de los que respondieron mal que eligieron lo mismo que a). P(b mal) sale de
+# wrong_probability, que condiciona en cuántos errores tuvo b: dos estudiantes
+# flojos no se marcan solo por equivocarse mucho, y coincidir en el distractor
+# que eligió medio curso pesa menos que en uno poco elegido. El p-valor es la
+# cola exacta P(X >= observado) y cada par se prueba en los dos sentidos.
+#
+# El error se controla sobre todas las pruebas (Bonferroni sobre 2 × m, con m
+# los pares comparados): un par se marca con p <= alpha / (2m), así la
+# probabilidad de marcar algún par sin copia es a lo sumo alpha. Se recorre el
+# triángulo superior en bloques de filas (memoria acotada a unos
+# SIMILARITY_BLOCK × n float32): la media y la varianza de X salen de productos
+# de matrices y un filtro normal con margen deja los candidatos a los que se
+# calcula la cola exacta. group_ids (p. ej. el nombre del estudiante
+# codificado) excluye los pares del mismo grupo, que no cuentan como
+# comparados. Devuelve índices, puntaje, esperanza y log p-valor de todos los
+# pares marcados, y m.
+def suspicious_pairs(answers: WrongAnswers, alpha: float, min_identical: int, group_ids=None,
+                     block: int = SIMILARITY_BLOCK):
+    vectors = answers.vectors
+    n = len(vectors)
+    compared = n * (n - 1) // 2
+    if group_ids is not None and n:
+        sizes = np.bincount(group_ids)
+        compared -= int((sizes * (sizes - 1) // 2).sum())
+    empty = np.zeros(0, dtype=np.int64)
+    if compared <= 0:
+        return empty, empty, np.zeros(0), np.zeros(0), np.zeros(0), 0
+
+    probability, share = answers.probability, answers.share
+    probability_sq, share_sq = probability ** 2, share ** 2
+    log_threshold = math.log(alpha) - math.log(2 * compared)
+    z_cut = _normal_quantile(log_threshold) - _PREFILTER_MARGIN
+    found = []
+    for start in range(0, n - 1, block):
+        stop = min(start + block, n)
+        scores = vectors[start:stop] @ vectors[start:].T
+        candidates = []
+        # Fuente en el bloque y copista en el resto, y al revés
+        for source_rows, copier_rows in (
+            ((share[start:stop], share_sq[start:stop]), (probability[start:], probability_sq[start:])),
+            ((probability[start:stop], probability_sq[start:stop]), (share[start:], share_sq[start:])),
+        ):
+            mean = source_rows[0] @ copier_rows[0].T
+            deviation = mean - source_rows[1] @ copier_rows[1].T
+            np.sqrt(np.maximum(deviation, 1e-12), out=deviation)
+            zscores = scores - 0.5 - mean
+            zscores /= deviation
+            candidates.append(np.nonzero((zscores >= z_cut) & (scores >= min_identical)))
+        r, c = (np.concatenate(x) for x in zip(*candidates))
+        upper = c > r
+        r, c = r[upper], c[upper]
+        if not len(r):
+            continue
+        i, j = r + start, c + start
+        if group_ids is not None:
+            other = group_ids[i] != group_ids[j]
+            i, j = i[other], j[other]
+        pair = np.unique(i * n + j)
+        i, j = pair // n, pair % n
+        if not len(i):
+            continue
+        score = np.einsum("ij,ij->i", vectors[i], vectors[j]).round().astype(np.int64)
+        # Cola exacta en los dos sentidos; queda el más extremo
+        forward = share[i] * probability[j]
+        backward = share[j] * probability[i]
+        log_forward, log_backward = binomial_log_tail(forward, score), binomial_log_tail(backward, score)
+        log_p = np.minimum(log_forward, log_backward)
+        mean = np.where(log_forward <= log_backward, forward.sum(axis=1), backward.sum(axis=1))
+        ok = log_p <= log_threshold
+        if ok.any():
+            found.append((i[ok], j[ok], score[ok], mean[ok], log_p[ok]))
+
+    if not found:
+        return empty, empty, np.zeros(0), np.zeros(0), np.zeros(0), compared
+    i, j, s, mean, log_p = (np.concatenate(x) for x in zip(*found))
+    return i, j, s, mean, log_p, compared
+
+
+# Cuantil normal superior para una probabilidad dada en log (bisección sobre
+# erfc, sin scipy)
+def _normal_quantile(log_p: float) -> float:
+    low, high = 0.0, 40.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        tail = math.erfc(mid / math.sqrt(2)) / 2
+        if tail > 0 and math.log(tail) > log_p:
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+# Componentes conexos de los pares marcados: intentos que se parecen entre sí
+# en cadena (p. ej. un grupo que compartió respuestas)
+def _groups(pairs):
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+    components = {}
+    for x in parent:
+        components.setdefault(find(x), []).append(x)
+    return sorted((sorted(c) for c in components.values() if len(c) > 2), key=lambda c: (-len(c), c[0]))
+
+
+def _round(value, digits=4):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+# p-valores con 3 cifras significativas (pueden ser del orden de 1e-30)
+def _significant(log_p):
+    return float(f"{math.exp(log_p):.3g}") if np.isfinite(log_p) else 0.0
+
+
+# === Análisis de similitud de una evaluación ===
+def similarity_analysis(db: Session, evaluation_id: int, key: AnswerKey, alpha: float = 0.01,
+                        min_identical: int = 3, limit: int = 100, same_student: bool = False) -> dict:
+    start = time.perf_counter()
+    attempt_ids, masks, invalid = build_response_matrix(db, evaluation_id, key)
+    names = dict(db.connection().execute(
+        select(Attempt.id, Attempt.student_name).where(Attempt.evaluation_id == evaluation_id)
+    ).all())
+    group_ids = None
+    if not same_student and len(attempt_ids):
+        _, group_ids = np.unique(np.array([names.get(int(a), "") for a in attempt_ids], dtype=object),
+                                 return_inverse=True)
+
+    answers = wrong_answer_vectors(masks, invalid, key)
+    i, j, scores, lam, log_p, compared = suspicious_pairs(answers, alpha, min_identical, group_ids)
+    flagged = len(i)
+    # Los grupos salen de todos los pares marcados; la lista, de los más fuertes
+    groups = _groups(zip(attempt_ids[i].tolist(), attempt_ids[j].tolist()))
+    order = np.lexsort((j, i, log_p))[:limit]
+    i, j, scores, lam, log_p = i[order], j[order], scores[order], lam[order], log_p[order]
+
+    both_wrong = np.count_nonzero(answers.wrong[i] & answers.wrong[j], axis=1)
+    pairs = []
+    for a, b, same, together, expected, lp in zip(
+        i.tolist(), j.tolist(), scores.tolist(), both_wrong.tolist(), lam.tolist(), log_p.tolist()
+    ):
+        attempt_a, attempt_b = int(attempt_ids[a]), int(attempt_ids[b])
+        pairs.append({
+            "attempt_a": attempt_a,
+            "student_a": names.get(attempt_a),
+            "attempt_b": attempt_b,
+            "student_b": names.get(attempt_b),
+            "identical_wrong": same,
+            "both_wrong": together,
+            "expected_identical": _round(expected, 2),
+            "p_value": _significant(lp),
+            "p_adjusted": min(1.0, _significant(lp + math.log(2 * compared))),
+        })
+
+    return {
+        "evaluation_id": evaluation_id,
+        "total_attempts": len(attempt_ids),
+        "total_questions": len(key),
+        "pairs_compared": compared,
+        "criteria": {"alpha": alpha, "min_identical_wrong": min_identical, "same_student": same_student},
+        "flagged_pairs": flagged,
+        "pairs": pairs,
+        "groups": groups,
+        "compute_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -0,0 +1,304 @@
+import math
+
+from sqlalchemy import and_, case, distinct, func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from answer_keys import get_answer_key
+from answer_storage import compact_storage
+from models import Attempt, AttemptAnswer, AttemptAnswerMask, EvaluationSummary, QuestionSummary, ScoreHistogram
+
+# Percentiles que pueden pedirse en una sola consulta de estadísticas
+MAX_PERCENTILES = 20
+
+
+# === Estadísticas globales: una sola consulta agregada ===
+def score_summary(db: Session, evaluation_id: int):
+    total, avg_score, max_score, min_score = (
+        db.query(
+            func.count(Attempt.id),
+            func.avg(Attempt.score),
+            func.max(Attempt.score),
+            func.min(Attempt.score),
+        )
+        .filter(Attempt.evaluation_id == evaluation_id)
+        .one()
+    )
+    return {
+        "total_attempts": int(total or 0),
+        "avg_score": round(float(avg_score or 0), 2),
+        "max_score": int(max_score or 0),
+        "min_score": int(min_score or 0),
+    }
+
+
+# Intentos con id en (after_id, up_to]: la cola aún no plegada en los
+# resúmenes, o el tramo que se pliega (ver summaries.fold)
+def _attempt_range(after_id: int = 0, up_to=None):
+    conditions = []
+    if after_id:
+        conditions.append(Attempt.id > after_id)
+    if up_to is not None:
+        conditions.append(Attempt.id <= up_to)
+    return conditions
+
+
+# === Precisión por pregunta: una sola consulta agrupada ===
+# Un intento acierta una pregunta cuando las opciones que marcó son exactamente
+# las correctas: todas sus selecciones están en la clave (hits == n_sel) y
+# además cubren la clave completa (hits == len(clave)).
+# `keys` es una lista ordenada de (question_id, set de índices correctos).
+def question_accuracy(db: Session, evaluation_id: int, keys, after_id: int = 0, up_to=None):
+    return _accuracy_counts(db, keys, [Attempt.evaluation_id == evaluation_id, *_attempt_range(after_id, up_to)])
+
+
+# Cola aún no plegada de varias evaluaciones en la misma consulta: intentos
+# con id mayor que la marca de agua de su evaluación (todos si no tiene
+# resumen utilizable). `keys` reúne las preguntas de todas ellas.
+def tail_question_accuracy(db: Session, evaluation_ids, keys):
+    watermark = (
+        select(EvaluationSummary.folded_attempt_id)
+        .where(EvaluationSummary.evaluation_id == Attempt.evaluation_id)
+        .correlate(Attempt)
+        .scalar_subquery()
+    )
+    return _accuracy_counts(
+        db, keys, [Attempt.evaluation_id.in_(evaluation_ids), Attempt.id > func.coalesce(watermark, 0)]
+    )
+
+
+# Respondidas y correctas por pregunta entre los intentos que cumplen `conditions`
+def _accuracy_counts(db: Session, keys, conditions):
+    if not keys:
+        return {}
+    if compact_storage():
+        return _question_accuracy_compact(db, conditions)
+
+    hit_branches = [
+        (
+            and_(AttemptAnswer.question_id == qid, AttemptAnswer.selected_index.in_(sorted(correct))),
+            AttemptAnswer.selected_index,
+        )
+        for qid, correct in keys
+        if correct
+    ]
+    hit_expr = case(*hit_branches, else_=None) if hit_branches else None
+
+    per_attempt = (
+        select(
+            AttemptAnswer.question_id.label("question_id"),
+            func.count(distinct(AttemptAnswer.selected_index)).label("n_sel"),
+            (func.count(distinct(hit_expr)) if hit_expr is not None else literal(0)).label("hits"),
+        )
+        .join(Attempt, Attempt.id == AttemptAnswer.attempt_id)
+        .where(*conditions)
+        .group_by(AttemptAnswer.question_id, AttemptAnswer.attempt_id)
+        .subquery()
+    )
+
+    expected = case({qid: len(correct) for qid, correct in keys}, value=per_attempt.c.question_id, else_=-1)
+    stmt = select(
+        per_attempt.c.question_id,
+        func.count().label("respondieron"),
+        func.sum(
+            case(
+                (and_(per_attempt.c.hits == per_attempt.c.n_sel, per_attempt.c.hits == expected), 1),
+                else_=0,
+            )
+        ).label("correctas"),
+    ).group_by(per_attempt.c.question_id)
+
+    return {row.question_id: (int(row.respondieron), int(row.correctas or 0)) for row in db.execute(stmt)}
+
+
+# Formato compacto: la corrección ya está guardada, basta contar filas
+def _question_accuracy_compact(db: Session, conditions):
+    stmt = (
+        select(
+            AttemptAnswerMask.question_id,
+            func.count().label("respondieron"),
+            func.sum(case((AttemptAnswerMask.is_correct, 1), else_=0)).label("correctas"),
+        )
+        .join(Attempt, Attempt.id == AttemptAnswerMask.attempt_id)
+        .where(*conditions)
+        .group_by(AttemptAnswerMask.question_id)
+    )
+    return {row.question_id: (int(row.respondieron), int(row.correctas or 0)) for row in db.execute(stmt)}
+
+
+# === Distribución de puntajes desde el histograma: O(preguntas) ===
+# Los puntajes son enteros acotados, así que el histograma (puntaje -> intentos)
+# representa la distribución exacta. Los percentiles interpolan linealmente
+# entre rangos vecinos, igual que numpy.percentile sobre los puntajes crudos.
+def score_histogram(db: Session, evaluation_id: int, after_id: int = 0, up_to=None):
+    return sorted(
+        db.query(Attempt.score, func.count())
+        .filter(Attempt.evaluation_id == evaluation_id, *_attempt_range(after_id, up_to))
+        .group_by(Attempt.score)
+    )
+
+
+# Histograma plegado y el de la cola (intentos con id > after_id) en una sola
+# consulta
+def _folded_and_tail_histograms(db: Session, evaluation_id: int, after_id: int):
+    folded = select(ScoreHistogram.score, ScoreHistogram.attempt_count, literal(False)).where(
+        ScoreHistogram.evaluation_id == evaluation_id
+    )
+    tail = (
+        select(Attempt.score, func.count(), literal(True))
+        .where(Attempt.evaluation_id == evaluation_id, *_attempt_range(after_id))
+        .group_by(Attempt.score)
+    )
+    histogram, fresh = {}, {}
+    for score, n, is_tail in db.execute(union_all(folded, tail)):
+        histogram[score] = histogram.get(score, 0) + n
+        if is_tail:
+            fresh[score] = n
+    return sorted(histogram.items()), sorted(fresh.items())
+
+
+def percentile(histogram, total: int, p: float) -> float:
+    position = (total - 1) * p / 100
+    lower = math.floor(position)
+    # Puntajes en los rangos `lower` y `lower + 1` (0-indexados)
+    values = []
+    seen = 0
+    for score, n in histogram:
+        seen += n
+        while len(values) < 2 and seen > lower + len(values):
+            values.append(score)
+        if len(values) == 2:
+            break
+    if len(values) == 1:
+        values.append(values[0])
+    return values[0] + (values[1] - values[0]) * (position - lower)
+
+
+def _distribution_payload(histogram, n_questions: int, percentiles, total: int, score_sum: int, score_sq_sum: int):
+    top = max([n_questions] + [score for score, _ in histogram])
+    counts = dict(histogram)
+    payload = {
+        "std_score": None,
+        "median_score": None,
+        "quartiles": None,
+        "percentiles": {f"p{p:g}": None for p in percentiles},
+        "score_histogram": [{"score": score, "count": counts.get(score, 0)} for score in range(top + 1)],
+    }
+    if not total:
+        return payload
+
+    # Momentos enteros exactos: n·Σx² − (Σx)² no pierde precisión al combinarse
+    payload["std_score"] = round(math.sqrt(max(total * score_sq_sum - score_sum * score_sum, 0)) / total, 2)
+    q1, q2, q3 = (round(percentile(histogram, total, p), 2) for p in (25, 50, 75))
+    payload["median_score"] = q2
+    payload["quartiles"] = {"q1": q1, "q2": q2, "q3": q3}
+    payload["percentiles"] = {f"p{p:g}": round(percentile(histogram, total, p), 2) for p in percentiles}
+    return payload
+
+
+# Distribución completa (std, mediana, cuartiles, percentiles, histograma) a
+# partir de un histograma (puntaje, intentos) ya calculado
+def histogram_distribution(histogram, n_questions: int, percentiles=()):
+    return _distribution_payload(
+        histogram,
+        n_questions,
+        percentiles,
+        sum(n for _, n in histogram),
+        sum(score * n for score, n in histogram),
+        sum(score * score * n for score, n in histogram),
+    )
+
+
+def _per_question_payload(key, counts):
+    per_question_accuracy = []
+    for qid, text in zip(key.question_ids, key.texts):
+        respondieron, correctas = counts.get(qid, (0, 0))
+        accuracy_pct = round((correctas / respondieron) * 100, 2) if respondieron else 0.0
+        per_question_accuracy.append({"question_id": qid, "text": text, "accuracy_pct": accuracy_pct})
+    return per_question_accuracy
+
+
+# === Lectura desde los resúmenes: O(preguntas + cola sin plegar) ===
+# Los resúmenes cubren los intentos hasta folded_attempt_id (los pliega
+# summaries.SummaryFolder en segundo plano); los posteriores se agregan aquí
+# sobre los datos crudos, así el resultado no depende de cuándo se plegó.
+# Devuelve None si la evaluación no tiene un resumen utilizable (sin plegar
+# nunca, o anterior a la marca de agua), en cuyo caso se usa la agregación
+# sobre los datos crudos.
+def usable_summary(db: Session, evaluation_id: int):
+    summary = db.get(EvaluationSummary, evaluation_id)
+    if summary is None or summary.folded_attempt_id is None:
+        return None
+    return summary
+
+
+# Contadores por pregunta plegados más la cola; with_tail=False evita la
+# consulta de la cola cuando se sabe que está vacía
+def summary_question_counts(db: Session, evaluation_id: int, key, summary, with_tail: bool = True):
+    counts = {
+        row.question_id: (row.answered_count, row.correct_count)
+        for row in db.query(
+            QuestionSummary.question_id, QuestionSummary.answered_count, QuestionSummary.correct_count
+        ).filter(QuestionSummary.evaluation_id == evaluation_id)
+    }
+    if not with_tail:
+        return counts
+    tail = question_accuracy(db, evaluation_id, list(zip(key.question_ids, key.correct)), summary.folded_attempt_id)
+    for qid, (answered, correct) in tail.items():
+        stored = counts.get(qid, (0, 0))
+        counts[qid] = (stored[0] + answered, stored[1] + correct)
+    return counts
+
+
+def summary_stats(db: Session, evaluation_id: int, key, percentiles=()):
+    summary = usable_summary(db, evaluation_id)
+    if summary is None:
+        return None
+
+    histogram, tail = _folded_and_tail_histograms(db, evaluation_id, summary.folded_attempt_id)
+    total = summary.attempt_count + sum(n for _, n in tail)
+    if not total:
+        return None
+    scores = [score for score, n in histogram if n]
+
+    return {
+        "total_attempts": total,
+        "avg_score": round((summary.score_sum + sum(score * n for score, n in tail)) / total, 2),
+        "max_score": int(max(scores)),
+        "min_score": int(min(scores)),
+        **_distribution_payload(
+            histogram,
+            len(key),
+            percentiles,
+            total,
+            summary.score_sum + sum(score * n for score, n in tail),
+            summary.score_sq_sum + sum(score * score * n for score, n in tail),
+        ),
+        "per_question_accuracy": _per_question_payload(
+            key, summary_question_counts(db, evaluation_id, key, summary, with_tail=bool(tail))
+        ),
+    }
+
+
+def aggregate_stats(db: Session, evaluation_id: int, key, percentiles=()):
+    payload = score_summary(db, evaluation_id)
+    histogram = score_histogram(db, evaluation_id) if payload["total_attempts"] else []
+    payload.update(_distribution_payload(
+        histogram,
+        len(key),
+        percentiles,
+        payload["total_attempts"],
+        sum(score * n for score, n in histogram),
+        sum(score * score * n for score, n in histogram),
+    ))
+    if payload["total_attempts"] == 0:
+        payload["per_question_accuracy"] = []
+        return payload
+
+    counts = question_accuracy(db, evaluation_id, list(zip(key.question_ids, key.correct)))
+    payload["per_question_accuracy"] = _per_question_payload(key, counts)
+    return payload
+
+
+def evaluation_stats_payload(db: Session, evaluation_id: int, percentiles=()):
+    key = get_answer_key(db, evaluation_id)
+    return summary_stats(db, evaluation_id, key, percentiles) or aggregate_stats(db, evaluation_id, key, percentiles)
@@ -0,0 +1,128 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from database import SessionLocal
+from response_cache import invalidate, stats_tag
+from submissions import write_attempts
+
+logger = logging.getLogger(__name__)
+
+# "sync": cada envío se escribe y confirma en su propia petición (comportamiento
+# original). "queued": el envío se califica en memoria, se responde de inmediato
+# y un escritor en segundo plano confirma los intentos por lotes.
+SUBMIT_MODE = os.getenv("SUBMIT_MODE", "sync").lower()
+SUBMIT_BATCH_SIZE = int(os.getenv("SUBMIT_BATCH_SIZE", "200"))
+SUBMIT_FLUSH_MS = int(os.getenv("SUBMIT_FLUSH_MS", "50"))
+SUBMIT_QUEUE_MAX = int(os.getenv("SUBMIT_QUEUE_MAX", "5000"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+# Escritor con "group commit": vacía la cola cada SUBMIT_FLUSH_MS o cada
+# SUBMIT_BATCH_SIZE intentos, lo que ocurra primero, en una sola transacción.
+class SubmissionWriter:
+    def __init__(self, session_factory, batch_size: int, flush_ms: int, maxsize: int):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+        self._thread.start()
+
+    # Contrapresión: si la cola está llena no se bloquea la petición, se rechaza
+    def enqueue(self, graded):
+        try:
+            self._queue.put_nowait(graded)
+        except queue.Full:
+            raise QueueFull()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # Hook de apagado: deja de aceptar lotes nuevos y vacía lo pendiente
+    def stop(self, timeout: float = 30.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._drain()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        db = self.session_factory()
+        try:
+            write_attempts(db, batch)
+            db.commit()
+            invalidate(*{stats_tag(g.evaluation_id) for g in batch})
+        except Exception:
+            db.rollback()
+            logger.exception("Falló el lote de %d intentos; se reintenta uno por uno", len(batch))
+            self._flush_one_by_one(db, batch)
+        finally:
+            db.close()
+
+    # Aísla el intento problemático para no perder el resto del lote
+    def _flush_one_by_one(self, db, batch):
+        for graded in batch:
+            try:
+                write_attempts(db, [graded])
+                db.commit()
+                invalidate(stats_tag(graded.evaluation_id))
+            except Exception:
+                db.rollback()
+                logger.exception(
+                    "Intento descartado: evaluación %s, estudiante %s", graded.evaluation_id, graded.student_name
+                )
+
+
+submission_writer = SubmissionWriter(SessionLocal, SUBMIT_BATCH_SIZE, SUBMIT_FLUSH_MS, SUBMIT_QUEUE_MAX)
+
+
+def queued_mode() -> bool:
+    return SUBMIT_MODE == "queued"
@@ -0,0 +1,42 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from answer_keys import AnswerKey
+from answer_storage import write_answers
+from models import Attempt
+
+
+# Intento ya calificado en memoria, listo para persistir
+class GradedAttempt:
+    __slots__ = ("evaluation_id", "student_name", "score", "question_ids", "answers", "correct")
+
+    def __init__(self, evaluation_id, student_name, question_ids, answers, correct):
+        self.evaluation_id = evaluation_id
+        self.student_name = student_name
+        self.score = sum(correct)
+        self.question_ids = question_ids
+        self.answers = answers
+        self.correct = correct  # acierto por pregunta, en el orden de question_ids
+
+
+def grade_submission(key: AnswerKey, student_name: str, answers) -> GradedAttempt:
+    return GradedAttempt(key.evaluation_id, student_name, key.question_ids, answers, key.grade_detail(answers))
+
+
+# === Escritura masiva ===
+# Un INSERT ... RETURNING para los intentos y un INSERT multi-fila (executemany
+# con "insertmanyvalues" de SQLAlchemy 2.0) para todas sus respuestas en el
+# formato de ANSWER_STORAGE. Los resúmenes de estadísticas no se tocan: los
+# pliega summaries.SummaryFolder en segundo plano. No hace commit: el llamador
+# decide el límite de la transacción.
+def write_attempts(db: Session, graded) -> list:
+    if not graded:
+        return []
+
+    attempt_ids = db.scalars(
+        insert(Attempt).returning(Attempt.id, sort_by_parameter_order=True),
+        [{"evaluation_id": g.evaluation_id, "student_name": g.student_name, "score": g.score} for g in graded],
+    ).all()
+
+    write_answers(db, attempt_ids, graded)
+    return attempt_ids
@@ -0,0 +1,288 @@
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from answer_keys import load_answer_key
+from database import SessionLocal
+from models import Attempt, Evaluation, EvaluationSummary, QuestionSummary, ScoreHistogram
+from stats import question_accuracy, score_histogram
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre pasadas del plegado en segundo plano; 0 lo desactiva en este
+# proceso (p. ej. si los resúmenes los pliega otro proceso)
+SUMMARY_FOLD_SECONDS = float(os.getenv("SUMMARY_FOLD_SECONDS", "2"))
+# Segundos entre conciliaciones de los resúmenes con los intentos que cubren
+SUMMARY_RECONCILE_SECONDS = float(os.getenv("SUMMARY_RECONCILE_SECONDS", "60"))
+
+
+# INSERT ... ON CONFLICT DO UPDATE y funciones escalares min/max según motor
+def upsert_dialect(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return pg_insert, func.least, func.greatest
+    if dialect == "sqlite":
+        return sqlite_insert, func.min, func.max
+    raise NotImplementedError(f"Resúmenes incrementales no soportados para {dialect}")
+
+
+# === Plegado diferido ===
+# El envío no toca los resúmenes: los intentos ya guardados son el registro de
+# cambios pendientes y SummaryFolder los pliega en segundo plano por tramos de
+# ids, así las escrituras no compiten por la fila de evaluation_summaries. Las
+# lecturas (stats.summary_stats) suman la cola aún no plegada.
+
+
+# Suma a los resúmenes de la evaluación los intentos con id en
+# (folded_attempt_id, up_to] y avanza la marca de agua, en una transacción.
+# El UPDATE condicional sobre la marca de agua serializa a los plegadores: si
+# otro proceso plegó antes, no actualiza ninguna fila y el tramo se descarta
+# sin contar dos veces. Sin resumen utilizable (fila ausente o sin marca de
+# agua) la evaluación se reconstruye desde cero. Devuelve True si plegó.
+def fold(db: Session, evaluation_id: int, up_to: int) -> bool:
+    insert_fn, least, greatest = upsert_dialect(db)
+    row = db.execute(
+        select(EvaluationSummary.folded_attempt_id).where(EvaluationSummary.evaluation_id == evaluation_id)
+    ).first()
+    from_scratch = row is None or row.folded_attempt_id is None
+    after_id = 0 if from_scratch else row.folded_attempt_id
+    if not from_scratch and after_id >= up_to:
+        return False
+
+    histogram = score_histogram(db, evaluation_id, after_id, up_to)
+    count = sum(n for _, n in histogram)
+    totals = {
+        "attempt_count": count,
+        "score_sum": sum(score * n for score, n in histogram),
+        "score_sq_sum": sum(score * score * n for score, n in histogram),
+        "min_score": histogram[0][0] if histogram else None,
+        "max_score": histogram[-1][0] if histogram else None,
+    }
+    counts = {}
+    if count:
+        key = load_answer_key(db, evaluation_id)
+        counts = question_accuracy(db, evaluation_id, list(zip(key.question_ids, key.correct)), after_id, up_to)
+
+    if from_scratch:
+        # Borra la fila sin marca de agua y la inserta de nuevo: un segundo
+        # proceso que reconstruya a la vez choca con la clave y no inserta
+        db.execute(delete(EvaluationSummary).where(
+            EvaluationSummary.evaluation_id == evaluation_id, EvaluationSummary.folded_attempt_id.is_(None)
+        ).execution_options(synchronize_session=False))
+        stmt = insert_fn(EvaluationSummary).values(
+            evaluation_id=evaluation_id, folded_attempt_id=up_to, **totals
+        ).on_conflict_do_nothing(index_elements=[EvaluationSummary.evaluation_id])
+        if not db.execute(stmt).rowcount:
+            db.rollback()
+            return False
+        for table in (ScoreHistogram, QuestionSummary):
+            db.execute(
+                delete(table).where(table.evaluation_id == evaluation_id).execution_options(synchronize_session=False)
+            )
+    else:
+        values = {
+            "attempt_count": EvaluationSummary.attempt_count + count,
+            "score_sum": EvaluationSummary.score_sum + totals["score_sum"],
+            "score_sq_sum": EvaluationSummary.score_sq_sum + totals["score_sq_sum"],
+            "folded_attempt_id": up_to,
+        }
+        if count:
+            values["min_score"] = least(func.coalesce(EvaluationSummary.min_score, totals["min_score"]), totals["min_score"])
+            values["max_score"] = greatest(func.coalesce(EvaluationSummary.max_score, totals["max_score"]), totals["max_score"])
+        stmt = update(EvaluationSummary).where(
+            EvaluationSummary.evaluation_id == evaluation_id, EvaluationSummary.folded_attempt_id == after_id
+        ).values(**values).execution_options(synchronize_session=False)
+        if not db.execute(stmt).rowcount:
+            db.rollback()
+            return False
+
+    _add_counts(db, insert_fn, evaluation_id, histogram, counts)
+    db.commit()
+    return True
+
+
+# Contadores del histograma y por pregunta: se suman a los existentes, en
+# orden de clave para que los bloqueos se tomen siempre en el mismo orden
+def _add_counts(db: Session, insert_fn, evaluation_id: int, histogram, counts):
+    if histogram:
+        stmt = insert_fn(ScoreHistogram)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ScoreHistogram.evaluation_id, ScoreHistogram.score],
+            set_={"attempt_count": ScoreHistogram.attempt_count + stmt.excluded.attempt_count},
+        )
+        db.execute(stmt, [
+            {"evaluation_id": evaluation_id, "score": score, "attempt_count": n}
+            for score, n in histogram
+        ])
+
+    if counts:
+        stmt = insert_fn(QuestionSummary)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[QuestionSummary.question_id],
+            set_={
+                "answered_count": QuestionSummary.answered_count + stmt.excluded.answered_count,
+                "correct_count": QuestionSummary.correct_count + stmt.excluded.correct_count,
+            },
+        )
+        db.execute(stmt, [
+            {"question_id": qid, "evaluation_id": evaluation_id, "answered_count": answered, "correct_count": correct}
+            for qid, (answered, correct) in sorted(counts.items())
+        ])
+
+
+# Evaluaciones con intentos en (after_id, up_to] que su resumen aún no cubre
+def pending_evaluations(db: Session, after_id: int, up_to: int):
+    return db.scalars(
+        select(Attempt.evaluation_id)
+        .distinct()
+        .outerjoin(EvaluationSummary, EvaluationSummary.evaluation_id == Attempt.evaluation_id)
+        .where(
+            Attempt.id > after_id,
+            Attempt.id <= up_to,
+            or_(EvaluationSummary.folded_attempt_id.is_(None), Attempt.id > EvaluationSummary.folded_attempt_id),
+        )
+        .order_by(Attempt.evaluation_id)
+    ).all()
+
+
+# Pliega las evaluaciones pendientes del tramo; devuelve (plegadas, fallidas)
+def fold_pending(db: Session, after_id: int, up_to: int):
+    folded = failed = 0
+    for evaluation_id in pending_evaluations(db, after_id, up_to):
+        try:
+            folded += fold(db, evaluation_id, up_to)
+        except Exception:
+            db.rollback()
+            failed += 1
+            logger.exception("No se pudo plegar el resumen de la evaluación %s", evaluation_id)
+    return folded, failed
+
+
+# === Conciliación ===
+# Con Postgres los ids se asignan antes del commit: un envío que se confirma
+# tarde puede quedar con id por debajo de una marca de agua ya avanzada, y ni
+# fold ni la cola de stats.summary_stats lo verían. La conciliación compara,
+# por evaluación, los intentos con id <= folded_attempt_id con attempt_count
+# y reconstruye las que no coinciden.
+def drifted_evaluations(db: Session):
+    covered = (
+        select(Attempt.evaluation_id, func.count().label("attempts"))
+        .join(EvaluationSummary, EvaluationSummary.evaluation_id == Attempt.evaluation_id)
+        .where(Attempt.id <= EvaluationSummary.folded_attempt_id)
+        .group_by(Attempt.evaluation_id)
+        .subquery()
+    )
+    return db.scalars(
+        select(EvaluationSummary.evaluation_id)
+        .outerjoin(covered, covered.c.evaluation_id == EvaluationSummary.evaluation_id)
+        .where(
+            EvaluationSummary.folded_attempt_id.is_not(None),
+            func.coalesce(covered.c.attempts, 0) != EvaluationSummary.attempt_count,
+        )
+        .order_by(EvaluationSummary.evaluation_id)
+    ).all()
+
+
+def reconcile(db: Session) -> int:
+    drifted = drifted_evaluations(db)
+    if drifted:
+        logger.warning("Resúmenes desalineados con sus intentos, se reconstruyen: %s", drifted)
+        rebuild(db, drifted)
+    return len(drifted)
+
+
+# Hilo que pliega cada SUMMARY_FOLD_SECONDS. Cada pasada pliega hasta el mayor
+# id visto en la pasada anterior: con Postgres los ids se asignan antes del
+# commit, así un envío con id menor que seguía abierto tuvo un intervalo
+# entero para confirmarse. La primera pasada revisa todos los intentos (p. ej.
+# tras un reinicio); las siguientes, solo los ids nuevos. Con varios workers
+# cada uno tiene su plegador y el UPDATE condicional evita contar dos veces.
+# Un envío confirmado más de un intervalo tarde lo recupera la conciliación,
+# que corre cada reconcile_interval segundos (0 la desactiva).
+class SummaryFolder:
+    def __init__(self, session_factory, interval: float, reconcile_interval: float = 0):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self._next_reconcile = time.monotonic() + reconcile_interval
+        self._scanned = 0  # ids ya revisados
+        self._seen = None  # mayor id visto en la pasada anterior
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="summary-folder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.step()
+            except Exception:
+                logger.exception("Falló el plegado de resúmenes")
+            if self.reconcile_interval > 0 and time.monotonic() >= self._next_reconcile:
+                self._next_reconcile = time.monotonic() + self.reconcile_interval
+                db = self.session_factory()
+                try:
+                    reconcile(db)
+                except Exception:
+                    db.rollback()
+                    logger.exception("Falló la conciliación de resúmenes")
+                finally:
+                    db.close()
+
+    def step(self) -> int:
+        db = self.session_factory()
+        try:
+            up_to, self._seen = self._seen, db.scalar(select(func.max(Attempt.id))) or 0
+            if up_to is None or up_to <= self._scanned:
+                return 0
+            folded, failed = fold_pending(db, self._scanned, up_to)
+            # Si alguna falló se vuelve a revisar el tramo en la próxima pasada
+            if not failed:
+                self._scanned = up_to
+            return folded
+        finally:
+            db.close()
+
+
+summary_folder = SummaryFolder(SessionLocal, SUMMARY_FOLD_SECONDS, SUMMARY_RECONCILE_SECONDS)
+
+
+# === Reconstrucción desde los datos crudos (backfill) ===
+# Recalcula los resúmenes de las evaluaciones indicadas (o de todas) a partir
+# de attempts/attempt_answers, incluido el histograma de puntajes, hasta el
+# último intento de cada una. Confirma una transacción por evaluación.
+def rebuild(db: Session, evaluation_ids=None) -> int:
+    if evaluation_ids is None:
+        evaluation_ids = [eid for (eid,) in db.query(Evaluation.id).order_by(Evaluation.id)]
+
+    for eid in evaluation_ids:
+        db.execute(
+            update(EvaluationSummary)
+            .where(EvaluationSummary.evaluation_id == eid)
+            .values(folded_attempt_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        fold(db, eid, db.scalar(select(func.max(Attempt.id)).where(Attempt.evaluation_id == eid)) or 0)
+
+    return len(evaluation_ids)
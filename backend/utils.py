@@ -1,8 +1,26 @@
 from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Costo de bcrypt. Los hashes con otro costo se regeneran en el siguiente
+# login exitoso (CryptContext.needs_update vía verify_and_update).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hilos dedicados a bcrypt (libera el GIL) y trabajos en espera admitidos
+# antes de rechazar con 503
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "64"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 SECRET_KEY = "supersecretkey"
 ALGORITHM = "HS256"
@@ -13,6 +31,40 @@ def verify_password(plain_password, hashed_password):
 def hash_password(password):
     return pwd_context.hash(password)
 
+
+# === Pool acotado para hashing ===
+# bcrypt corre fuera del threadpool de las rutas, así un pico de logins no
+# bloquea el resto de endpoints. Si hay más de HASH_WORKERS + HASH_QUEUE_MAX
+# trabajos en curso, se rechaza de inmediato en lugar de encolar sin límite.
+class HashingOverloaded(Exception):
+    pass
+
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_MAX)
+
+
+async def _run_hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HashingOverloaded()
+    try:
+        future = _hash_executor.submit(fn, *args)
+    except BaseException:
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password):
+    return await _run_hashing(pwd_context.hash, password)
+
+
+# Devuelve (válida, hash_nuevo); hash_nuevo no es None si el hash guardado
+# usa un costo distinto de BCRYPT_ROUNDS y debe reemplazarse
+async def verify_and_update_password(plain_password, hashed_password):
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1)):
     to_encode = data.copy()
     expire = datetime.utcnow() + expires_delta